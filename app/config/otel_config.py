@@ -1,28 +1,45 @@
 import os
-from opentelemetry import trace, metrics
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.elasticsearch import ElasticsearchInstrumentor
+import asyncio
+import structlog
+from opentelemetry import trace
+
+logger = structlog.get_logger()
+
+# The SDK, exporters and instrumentors pull in gRPC and protobuf. They are imported in a
+# thread once the app is serving, so they never delay startup or the first readiness probe.
+
+
+def tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "true").lower() == "true"
+
 
 def setup_telemetry():
-    """Initialize OpenTelemetry"""
-    
+    """Tracer for request spans; a no-op proxy until start_telemetry() installs the SDK"""
+    return trace.get_tracer(__name__)
+
+
+def _load_telemetry():
+    """Import the SDK and exporters, install the providers and return the FastAPI instrumentor"""
+    from opentelemetry import metrics
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.instrumentation.elasticsearch import ElasticsearchInstrumentor
+
     trace.set_tracer_provider(TracerProvider())
-    tracer = trace.get_tracer(__name__)
-    
+
     otlp_exporter = OTLPSpanExporter(
         endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:14268/api/traces"),
         insecure=True
     )
-    
+
     span_processor = BatchSpanProcessor(otlp_exporter)
     trace.get_tracer_provider().add_span_processor(span_processor)
-    
+
     metric_reader = PeriodicExportingMetricReader(
         OTLPMetricExporter(
             endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:14268/api/traces"),
@@ -30,12 +47,20 @@ def setup_telemetry():
         )
     )
     metrics.set_meter_provider(MeterProvider(metric_readers=[metric_reader]))
-    
-    return tracer
 
-def instrument_app(app):
-    """Instrument FastAPI app"""
-    FastAPIInstrumentor.instrument_app(app)
     ElasticsearchInstrumentor().instrument()
-    
-    return app
+    return FastAPIInstrumentor
+
+async def start_telemetry(app):
+    """Initialize OpenTelemetry and instrument the app; requests served before it finishes are not traced"""
+    if not tracing_enabled():
+        return
+
+    try:
+        instrumentor = await asyncio.get_running_loop().run_in_executor(None, _load_telemetry)
+    except Exception as e:
+        logger.error("Tracing setup failed", error=str(e))
+        return
+    instrumentor.instrument_app(app)
+    # Starlette built its middleware stack on the first call; rebuild it on the next one with tracing
+    app.middleware_stack = None
@@ -1,16 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import structlog
+import asyncio
 import os
 import uuid
-import asyncio
-from typing import List
+import time
+from typing import List, Union, Optional
+from pydantic import BaseModel, TypeAdapter
 from datetime import datetime
+from opentelemetry import trace
 
-from models.log_schemas import LogEntry, SearchQuery, LogSearchResponse, ErrorPattern, IngestResponse
+from models.log_schemas import (
+    LogEntry, SearchQuery, LogSearchResponse, ErrorPattern, ErrorPatternsResponse, IngestResponse, QueryProfile,
+    SearchJobStatus, AlertRule, TraceLogsResponse, TraceBatchQuery
+)
 from services.search_engine import SearchEngine
-from config.otel_config import setup_telemetry, instrument_app
+from services.retention import RetentionManager
+from services.ingest_queue import IngestQueue
+from services.log_batch import LogEntriesError, parse_log_entries
+from services.health import HealthMonitor
+from services.alerting import AlertEngine
+from services.parse_pool import ParsePool
+from services.host_flusher import HostFlushCoordinator
+from services.trace_lookup import TraceLookup
+from observability.metrics import MetricsCollector
+from config.otel_config import setup_telemetry, start_telemetry
 
 structlog.configure(
     processors=[
@@ -33,14 +50,55 @@ structlog.configure(
 logger = structlog.get_logger()
 
 search_engine = SearchEngine()
+retention_manager = RetentionManager(search_engine)
+alert_engine = AlertEngine()
+ingest_queue = IngestQueue(search_engine, alert_engine=alert_engine)
+flush_coordinator = HostFlushCoordinator(ingest_queue)
+ingest_queue.coordinator = flush_coordinator
+parse_pool = ParsePool()
+health_monitor = HealthMonitor(search_engine, ingest_queue)
+trace_lookup = TraceLookup(search_engine)
+# Optional features are imported when they are configured or first used, so startup doesn't pay for them
+syslog_server = None
+job_manager = None
+
+def get_job_manager():
+    global job_manager
+    if job_manager is None:
+        from services.search_jobs import SearchJobManager
+        job_manager = SearchJobManager(search_engine)
+    return job_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global syslog_server
     logger.info("Starting Log Aggregator API...")
+    await search_engine.wait_until_ready(timeout=float(os.getenv("ES_STARTUP_TIMEOUT_SECONDS", "60")))
     await search_engine.initialize()
+    alert_engine.start()
+    await flush_coordinator.start()
+    ingest_queue.start()
+    if int(os.getenv("SYSLOG_TCP_PORT", "0")) or int(os.getenv("SYSLOG_UDP_PORT", "0")):
+        from services.syslog_listener import SyslogServer
+        syslog_server = SyslogServer(ingest_queue)
+        await syslog_server.start()
+    await health_monitor.start()
+    retention_manager.start()
     logger.info("Services initialized")
+    telemetry_task = asyncio.create_task(start_telemetry(app))
     yield
     logger.info("Shutting down Log Aggregator API...")
+    telemetry_task.cancel()
+    await retention_manager.stop()
+    if job_manager is not None:
+        await job_manager.stop()
+    await health_monitor.stop()
+    if syslog_server is not None:
+        await syslog_server.stop()
+    await flush_coordinator.stop()
+    await ingest_queue.stop()
+    parse_pool.shutdown()
+    await alert_engine.stop()
 
 app = FastAPI(
     title="Pay Log Aggregator",
@@ -50,7 +108,6 @@ app = FastAPI(
 )
 
 tracer = setup_telemetry()
-app = instrument_app(app)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"])
 
@@ -61,13 +118,23 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    logger.info("Health check")
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "elasticsearch": "connected"
+        "elasticsearch": health_monitor.elasticsearch_status
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the event loop is serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness from cached probes of Elasticsearch and the ingest buffer"""
+    status = health_monitor.readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @app.post("/logs/ingest", response_model=IngestResponse)
 async def ingest_log(log_entry: LogEntry) -> IngestResponse:
     """Ingest a single log entry"""
@@ -81,7 +148,8 @@ async def ingest_log(log_entry: LogEntry) -> IngestResponse:
             span.set_attribute("log_level", log_entry.level)
             span.set_attribute("log_source", log_entry.source)
             
-            asyncio.create_task(process_log_entry(log_entry_dict))
+            if not ingest_queue.submit(log_entry_dict):
+                raise HTTPException(status_code=503, detail="Ingest queue is full, retry later")
             
             logger.info(
                 "Log entry received",
@@ -96,6 +164,8 @@ async def ingest_log(log_entry: LogEntry) -> IngestResponse:
                 correlation_id=correlation_id
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             span.record_exception(e)
             span.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
@@ -103,69 +173,126 @@ async def ingest_log(log_entry: LogEntry) -> IngestResponse:
             raise HTTPException(status_code=500, detail=f"Failed to ingest log: {str(e)}")
 
 
-async def process_log_entry(log_entry_dict: dict):
-    """Process a single log entry in the background"""
-    try:
-        await search_engine.index_log(log_entry_dict)
-        logger.info(
-            "Log entry processed",
-            correlation_id=log_entry_dict.get("correlation_id"),
-            source=log_entry_dict.get("source")
-        )
-    except Exception as e:
-        logger.error(
-            "Failed to process log entry",
-            correlation_id=log_entry_dict.get("correlation_id"),
-            error=str(e)
-        )
-
-@app.post("/logs/batch-ingest", response_model=IngestResponse)
-async def batch_ingest_logs(logs: List[LogEntry]) -> IngestResponse:
-    """Ingest multiple log entries"""
+@app.post(
+    "/logs/batch-ingest",
+    response_model=IngestResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {
+        "schema": {"type": "array", "items": {"$ref": "#/components/schemas/LogEntry"}}
+    }}}},
+)
+async def batch_ingest_logs(request: Request) -> IngestResponse:
+    """Ingest multiple log entries; large bodies are validated in the parse pool"""
     with tracer.start_as_current_span("batch_ingest_logs") as span:
+        correlation_id = str(uuid.uuid4())
+        body = await request.body()
+        try:
+            documents = await parse_pool.run(parse_log_entries, body, correlation_id, size=len(body))
+        except LogEntriesError as e:
+            raise RequestValidationError([dict(error, loc=("body",) + tuple(error["loc"])) for error in e.errors])
+        
         try:
-            correlation_id = str(uuid.uuid4())
             span.set_attribute("correlation_id", correlation_id)
-            span.set_attribute("batch_size", len(logs))
+            span.set_attribute("batch_size", len(documents))
             
-            tasks = []
-            for log_entry in logs:
-                log_entry_dict = log_entry.model_dump()
-                log_entry_dict["correlation_id"] = correlation_id
-                tasks.append(process_log_entry(log_entry_dict))
+            if ingest_queue.free_slots() < len(documents):
+                raise HTTPException(status_code=503, detail="Ingest queue is full, retry later")
             
-            asyncio.create_task(asyncio.gather(*tasks))
+            for document in documents:
+                ingest_queue.submit(document)
             
             logger.info(
                 "Batch logs received",
                 correlation_id=correlation_id,
-                count=len(logs)
+                count=len(documents)
             )
             
             return IngestResponse(
                 success=True,
-                message=f"Batch of {len(logs)} log entries queued for processing",
+                message=f"Batch of {len(documents)} log entries queued for processing",
                 correlation_id=correlation_id
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             span.record_exception(e)
             span.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
             logger.error("Failed to ingest batch logs", error=str(e))
             raise HTTPException(status_code=500, detail=f"Failed to ingest batch logs: {str(e)}")
 
+@app.post("/v1/logs")
+async def otlp_logs(request: Request) -> Response:
+    """OTLP/HTTP logs receiver accepting ExportLogsServiceRequest as protobuf or JSON"""
+    from services.otlp_receiver import decode_documents, encode_response, OTLPDecodeError
+    with tracer.start_as_current_span("otlp_logs") as span:
+        content_type = request.headers.get("content-type", "application/x-protobuf")
+        correlation_id = str(uuid.uuid4())
+        body = await request.body()
+        try:
+            documents = await parse_pool.run(
+                decode_documents, body, content_type, request.headers.get("content-encoding", ""), correlation_id,
+                size=len(body)
+            )
+        except OTLPDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid OTLP logs request: {e}")
+        
+        span.set_attribute("correlation_id", correlation_id)
+        span.set_attribute("batch_size", len(documents))
+        
+        # All or nothing, so a retrying exporter never duplicates part of a batch
+        if ingest_queue.free_slots() < len(documents):
+            raise HTTPException(status_code=503, detail="Ingest queue is full, retry later", headers={"Retry-After": "1"})
+        for document in documents:
+            ingest_queue.submit(document)
+        
+        logger.info("OTLP logs received", correlation_id=correlation_id, count=len(documents))
+        body, media_type = encode_response(content_type)
+        return Response(content=body, media_type=media_type)
+
+@app.get("/alerts/rules", response_model=List[AlertRule])
+async def alert_rules() -> List[AlertRule]:
+    """Alert rules currently loaded"""
+    return alert_engine.rule_set.rules
+
+_error_patterns_adapter = TypeAdapter(List[ErrorPattern])
+
+def timed_json_response(endpoint: str, payload: Union[BaseModel, List[ErrorPattern]],
+                        profile: Optional[QueryProfile]) -> Response:
+    """Serialize a search response ourselves so the serialization phase can be timed"""
+    started = time.perf_counter()
+    if isinstance(payload, BaseModel):
+        body = payload.model_dump_json()
+    else:
+        body = _error_patterns_adapter.dump_json(payload)
+    serialize_ms = (time.perf_counter() - started) * 1000
+    MetricsCollector.record_search_phases(endpoint, {"serialize": serialize_ms})
+    
+    headers = {}
+    if profile is not None:
+        headers["Server-Timing"] = ", ".join([
+            f"query_build;dur={profile.query_build_ms:.3f}",
+            f"es;dur={profile.es_took_ms:.3f}",
+            f"transport;dur={profile.transport_ms:.3f}",
+            f"deserialize;dur={profile.deserialize_ms:.3f}",
+            f"serialize;dur={serialize_ms:.3f}",
+        ])
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/logs/search", response_model=LogSearchResponse)
 async def search_logs(
     query: str = "",
     level: str = None,
     source: str = None,
     service: str = None,
+    trace_id: str = None,
     start_time: str = None,
     end_time: str = None,
     limit: int = 100,
-    offset: int = 0
+    offset: int = 0,
+    profile: bool = False,
+    es_profile: bool = False
 ):
-    """Search logs with various filters"""
+    """Search logs with various filters; profile=true adds a timing breakdown, es_profile=true ES's own profile"""
     with tracer.start_as_current_span("search_logs") as span:
         start_dt = datetime.fromisoformat(start_time) if start_time else None
         end_dt = datetime.fromisoformat(end_time) if end_time else None
@@ -175,6 +302,7 @@ async def search_logs(
             level=level,
             source=source,
             service=service,
+            trace_id=trace_id,
             start_time=start_dt,
             end_time=end_dt,
             limit=min(limit, 1000),
@@ -184,7 +312,7 @@ async def search_logs(
         span.set_attribute("search.query", query)
         span.set_attribute("search.limit", search_query.limit)
         
-        result = await search_engine.search_logs(search_query)
+        result = await search_engine.search_logs(search_query, profile=profile or es_profile, es_profile=es_profile)
         
         logger.info("Search executed",
                    query=query,
@@ -192,21 +320,98 @@ async def search_logs(
                    total_count=result.total_count,
                    took_ms=result.took_ms)
         
-        return result
+        return timed_json_response("search", result, result.profile)
 
-@app.get("/logs/patterns", response_model=List[ErrorPattern])
-async def get_error_patterns(hours: int = 24):
-    """Get common error patterns from recent logs"""
+@app.get("/logs/patterns", response_model=Union[List[ErrorPattern], ErrorPatternsResponse])
+async def get_error_patterns(hours: int = 24, profile: bool = False, es_profile: bool = False):
+    """Get common error patterns from recent logs; profiling wraps them as {patterns, profile}"""
     with tracer.start_as_current_span("get_error_patterns") as span:
         span.set_attribute("analysis.hours", hours)
         
-        patterns = await search_engine.find_error_patterns(hours)
+        profile = profile or es_profile
+        result = await search_engine.analyze_error_patterns(hours, profile=profile, es_profile=es_profile)
         
         logger.info("Error patterns analyzed",
-                   patterns_found=len(patterns),
+                   patterns_found=len(result.patterns),
                    hours_analyzed=hours)
         
-        return patterns
+        if profile:
+            return timed_json_response("patterns", result, result.profile)
+        return timed_json_response("patterns", result.patterns, None)
+
+@app.get("/traces/{trace_id}/logs", response_model=TraceLogsResponse)
+async def get_trace_logs(trace_id: str, start_time: datetime = None, end_time: datetime = None):
+    """Every log of a trace grouped by span; start_time/end_time from the trace narrow the search"""
+    with tracer.start_as_current_span("get_trace_logs") as span:
+        span.set_attribute("trace.lookup_id", trace_id)
+        result = await trace_lookup.get(trace_id, start_time, end_time)
+        
+        logger.info("Trace logs fetched", trace_id=trace_id, total_count=result.total_count, cached=result.cached)
+        return result
+
+@app.post("/traces/logs", response_model=List[TraceLogsResponse])
+async def get_traces_logs(trace_query: TraceBatchQuery):
+    """Logs for many traces in one request"""
+    with tracer.start_as_current_span("get_traces_logs") as span:
+        span.set_attribute("trace.lookup_count", len(trace_query.trace_ids))
+        results = await trace_lookup.get_many(trace_query.trace_ids, trace_query.start_time, trace_query.end_time)
+        
+        logger.info("Trace logs fetched", traces=len(results), cached=sum(1 for r in results if r.cached))
+        return results
+
+async def submit_job(kind: str, params: dict) -> SearchJobStatus:
+    from services.search_jobs import JobLimitError
+    try:
+        job, deduplicated = await get_job_manager().submit(kind, params)
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=f"Too many queued jobs: {str(e)}")
+    
+    logger.info("Search job submitted", job_id=job.id, kind=kind, deduplicated=deduplicated)
+    return job.to_status(deduplicated=deduplicated)
+
+async def get_job_or_404(job_id: str):
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.post("/jobs/patterns", response_model=SearchJobStatus, status_code=202)
+async def submit_patterns_job(hours: int = 24):
+    """Run an error pattern analysis in the background"""
+    return await submit_job("patterns", {"hours": hours})
+
+@app.post("/jobs/search", response_model=SearchJobStatus, status_code=202)
+async def submit_search_job(search_query: SearchQuery):
+    """Run a log search in the background"""
+    return await submit_job("search", search_query.model_dump(mode="json"))
+
+@app.get("/jobs/{job_id}", response_model=SearchJobStatus)
+async def get_job(job_id: str, wait: float = 0):
+    """Job status and, for pattern jobs, partial results; wait=N long-polls up to N seconds for the next update"""
+    job = await get_job_or_404(job_id)
+    job = await get_job_manager().wait(job, min(max(wait, 0), 30))
+    return job.to_status()
+
+@app.get("/jobs/{job_id}/result", response_model=Union[LogSearchResponse, List[ErrorPattern]])
+async def get_job_result(job_id: str):
+    """Final job result; 202 with the status while the job is still running"""
+    from services.search_jobs import ACTIVE_STATES, FAILED, CANCELLED
+    job = await get_job_or_404(job_id)
+    if job.status in ACTIVE_STATES:
+        return JSONResponse(status_code=202, content=job.to_status().model_dump(mode="json"))
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+    if job.status == CANCELLED:
+        raise HTTPException(status_code=409, detail="Job was cancelled")
+    return job.result
+
+@app.delete("/jobs/{job_id}", response_model=SearchJobStatus)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = await get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_status()
 
 @app.get("/metrics")
 async def get_metrics():
@@ -35,19 +35,80 @@ class SearchQuery(BaseModel):
     level: Optional[LogLevel] = None
     source: Optional[str] = None
     service: Optional[str] = None
+    trace_id: Optional[str] = None
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     limit: int = Field(default=100, le=1000)
     offset: int = Field(default=0, ge=0)
 
+class QueryProfile(BaseModel):
+    query_build_ms: float
+    es_took_ms: float
+    transport_ms: float
+    deserialize_ms: float
+    total_ms: float
+    es_profile: Optional[Dict[str, Any]] = None
+
 class LogSearchResponse(BaseModel):
     logs: List[LogEntry]
     total_count: int
     took_ms: float
+    profile: Optional[QueryProfile] = None
     
 class ErrorPattern(BaseModel):
     pattern: str
     count: int
     first_seen: datetime
     last_seen: datetime
-    services: List[str]
\ No newline at end of file
+    services: List[str]
+
+class ErrorPatternsResponse(BaseModel):
+    patterns: List[ErrorPattern]
+    profile: Optional[QueryProfile] = None
+
+class SearchJobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    progress: float
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    deduplicated: bool = False
+    partial_result: Optional[List[ErrorPattern]] = None
+
+class AlertRule(BaseModel):
+    name: str
+    levels: Optional[List[LogLevel]] = None
+    services: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    contains: List[str] = Field(default_factory=list)
+    regex: Optional[str] = None
+    case_sensitive: bool = False
+    threshold: int = Field(default=1, ge=1)
+    window_seconds: float = Field(default=60, gt=0)
+
+class AlertEvent(BaseModel):
+    rule: str
+    count: int
+    window_seconds: float
+    fired_at: datetime
+    sample: Dict[str, Any]
+
+class SpanLogs(BaseModel):
+    span_id: Optional[str] = None
+    logs: List[LogEntry]
+
+class TraceLogsResponse(BaseModel):
+    trace_id: str
+    total_count: int
+    truncated: bool = False
+    cached: bool = False
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    spans: List[SpanLogs]
+
+class TraceBatchQuery(BaseModel):
+    trace_ids: List[str] = Field(min_length=1, max_length=100)
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
@@ -1,6 +1,4 @@
 from opentelemetry import metrics
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 import time
 
 meter = metrics.get_meter(__name__)
@@ -41,6 +39,42 @@ error_counter = meter.create_counter(
     unit="1"
 )
 
+search_phase_duration = meter.create_histogram(
+    name="search_phase_duration_ms",
+    description="Time spent per phase of a search request",
+    unit="ms"
+)
+
+metadata_keys_dropped_counter = meter.create_counter(
+    name="metadata_keys_dropped_total",
+    description="Metadata keys dropped at ingest for exceeding the per-log key limit",
+    unit="1"
+)
+
+bulk_duration = meter.create_histogram(
+    name="bulk_request_duration_ms",
+    description="Latency of bulk indexing requests",
+    unit="ms"
+)
+
+bulk_rejected_counter = meter.create_counter(
+    name="bulk_items_rejected_total",
+    description="Bulk items rejected by Elasticsearch for overload (429)",
+    unit="1"
+)
+
+alerts_fired_counter = meter.create_counter(
+    name="alerts_fired_total",
+    description="Alert events raised by ingest-time rules",
+    unit="1"
+)
+
+syslog_dropped_counter = meter.create_counter(
+    name="syslog_messages_dropped_total",
+    description="Syslog messages dropped because the ingest buffer was full or they were oversized",
+    unit="1"
+)
+
 class MetricsCollector:
     @staticmethod
     def record_log_ingested(count: int = 1, level: str = None, source: str = None):
@@ -64,6 +98,12 @@ class MetricsCollector:
         search_duration.record(duration)
         search_results_counter.add(result_count)
     
+    @staticmethod
+    def record_search_phases(endpoint: str, phases: dict):
+        """Record the per-phase timing breakdown of a search, in ms"""
+        for phase, duration_ms in phases.items():
+            search_phase_duration.record(duration_ms, {"endpoint": endpoint, "phase": phase})
+    
     @staticmethod
     def update_queue_size(size: int):
         """Update queue size gauge"""
@@ -77,3 +117,29 @@ class MetricsCollector:
             attributes["endpoint"] = endpoint
         
         error_counter.add(1, attributes)
+    
+    @staticmethod
+    def record_metadata_keys_dropped(count: int, service: str = None):
+        """Record metadata keys dropped by the ingest limits"""
+        attributes = {}
+        if service:
+            attributes["service"] = service
+        
+        metadata_keys_dropped_counter.add(count, attributes)
+    
+    @staticmethod
+    def record_bulk(duration_ms: float, rejected: int = 0):
+        """Record one bulk request and how many of its items were rejected"""
+        bulk_duration.record(duration_ms, {"outcome": "rejected" if rejected else "ok"})
+        if rejected:
+            bulk_rejected_counter.add(rejected)
+    
+    @staticmethod
+    def record_alert(rule: str):
+        """Record an alert event raised by a rule"""
+        alerts_fired_counter.add(1, {"rule": rule})
+    
+    @staticmethod
+    def record_syslog_dropped(count: int, transport: str):
+        """Record syslog messages that could not be buffered"""
+        syslog_dropped_counter.add(count, {"transport": transport})
@@ -0,0 +1,70 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher.
+
+    All patterns are compiled into one automaton, so a text is scanned once no matter
+    how many patterns there are. find() returns the indices of the patterns that occur.
+    Most texts contain none of the patterns, so find() first checks them with one
+    compiled alternation regex, which runs in C, and only walks the automaton on a hit.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[int]] = [set()]
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                raise ValueError("Empty pattern")
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = next_state
+            self._out[state].add(index)
+
+        # Longest first, so a pattern that contains another still hits
+        self._prefilter = re.compile("|".join(re.escape(p) for p in sorted(self.patterns, key=len, reverse=True)))
+
+        # Breadth-first so a state's failure link is final before its children use it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] |= self._out[self._fail[child]]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def find(self, text: str) -> Set[int]:
+        """Indices of every pattern that occurs in text"""
+        if self._prefilter.search(text) is None:
+            return set()
+        return self._scan(text)
+
+    def _scan(self, text: str) -> Set[int]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
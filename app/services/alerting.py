@@ -0,0 +1,235 @@
+import os
+import re
+import json
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Deque, List, Optional, Pattern, Tuple
+
+import structlog
+
+from models.log_schemas import AlertRule, AlertEvent
+from observability.metrics import MetricsCollector
+from services.aho_corasick import AhoCorasick
+from services.loop_bound import loop_bound
+
+logger = structlog.get_logger()
+
+
+class RuleSet:
+    """Alert rules compiled for matching on the ingest path.
+
+    Substrings from every rule share one Aho-Corasick automaton run over the lowercased
+    message; case-sensitive substrings are confirmed against the original message.
+    """
+
+    def __init__(self, rules: List[AlertRule]):
+        self.rules = rules
+        self._filters = [
+            (
+                frozenset(level.value for level in rule.levels) if rule.levels else None,
+                frozenset(rule.services) if rule.services else None,
+                frozenset(rule.sources) if rule.sources else None,
+            )
+            for rule in rules
+        ]
+        self._regexes: List[Tuple[int, Pattern]] = []
+        # Rules with only level/service/source filters match every log that passes them
+        self._unconditional: List[int] = []
+        patterns: List[str] = []
+        self._pattern_owners: List[Tuple[int, Optional[str]]] = []
+
+        for index, rule in enumerate(rules):
+            for substring in rule.contains:
+                patterns.append(substring.lower())
+                self._pattern_owners.append((index, substring if rule.case_sensitive else None))
+            if rule.regex:
+                flags = 0 if rule.case_sensitive else re.IGNORECASE
+                self._regexes.append((index, re.compile(rule.regex, flags)))
+            if not rule.contains and not rule.regex:
+                self._unconditional.append(index)
+
+        self._automaton = AhoCorasick(patterns) if patterns else None
+
+    @classmethod
+    def from_json(cls, text: str) -> "RuleSet":
+        return cls([AlertRule(**rule) for rule in json.loads(text)])
+
+    def _passes_filters(self, index: int, level: Any, service: Optional[str], source: Optional[str]) -> bool:
+        levels, services, sources = self._filters[index]
+        return (
+            (levels is None or level in levels)
+            and (services is None or service in services)
+            and (sources is None or source in sources)
+        )
+
+    def match(self, doc: Dict[str, Any]) -> List[AlertRule]:
+        """Rules the log matches, each at most once"""
+        level = getattr(doc.get("level"), "value", doc.get("level"))
+        service = doc.get("service")
+        source = doc.get("source")
+        message = doc.get("message") or ""
+        matched = set()
+
+        for index in self._unconditional:
+            if self._passes_filters(index, level, service, source):
+                matched.add(index)
+
+        if self._automaton is not None:
+            for pattern_index in self._automaton.find(message.lower()):
+                index, exact = self._pattern_owners[pattern_index]
+                if index in matched or (exact is not None and exact not in message):
+                    continue
+                if self._passes_filters(index, level, service, source):
+                    matched.add(index)
+
+        for index, regex in self._regexes:
+            if index not in matched and self._passes_filters(index, level, service, source) and regex.search(message):
+                matched.add(index)
+
+        return [self.rules[index] for index in sorted(matched)]
+
+
+class AlertEngine:
+    """Evaluates alert rules against every ingested log.
+
+    A rule fires once threshold matches fall within window_seconds, then stays quiet for
+    the rest of that window. Events go to ALERT_WEBHOOK_URL when set, otherwise to the
+    application log. The rules file is re-read whenever it changes.
+    """
+
+    def __init__(
+        self,
+        rules_path: Optional[str] = None,
+        webhook_url: Optional[str] = None,
+        reload_interval: Optional[float] = None,
+        max_pending: int = 1000,
+    ):
+        self.rules_path = rules_path if rules_path is not None else os.getenv("ALERT_RULES_FILE", "")
+        self.webhook_url = webhook_url if webhook_url is not None else os.getenv("ALERT_WEBHOOK_URL", "")
+        self.reload_interval = (
+            reload_interval if reload_interval is not None else float(os.getenv("ALERT_RELOAD_INTERVAL_SECONDS", "5"))
+        )
+        self.rule_set = RuleSet([])
+        self._mtime: Optional[float] = None
+        # Match times per rule name, kept across reloads
+        self._recent: Dict[str, Deque[float]] = {}
+        self._quiet_until: Dict[str, float] = {}
+        self._pending: Deque[AlertEvent] = deque(maxlen=max_pending)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._session = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rules_path)
+
+    @loop_bound
+    def wakeup(self) -> asyncio.Event:
+        return asyncio.Event()
+
+    def reload(self) -> bool:
+        """Load the rules file if it changed; a broken file keeps the current rules"""
+        try:
+            mtime = os.stat(self.rules_path).st_mtime
+        except OSError as e:
+            logger.error("Alert rules file unreadable", path=self.rules_path, error=str(e))
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        try:
+            with open(self.rules_path) as f:
+                rule_set = RuleSet.from_json(f.read())
+        except Exception as e:
+            logger.error("Invalid alert rules, keeping previous rules", path=self.rules_path, error=str(e))
+            return False
+
+        names = {rule.name for rule in rule_set.rules}
+        for state in (self._recent, self._quiet_until):
+            for name in [name for name in state if name not in names]:
+                del state[name]
+        self.rule_set = rule_set
+        logger.info("Alert rules loaded", path=self.rules_path, rules=len(rule_set.rules))
+        return True
+
+    def evaluate(self, doc: Dict[str, Any], now: Optional[float] = None) -> List[AlertEvent]:
+        """Match one log and queue the alerts it triggers"""
+        if not self.rule_set.rules:
+            return []
+        now = time.monotonic() if now is None else now
+        fired = []
+
+        for rule in self.rule_set.match(doc):
+            recent = self._recent.get(rule.name)
+            if recent is None or recent.maxlen != rule.threshold:
+                recent = self._recent[rule.name] = deque(recent or (), maxlen=rule.threshold)
+            recent.append(now)
+            while recent and recent[0] <= now - rule.window_seconds:
+                recent.popleft()
+            if len(recent) < rule.threshold or now < self._quiet_until.get(rule.name, 0):
+                continue
+
+            self._quiet_until[rule.name] = now + rule.window_seconds
+            event = AlertEvent(
+                rule=rule.name,
+                count=len(recent),
+                window_seconds=rule.window_seconds,
+                fired_at=datetime.utcnow(),
+                sample={key: doc.get(key) for key in ("timestamp", "level", "message", "source", "service", "trace_id")},
+            )
+            recent.clear()
+            fired.append(event)
+            MetricsCollector.record_alert(rule.name)
+
+        if fired:
+            self._pending.extend(fired)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return fired
+
+    def start(self):
+        """Load the rules and start the reload and delivery loops"""
+        if not self.enabled:
+            return
+        self.reload()
+        self._tasks = [asyncio.create_task(self._watch()), asyncio.create_task(self._deliver())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._pending:
+            await self._send(self._pending.popleft())
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload()
+
+    async def _deliver(self):
+        while True:
+            while not self._pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            await self._send(self._pending.popleft())
+
+    async def _send(self, event: AlertEvent):
+        if not self.webhook_url:
+            logger.warning("Alert fired", **event.model_dump(mode="json"))
+            return
+        try:
+            if self._session is None:
+                import aiohttp
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+            async with self._session.post(self.webhook_url, json=event.model_dump(mode="json")) as response:
+                if response.status >= 400:
+                    logger.error("Alert webhook rejected event", rule=event.rule, status=response.status)
+        except Exception as e:
+            logger.error("Alert webhook failed", rule=event.rule, error=str(e))
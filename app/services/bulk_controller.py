@@ -0,0 +1,133 @@
+import os
+import random
+import asyncio
+from typing import Optional
+
+import structlog
+
+from services.loop_bound import loop_bound
+
+logger = structlog.get_logger()
+
+REJECTED_STATUS = 429
+REJECTED_ERROR_TYPE = "es_rejected_execution_exception"
+
+
+def is_rejection(item: dict) -> bool:
+    """True for a bulk item Elasticsearch refused because it was overloaded"""
+    error = item.get("error") or {}
+    return item.get("status") == REJECTED_STATUS or (
+        isinstance(error, dict) and error.get("type") == REJECTED_ERROR_TYPE
+    )
+
+
+class AdaptiveBulkController:
+    """AIMD control of bulk request size and the number of bulk requests in flight.
+
+    A bulk that completes under the target latency grows the size limits and the
+    concurrency limit additively. A slow bulk halves the size limits, and a rejection
+    (429 / es_rejected_execution_exception) halves both size and concurrency. Like TCP,
+    only one decrease is applied per round: results from requests sent before the last
+    decrease are not allowed to cut the limits again.
+    """
+
+    def __init__(
+        self,
+        initial_docs: Optional[int] = None,
+        min_docs: Optional[int] = None,
+        max_docs: Optional[int] = None,
+        min_bytes: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        target_latency: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        retry_base_delay: Optional[float] = None,
+        retry_max_delay: Optional[float] = None,
+    ):
+        self.min_docs = min_docs or int(os.getenv("BULK_MIN_DOCS", "10"))
+        self.max_docs = max_docs or int(os.getenv("BULK_MAX_DOCS", "5000"))
+        self.min_bytes = min_bytes or int(os.getenv("BULK_MIN_BYTES", str(64 * 1024)))
+        self.max_bytes = max_bytes or int(os.getenv("BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.max_concurrency = max_concurrency or int(os.getenv("BULK_MAX_CONCURRENCY", "4"))
+        self.target_latency = (
+            target_latency if target_latency is not None else float(os.getenv("BULK_TARGET_LATENCY_MS", "1000")) / 1000
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("BULK_MAX_RETRIES", "5"))
+        self.retry_base_delay = retry_base_delay if retry_base_delay is not None else 0.1
+        self.retry_max_delay = retry_max_delay if retry_max_delay is not None else 5.0
+
+        initial_docs = initial_docs or int(os.getenv("BATCH_SIZE", "100"))
+        self.min_docs = min(self.min_docs, initial_docs)
+        self.max_docs = max(self.max_docs, initial_docs)
+        self.docs_step = self.min_docs
+        self.bytes_step = max(self.min_bytes, self.max_bytes // 32)
+
+        self.docs_limit = float(initial_docs)
+        self.bytes_limit = float(self.max_bytes)
+        self.concurrency_limit = 1.0
+        self.in_flight = 0
+        # Bumped on every decrease; requests remember the epoch they were sent in
+        self.epoch = 0
+        self._slot_freed: Optional[asyncio.Event] = None
+
+    @loop_bound
+    def slot_freed(self) -> asyncio.Event:
+        return asyncio.Event()
+
+    @property
+    def bulk_docs(self) -> int:
+        return int(self.docs_limit)
+
+    @property
+    def bulk_bytes(self) -> int:
+        return int(self.bytes_limit)
+
+    @property
+    def concurrency(self) -> int:
+        return int(self.concurrency_limit)
+
+    async def acquire(self) -> int:
+        """Wait for an in-flight slot; returns the epoch to report results against"""
+        while self.in_flight >= self.concurrency:
+            self.slot_freed.clear()
+            await self.slot_freed.wait()
+        self.in_flight += 1
+        return self.epoch
+
+    def release(self):
+        self.in_flight -= 1
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+
+    def on_success(self, epoch: int, latency: float):
+        """Feed back a bulk that had no rejected items"""
+        if latency > self.target_latency:
+            if self._decrease(epoch, concurrency=False):
+                logger.info("Bulk slower than target, shrinking", latency_ms=round(latency * 1000), **self.limits())
+            return
+        self.docs_limit = min(self.max_docs, self.docs_limit + self.docs_step)
+        self.bytes_limit = min(self.max_bytes, self.bytes_limit + self.bytes_step)
+        # Roughly one extra slot per round of completed requests
+        self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def on_rejected(self, epoch: int, rejected: int):
+        """Feed back a bulk in which Elasticsearch rejected items"""
+        if self._decrease(epoch, concurrency=True):
+            logger.warning("Bulk items rejected, backing off", rejected=rejected, **self.limits())
+
+    def retry_delay(self, attempt: int) -> float:
+        """Jittered exponential backoff before retrying rejected items"""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    def limits(self) -> dict:
+        return {"bulk_docs": self.bulk_docs, "bulk_bytes": self.bulk_bytes, "concurrency": self.concurrency}
+
+    def _decrease(self, epoch: int, concurrency: bool) -> bool:
+        if epoch != self.epoch:
+            return False
+        self.epoch += 1
+        self.docs_limit = max(self.min_docs, self.docs_limit / 2)
+        self.bytes_limit = max(self.min_bytes, self.bytes_limit / 2)
+        if concurrency:
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+        return True
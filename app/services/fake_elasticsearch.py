@@ -0,0 +1,1147 @@
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import fnmatch
+from functools import cmp_to_key
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+from elasticsearch import AsyncElasticsearch
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, ConnectionTimeout, HttpHeaders
+from elastic_transport import ConnectionError as TransportConnectionError
+
+from services.bulk_controller import REJECTED_STATUS, REJECTED_ERROR_TYPE
+from services.log_batch import millis_to_iso, to_epoch_millis
+
+FAKE_SCHEME = "fake://"
+FAKE_HOST = "http://fake-elasticsearch:9200"
+VERSION = "8.10.0"
+
+# Simulated milliseconds for a request carrying this many documents
+Latency = Callable[[random.Random, int], float]
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_DATE_MATH = re.compile(r"^now(?:([+-])(\d+)(ms|[smhdw]))?(?:/[smhdwMy])?$")
+_UNIT_MS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+_WORD = re.compile(r"\w+")
+_QUERIES = {
+    "match_all", "bool", "term", "terms", "ids", "exists", "range", "prefix", "wildcard",
+    "match", "match_phrase", "multi_match",
+}
+
+
+def constant(ms: float) -> Latency:
+    return lambda rng, docs: ms
+
+
+def uniform(low_ms: float, high_ms: float) -> Latency:
+    return lambda rng, docs: rng.uniform(low_ms, high_ms)
+
+
+def lognormal(median_ms: float, sigma: float = 0.5) -> Latency:
+    """Long-tailed latency: most requests near the median, a few much slower"""
+    mu = math.log(median_ms)
+    return lambda rng, docs: rng.lognormvariate(mu, sigma)
+
+
+def per_doc(ms_per_doc: float, base: Optional[Latency] = None) -> Latency:
+    """A fixed cost per document on top of base, so bigger bulks take longer"""
+    return lambda rng, docs: (base(rng, docs) if base else 0.0) + ms_per_doc * docs
+
+
+class _EsError(Exception):
+    """An Elasticsearch error response, rendered with the usual error body"""
+
+    def __init__(self, status: int, error_type: str, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+    def body(self) -> Dict[str, Any]:
+        cause = {"type": self.error_type, "reason": self.reason}
+        return {"error": dict(cause, root_cause=[cause]), "status": self.status}
+
+
+def _not_found(index: str) -> _EsError:
+    return _EsError(404, "index_not_found_exception", f"no such index [{index}]")
+
+
+def _bool_param(value: Any) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _flatten(settings: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in settings.items():
+        key = prefix + key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, key + "."))
+        else:
+            flat[key] = value
+    return flat
+
+
+def _normalize_settings(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Flat "index.*" keys with string values, the way Elasticsearch reports them; None removes a key"""
+    normalized = {}
+    for key, value in _flatten(settings or {}).items():
+        if not key.startswith("index."):
+            key = "index." + key
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        normalized[key] = None if value is None else str(value)
+    return normalized
+
+
+def _nest(flat: Dict[str, Any]) -> Dict[str, Any]:
+    nested: Dict[str, Any] = {}
+    for key, value in flat.items():
+        node = nested
+        parts = key.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return nested
+
+
+def _tokens(value: Any) -> List[str]:
+    return _WORD.findall(str(value).lower())
+
+
+def _field_values(source: Dict[str, Any], field: str) -> List[Any]:
+    """Values of a possibly dotted field; a .keyword sub-field reads its parent"""
+    if field.endswith(".keyword"):
+        field = field[:-len(".keyword")]
+    if field in source:
+        value = source[field]
+    else:
+        value = source
+        for part in field.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return []
+            value = value[part]
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [item for item in value if item is not None]
+    return [value]
+
+
+def _comparable(value: Any, now_ms: int) -> Any:
+    """Dates (ISO strings and date math) become epoch millis so they order like numbers"""
+    if isinstance(value, str):
+        math_match = _DATE_MATH.match(value)
+        if math_match:
+            sign, amount, unit = math_match.groups()
+            offset = int(amount) * _UNIT_MS[unit] if amount else 0
+            return now_ms - offset if sign == "-" else now_ms + offset
+        if _DATE.match(value):
+            try:
+                return to_epoch_millis(value)
+            except ValueError:
+                return value
+    return value
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    if isinstance(value, bool) or isinstance(expected, bool):
+        return str(value).lower() == str(expected).lower()
+    if isinstance(value, (int, float)) and not isinstance(expected, str):
+        return value == expected
+    return str(value) == str(expected)
+
+
+class _Index:
+    """One index: documents by id plus its mappings and flat settings"""
+
+    def __init__(self, name: str, mappings: Optional[Dict[str, Any]] = None,
+                 settings: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.mappings = mappings or {}
+        self.settings = {"index.number_of_shards": "1", "index.number_of_replicas": "1"}
+        self.settings.update({k: v for k, v in _normalize_settings(settings).items() if v is not None})
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.seq_no = -1
+
+    @property
+    def closed(self) -> bool:
+        return self.settings.get("index.verified_before_close") == "true"
+
+    @property
+    def write_blocked(self) -> bool:
+        return self.settings.get("index.blocks.write") == "true" or self.closed
+
+    @property
+    def shards(self) -> int:
+        return int(self.settings.get("index.number_of_shards", "1"))
+
+    def shard_of(self, doc_id: str, routing: Optional[str] = None) -> int:
+        key = routing if routing is not None else doc_id
+        return sum(key.encode()) % self.shards
+
+
+class FakeCluster:
+    """In-process stand-in for an Elasticsearch cluster, for load and failure tests.
+
+    It serves the REST calls the app makes - document index/get/delete, bulk, search and
+    msearch with the common queries, sort, paging and aggregations, and the index admin
+    APIs - from memory, behind the real AsyncElasticsearch client via a custom node class.
+    Writes are visible to searches immediately and mapping types are not enforced.
+
+    Latency, overload and outages are injected: every request sleeps for a sampled
+    latency, bulk items are rejected with 429 at bulk_reject_rate or when more than
+    bulk_queue_docs documents are in flight, whole requests are rejected at
+    request_reject_rate, and an outage fails requests until it ends. All randomness
+    comes from one seeded generator, so a run with the same seed and request order is
+    reproducible.
+    """
+
+    def __init__(
+        self,
+        seed: Optional[int] = 0,
+        latency: Optional[Latency] = None,
+        bulk_latency: Optional[Latency] = None,
+        bulk_reject_rate: float = 0.0,
+        request_reject_rate: float = 0.0,
+        bulk_queue_docs: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+        node_name: str = "fake-node-0",
+    ):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        # Falls back to latency when unset
+        self.bulk_latency = bulk_latency
+        self.bulk_reject_rate = bulk_reject_rate
+        self.request_reject_rate = request_reject_rate
+        # Like the write thread pool queue: documents beyond it are rejected while it is full
+        self.bulk_queue_docs = bulk_queue_docs
+        self.clock = clock
+        self.node_name = node_name
+        self.indices: Dict[str, _Index] = {}
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "bulk_requests": 0,
+            "docs_indexed": 0,
+            "items_rejected": 0,
+            "requests_rejected": 0,
+            "requests_failed": 0,
+        }
+        self.bulk_in_flight_docs = 0
+        self._outage_until: Optional[float] = None
+        self._outage_status: Optional[int] = None
+        self._next_id = 0
+        self._node_class = None
+        self._routes = [
+            ("GET", ("_cluster", "health"), self._cluster_health),
+            ("GET", ("_cluster", "health", "{index}"), self._cluster_health),
+            ("GET", ("_cat", "shards"), self._cat_shards),
+            ("GET", ("_cat", "shards", "{index}"), self._cat_shards),
+            ("POST", ("_bulk",), self._bulk),
+            ("PUT", ("_bulk",), self._bulk),
+            ("POST", ("{index}", "_bulk"), self._bulk),
+            ("PUT", ("{index}", "_bulk"), self._bulk),
+            ("GET", ("_search",), self._search),
+            ("POST", ("_search",), self._search),
+            ("GET", ("{index}", "_search"), self._search),
+            ("POST", ("{index}", "_search"), self._search),
+            ("GET", ("_msearch",), self._msearch),
+            ("POST", ("_msearch",), self._msearch),
+            ("GET", ("{index}", "_msearch"), self._msearch),
+            ("POST", ("{index}", "_msearch"), self._msearch),
+            ("GET", ("_index_template", "{name}"), self._get_template),
+            ("HEAD", ("_index_template", "{name}"), self._template_exists),
+            ("PUT", ("_index_template", "{name}"), self._put_template),
+            ("POST", ("_index_template", "{name}"), self._put_template),
+            ("DELETE", ("_index_template", "{name}"), self._delete_template),
+            ("GET", ("{index}", "_mapping"), self._get_mapping),
+            ("PUT", ("{index}", "_mapping"), self._put_mapping),
+            ("POST", ("{index}", "_mapping"), self._put_mapping),
+            ("GET", ("_settings",), self._get_settings),
+            ("GET", ("{index}", "_settings"), self._get_settings),
+            ("PUT", ("{index}", "_settings"), self._put_settings),
+            ("POST", ("_refresh",), self._acknowledge),
+            ("POST", ("{index}", "_refresh"), self._acknowledge),
+            ("POST", ("{index}", "_forcemerge"), self._forcemerge),
+            ("POST", ("{index}", "_close"), self._close),
+            ("POST", ("{index}", "_open"), self._open),
+            ("PUT", ("{index}", "_shrink", "{target}"), self._shrink),
+            ("POST", ("{index}", "_shrink", "{target}"), self._shrink),
+            ("PUT", ("{index}", "_doc", "{id}"), self._index_doc),
+            ("POST", ("{index}", "_doc", "{id}"), self._index_doc),
+            ("POST", ("{index}", "_doc"), self._index_doc),
+            ("PUT", ("{index}", "_create", "{id}"), self._create_doc),
+            ("POST", ("{index}", "_create", "{id}"), self._create_doc),
+            ("POST", ("{index}", "_update", "{id}"), self._update_doc),
+            ("POST", ("{index}", "_delete_by_query"), self._delete_by_query),
+            ("GET", ("{index}", "_doc", "{id}"), self._get_doc),
+            ("HEAD", ("{index}", "_doc", "{id}"), self._get_doc),
+            ("DELETE", ("{index}", "_doc", "{id}"), self._delete_doc),
+            ("HEAD", ("{index}",), self._index_exists),
+            ("PUT", ("{index}",), self._create_index),
+            ("DELETE", ("{index}",), self._delete_index),
+            ("GET", (), self._info),
+            ("HEAD", (), self._info),
+        ]
+
+    @classmethod
+    def from_url(cls, url: str) -> "FakeCluster":
+        """Build a cluster from an ELASTICSEARCH_URL such as fake://?latency_ms=5&bulk_reject_rate=0.01.
+
+        latency_ms is the median request latency (lognormal when latency_sigma is set),
+        bulk_doc_ms adds a per-document bulk cost, and seed, bulk_reject_rate,
+        request_reject_rate and bulk_queue_docs set the matching constructor arguments.
+        """
+        if not url.startswith(FAKE_SCHEME):
+            raise ValueError(f"Not a fake Elasticsearch URL: {url}")
+        params = dict(parse_qsl(urlsplit(url).query))
+        unknown = set(params) - {
+            "seed", "latency_ms", "latency_sigma", "bulk_doc_ms", "bulk_reject_rate",
+            "request_reject_rate", "bulk_queue_docs",
+        }
+        if unknown:
+            raise ValueError(f"Unsupported fake Elasticsearch options: {', '.join(sorted(unknown))}")
+
+        latency = None
+        if "latency_ms" in params:
+            median = float(params["latency_ms"])
+            sigma = float(params.get("latency_sigma", "0"))
+            latency = lognormal(median, sigma) if sigma > 0 and median > 0 else constant(median)
+        bulk_latency = per_doc(float(params["bulk_doc_ms"]), latency) if "bulk_doc_ms" in params else None
+        return cls(
+            seed=int(params.get("seed", "0")),
+            latency=latency,
+            bulk_latency=bulk_latency,
+            bulk_reject_rate=float(params.get("bulk_reject_rate", "0")),
+            request_reject_rate=float(params.get("request_reject_rate", "0")),
+            bulk_queue_docs=int(params["bulk_queue_docs"]) if "bulk_queue_docs" in params else None,
+        )
+
+    @property
+    def node_class(self) -> type:
+        """A node class bound to this cluster, for AsyncElasticsearch(node_class=...)"""
+        if self._node_class is None:
+            self._node_class = type("BoundFakeNode", (FakeNode,), {"cluster": self})
+        return self._node_class
+
+    def client(self, **kwargs) -> AsyncElasticsearch:
+        return AsyncElasticsearch([FAKE_HOST], node_class=self.node_class, **kwargs)
+
+    # Fault injection
+
+    def start_outage(self, duration: Optional[float] = None, status: Optional[int] = None):
+        """Fail every request until end_outage or for duration seconds.
+
+        Without status the node is unreachable (connection errors); with one, such as
+        503, it answers every request with that status.
+        """
+        self._outage_until = math.inf if duration is None else time.monotonic() + duration
+        self._outage_status = status
+
+    def end_outage(self):
+        self._outage_until = None
+
+    @property
+    def in_outage(self) -> bool:
+        if self._outage_until is None:
+            return False
+        if time.monotonic() >= self._outage_until:
+            self._outage_until = None
+            return False
+        return True
+
+    # Request handling
+
+    async def handle(self, method: str, target: str, body: Optional[bytes],
+                     request_timeout: Any = None) -> Tuple[int, Any, float]:
+        """Serve one request; returns the status, the response body and the simulated latency in seconds"""
+        self.stats["requests"] += 1
+        if self.in_outage:
+            self.stats["requests_failed"] += 1
+            if self._outage_status is None:
+                raise TransportConnectionError("Fake Elasticsearch is unreachable")
+            error = _EsError(self._outage_status, "unavailable_exception", "Fake Elasticsearch is unavailable")
+            return error.status, error.body(), 0.0
+
+        split = urlsplit(target)
+        segments = tuple(unquote(part) for part in split.path.split("/") if part)
+        params = dict(parse_qsl(split.query, keep_blank_values=True))
+        handler, variables = self._route(method, segments)
+        if handler is None:
+            return 400, {"error": f"no handler found for uri [{split.path}] and method [{method}]", "status": 400}, 0.0
+
+        lines = None
+        docs = 1
+        if handler in (self._bulk, self._msearch):
+            lines = [json.loads(line) for line in (body or b"").splitlines() if line.strip()]
+            docs = len(lines) // 2 if handler == self._msearch else sum(
+                1 for line in lines if len(line) == 1 and next(iter(line)) in ("index", "create", "delete", "update")
+            )
+            payload = lines
+        else:
+            payload = json.loads(body) if body else {}
+
+        if handler in (self._bulk, self._search, self._msearch, self._index_doc, self._create_doc):
+            if self.request_reject_rate and self.rng.random() < self.request_reject_rate:
+                self.stats["requests_rejected"] += 1
+                error = _EsError(REJECTED_STATUS, REJECTED_ERROR_TYPE, "rejected execution: queue capacity reached")
+                return error.status, error.body(), 0.0
+
+        latency_model = self.bulk_latency if handler == self._bulk and self.bulk_latency else self.latency
+        latency = max(latency_model(self.rng, docs), 0.0) / 1000 if latency_model else 0.0
+        timeout = request_timeout if isinstance(request_timeout, (int, float)) else None
+
+        admitted = docs
+        if handler == self._bulk:
+            self.stats["bulk_requests"] += 1
+            if self.bulk_queue_docs is not None:
+                admitted = max(0, min(docs, self.bulk_queue_docs - self.bulk_in_flight_docs))
+            self.bulk_in_flight_docs += admitted
+        try:
+            if timeout is not None and latency > timeout:
+                await asyncio.sleep(timeout)
+                raise ConnectionTimeout(f"Fake Elasticsearch timed out after {timeout}s")
+            if latency:
+                await asyncio.sleep(latency)
+            try:
+                if handler == self._bulk:
+                    status, response = handler(variables, params, payload, admitted)
+                else:
+                    status, response = handler(variables, params, payload)
+            except _EsError as e:
+                return e.status, e.body(), latency
+        finally:
+            if handler == self._bulk:
+                self.bulk_in_flight_docs -= admitted
+        if isinstance(response, dict) and "took" in response:
+            response["took"] = int(latency * 1000)
+        return status, response, latency
+
+    def _route(self, method: str, segments: Tuple[str, ...]):
+        for route_method, pattern, handler in self._routes:
+            if route_method != method or len(pattern) != len(segments):
+                continue
+            variables = {}
+            for expected, actual in zip(pattern, segments):
+                if expected.startswith("{"):
+                    # Index names never start with an underscore, which keeps them apart from API paths
+                    if expected == "{index}" and actual.startswith("_"):
+                        break
+                    variables[expected[1:-1]] = actual
+                elif expected != actual:
+                    break
+            else:
+                return handler, variables
+        return None, {}
+
+    # Index resolution
+
+    def resolve(self, expression: Optional[str], ignore_unavailable: bool = False,
+                include_closed: bool = False) -> List[str]:
+        """Concrete index names for a comma-separated expression with wildcards and -exclusions"""
+        if not expression or expression in ("_all", "*"):
+            expression = "*"
+        names: List[str] = []
+        for part in expression.split(","):
+            if part.startswith("-") and names:
+                names = [name for name in names if not fnmatch.fnmatchcase(name, part[1:])]
+            elif "*" in part or "?" in part:
+                names.extend(
+                    name for name in sorted(self.indices)
+                    if fnmatch.fnmatchcase(name, part) and name not in names
+                    and (include_closed or not self.indices[name].closed)
+                )
+            elif part in self.indices:
+                if part not in names:
+                    names.append(part)
+            elif not ignore_unavailable:
+                raise _not_found(part)
+        return names
+
+    def _open_index(self, name: str) -> _Index:
+        index = self.indices.get(name)
+        if index is None:
+            raise _not_found(name)
+        if index.closed:
+            raise _EsError(400, "index_closed_exception", f"closed [{name}]")
+        return index
+
+    def _auto_create(self, name: str) -> _Index:
+        """The index a write goes to, created from the best matching template if missing"""
+        index = self.indices.get(name)
+        if index is not None:
+            return index
+        matching = [
+            template for template in self.templates.values()
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in template["index_patterns"])
+        ]
+        body: Dict[str, Any] = {}
+        if matching:
+            body = max(matching, key=lambda template: template.get("priority", 0)).get("template", {})
+        index = self.indices[name] = _Index(name, json.loads(json.dumps(body.get("mappings", {}))), body.get("settings"))
+        return index
+
+    # Documents
+
+    def _write(self, index: _Index, doc_id: Optional[str], source: Dict[str, Any], params: Dict[str, Any],
+               create: bool = False) -> Tuple[int, Dict[str, Any]]:
+        if index.write_blocked:
+            if index.closed:
+                raise _EsError(400, "index_closed_exception", f"closed [{index.name}]")
+            raise _EsError(403, "cluster_block_exception",
+                           f"index [{index.name}] blocked by: [FORBIDDEN/8/index write (api)];")
+        if doc_id is None:
+            self._next_id += 1
+            doc_id = f"fake{self._next_id:016x}"
+        current = index.docs.get(doc_id)
+        if create and current is not None:
+            raise _EsError(409, "version_conflict_engine_exception",
+                           f"[{doc_id}]: version conflict, document already exists")
+        if "if_seq_no" in params or "if_primary_term" in params:
+            if current is None or current["_seq_no"] != int(params.get("if_seq_no", -1)) \
+                    or int(params.get("if_primary_term", 1)) != 1:
+                raise _EsError(409, "version_conflict_engine_exception",
+                               f"[{doc_id}]: version conflict, required seqNo [{params.get('if_seq_no')}]")
+
+        index.seq_no += 1
+        version = current["_version"] + 1 if current else 1
+        index.docs[doc_id] = {
+            "_source": source, "_seq_no": index.seq_no, "_version": version, "_routing": params.get("routing"),
+        }
+        self.stats["docs_indexed"] += 1
+        return (200 if current else 201), {
+            "_index": index.name,
+            "_id": doc_id,
+            "_version": version,
+            "result": "updated" if current else "created",
+            "_shards": {"total": 1, "successful": 1, "failed": 0},
+            "_seq_no": index.seq_no,
+            "_primary_term": 1,
+        }
+
+    def _index_doc(self, variables, params, body):
+        create = params.get("op_type") == "create"
+        return self._write(self._auto_create(variables["index"]), variables.get("id"), body, params, create)
+
+    def _create_doc(self, variables, params, body):
+        return self._write(self._auto_create(variables["index"]), variables["id"], body, params, create=True)
+
+    def _update_doc(self, variables, params, body):
+        """Partial update: merge `doc` into the stored source, or create it with doc_as_upsert"""
+        doc_id = variables["id"]
+        index = self.indices.get(variables["index"])
+        current = index.docs.get(doc_id) if index is not None else None
+        if current is None and not body.get("doc_as_upsert"):
+            raise _EsError(404, "document_missing_exception", f"[{doc_id}]: document missing")
+        source = dict(current["_source"]) if current is not None else {}
+        source.update(body.get("doc") or {})
+        return self._write(self._auto_create(variables["index"]), doc_id, source, params)
+
+    def _delete_by_query(self, variables, params, body):
+        names = self._search_names(variables["index"], params)
+        now_ms = self._now_ms()
+        query = body.get("query") or {}
+        _validate(query)
+        deleted = 0
+        for name in names:
+            index = self.indices[name]
+            for doc_id, doc in list(index.docs.items()):
+                if self._score(query, doc["_source"], doc_id, now_ms) is not None:
+                    del index.docs[doc_id]
+                    index.seq_no += 1
+                    deleted += 1
+        return 200, {"took": 0, "timed_out": False, "total": deleted, "deleted": deleted, "failures": []}
+
+    def _get_doc(self, variables, params, body):
+        index = self._open_index(variables["index"])
+        doc = index.docs.get(variables["id"])
+        if doc is None:
+            return 404, {"_index": index.name, "_id": variables["id"], "found": False}
+        return 200, {
+            "_index": index.name,
+            "_id": variables["id"],
+            "_version": doc["_version"],
+            "_seq_no": doc["_seq_no"],
+            "_primary_term": 1,
+            "found": True,
+            "_source": doc["_source"],
+        }
+
+    def _delete_doc(self, variables, params, body):
+        index = self._open_index(variables["index"])
+        doc_id = variables["id"]
+        current = index.docs.get(doc_id)
+        if current is None:
+            return 404, {"_index": index.name, "_id": doc_id, "result": "not_found"}
+        if "if_seq_no" in params and current["_seq_no"] != int(params["if_seq_no"]):
+            raise _EsError(409, "version_conflict_engine_exception",
+                           f"[{doc_id}]: version conflict, required seqNo [{params['if_seq_no']}]")
+        del index.docs[doc_id]
+        index.seq_no += 1
+        return 200, {"_index": index.name, "_id": doc_id, "_version": current["_version"] + 1,
+                     "result": "deleted", "_seq_no": index.seq_no, "_primary_term": 1}
+
+    def _bulk(self, variables, params, lines, admitted):
+        items = []
+        errors = False
+        position = 0
+        seen = 0
+        while position < len(lines):
+            action, meta = next(iter(lines[position].items()))
+            position += 1
+            source = None
+            if action != "delete":
+                source = lines[position] if position < len(lines) else {}
+                position += 1
+            index_name = meta.get("_index") or variables.get("index")
+            seen += 1
+
+            if seen > admitted or (self.bulk_reject_rate and self.rng.random() < self.bulk_reject_rate):
+                self.stats["items_rejected"] += 1
+                errors = True
+                items.append({action: {
+                    "_index": index_name,
+                    "_id": meta.get("_id"),
+                    "status": REJECTED_STATUS,
+                    "error": {"type": REJECTED_ERROR_TYPE,
+                              "reason": "rejected execution of coordinating operation: write queue is full"},
+                }})
+                continue
+
+            try:
+                if action in ("index", "create"):
+                    item_params = {"routing": meta["routing"]} if "routing" in meta else {}
+                    status, result = self._write(
+                        self._auto_create(index_name), meta.get("_id"), source, item_params, create=action == "create"
+                    )
+                elif action == "delete":
+                    status, result = self._delete_doc({"index": index_name, "id": meta.get("_id")}, {}, None)
+                else:
+                    raise _EsError(400, "illegal_argument_exception", f"Unsupported bulk action [{action}]")
+                result["status"] = status
+                if status >= 300:
+                    errors = True
+            except _EsError as e:
+                errors = True
+                result = {"_index": index_name, "_id": meta.get("_id"), "status": e.status,
+                          "error": {"type": e.error_type, "reason": e.reason}}
+            items.append({action: result})
+        return 200, {"took": 0, "errors": errors, "items": items}
+
+    # Search
+
+    def _now_ms(self) -> int:
+        return int(self.clock() * 1000)
+
+    def _score(self, query: Dict[str, Any], source: Dict[str, Any], doc_id: str, now_ms: int) -> Optional[float]:
+        """Relevance of a document for a query, or None when it does not match"""
+        if not query:
+            return 1.0
+        (kind, spec), = query.items()
+
+        if kind == "match_all":
+            return 1.0
+        if kind == "bool":
+            score = 0.0
+            for clause in _as_list(spec.get("must")):
+                clause_score = self._score(clause, source, doc_id, now_ms)
+                if clause_score is None:
+                    return None
+                score += clause_score
+            for clause in _as_list(spec.get("filter")):
+                if self._score(clause, source, doc_id, now_ms) is None:
+                    return None
+            for clause in _as_list(spec.get("must_not")):
+                if self._score(clause, source, doc_id, now_ms) is not None:
+                    return None
+            should = [self._score(clause, source, doc_id, now_ms) for clause in _as_list(spec.get("should"))]
+            matched = [clause_score for clause_score in should if clause_score is not None]
+            required = spec.get("minimum_should_match")
+            if required is None:
+                required = 0 if spec.get("must") or spec.get("filter") else (1 if should else 0)
+            if len(matched) < int(required):
+                return None
+            return score + sum(matched) or 1.0
+        if kind == "term":
+            (field, value), = spec.items()
+            if isinstance(value, dict):
+                value = value.get("value")
+            return 1.0 if any(_equals(v, value) for v in _field_values(source, field)) else None
+        if kind == "terms":
+            (field, values), = ((k, v) for k, v in spec.items() if k != "boost")
+            return 1.0 if any(_equals(v, expected) for v in _field_values(source, field) for expected in values) else None
+        if kind == "ids":
+            return 1.0 if doc_id in spec.get("values", []) else None
+        if kind == "exists":
+            return 1.0 if _field_values(source, spec["field"]) else None
+        if kind == "range":
+            (field, bounds), = spec.items()
+            for value in _field_values(source, field):
+                value = _comparable(value, now_ms)
+                if all(_in_range(value, op, _comparable(bound, now_ms)) for op, bound in bounds.items()
+                       if op in ("gt", "gte", "lt", "lte")):
+                    return 1.0
+            return None
+        if kind in ("prefix", "wildcard"):
+            (field, value), = spec.items()
+            if isinstance(value, dict):
+                value = value.get("value")
+            pattern = f"{value}*" if kind == "prefix" else value
+            return 1.0 if any(fnmatch.fnmatchcase(str(v), pattern) for v in _field_values(source, field)) else None
+        if kind in ("match", "match_phrase"):
+            (field, value), = spec.items()
+            options = value if isinstance(value, dict) else {"query": value}
+            return _text_score(options["query"], [field], source, options.get("operator", "or"),
+                               phrase=kind == "match_phrase")
+        if kind == "multi_match":
+            return _text_score(spec["query"], spec.get("fields"), source, spec.get("operator", "or"))
+        raise _EsError(400, "parsing_exception", f"unknown query [{kind}]")
+
+    def _query(self, names: List[str], body: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one search body over the given indices"""
+        now_ms = self._now_ms()
+        query = body.get("query") or {}
+        _validate(query)
+        matches = []
+        for name in names:
+            index = self.indices[name]
+            routing = params.get("routing")
+            for doc_id, doc in index.docs.items():
+                if routing is not None and index.shard_of(doc_id, doc["_routing"]) != index.shard_of(doc_id, routing):
+                    continue
+                score = self._score(query, doc["_source"], doc_id, now_ms)
+                if score is not None:
+                    matches.append((name, doc_id, doc, score))
+
+        sort = [_sort_spec(item) for item in _as_list(body.get("sort", params.get("sort")))]
+        if sort:
+            keyed = [(match, [
+                match[3] if field == "_score" else _sort_value(match[2]["_source"], field, now_ms)
+                for field, _ in sort
+            ]) for match in matches]
+            keyed.sort(key=cmp_to_key(lambda a, b: _compare(a[1], b[1], sort)))
+        else:
+            keyed = [(match, None) for match in sorted(matches, key=lambda match: -match[3])]
+
+        start = int(body.get("from", params.get("from", 0)))
+        size = int(body.get("size", params.get("size", 10)))
+        hits = []
+        for (name, doc_id, doc, score), sort_values in keyed[start:start + size]:
+            hit = {"_index": name, "_id": doc_id, "_score": None if sort else score, "_source": doc["_source"]}
+            if doc["_routing"] is not None:
+                hit["_routing"] = doc["_routing"]
+            if sort:
+                hit["sort"] = sort_values
+            hits.append(hit)
+
+        total = len(matches)
+        track = body.get("track_total_hits", params.get("track_total_hits", 10_000))
+        hits_section: Dict[str, Any] = {
+            "max_score": None if sort or not matches else max(match[3] for match in matches),
+            "hits": hits,
+        }
+        if track is not False and str(track).lower() != "false":
+            limit = math.inf if track is True or str(track).lower() == "true" else int(track)
+            hits_section["total"] = {"value": min(total, limit), "relation": "eq" if total <= limit else "gte"}
+
+        shards = sum(self.indices[name].shards for name in names)
+        response = {
+            "took": 0,
+            "timed_out": False,
+            "_shards": {"total": shards, "successful": shards, "skipped": 0, "failed": 0},
+            "hits": hits_section,
+        }
+        aggs = body.get("aggs") or body.get("aggregations")
+        if aggs:
+            response["aggregations"] = _aggregate(aggs, [match[2]["_source"] for match in matches], now_ms)
+        if body.get("profile") or _bool_param(params.get("profile", "false")):
+            response["profile"] = {"shards": [
+                {"id": f"[{self.node_name}][{name}][{shard}]", "searches": [], "aggregations": []}
+                for name in names for shard in range(self.indices[name].shards)
+            ]}
+        return response
+
+    def _search_names(self, expression: Optional[str], params: Dict[str, Any]) -> List[str]:
+        names = self.resolve(expression, ignore_unavailable=_bool_param(params.get("ignore_unavailable", "false")))
+        for name in names:
+            self._open_index(name)
+        return names
+
+    def _search(self, variables, params, body):
+        return 200, self._query(self._search_names(variables.get("index"), params), body, params)
+
+    def _msearch(self, variables, params, lines):
+        responses = []
+        for header, body in zip(lines[0::2], lines[1::2]):
+            search_params = dict(params, **{k: v for k, v in header.items() if k != "index"})
+            expression = header.get("index", variables.get("index"))
+            if isinstance(expression, list):
+                expression = ",".join(expression)
+            try:
+                response = self._query(self._search_names(expression, search_params), body, search_params)
+                response["status"] = 200
+            except _EsError as e:
+                response = e.body()
+            responses.append(response)
+        return 200, {"took": 0, "responses": responses}
+
+    # Index admin
+
+    def _info(self, variables, params, body):
+        return 200, {
+            "name": self.node_name,
+            "cluster_name": "fake",
+            "version": {"number": VERSION},
+            "tagline": "You Know, for Search",
+        }
+
+    def _acknowledge(self, variables, params, body):
+        if "index" in variables:
+            self.resolve(variables["index"])
+        return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def _index_exists(self, variables, params, body):
+        try:
+            return (200 if self.resolve(variables["index"], include_closed=True) else 404), {}
+        except _EsError:
+            return 404, {}
+
+    def _create_index(self, variables, params, body):
+        name = variables["index"]
+        if name in self.indices:
+            raise _EsError(400, "resource_already_exists_exception", f"index [{name}] already exists")
+        self.indices[name] = _Index(name, body.get("mappings"), body.get("settings"))
+        return 200, {"acknowledged": True, "shards_acknowledged": True, "index": name}
+
+    def _delete_index(self, variables, params, body):
+        for name in self.resolve(variables["index"], include_closed=True):
+            del self.indices[name]
+        return 200, {"acknowledged": True}
+
+    def _close(self, variables, params, body):
+        names = self.resolve(variables["index"])
+        for name in names:
+            self.indices[name].settings["index.verified_before_close"] = "true"
+        return 200, {"acknowledged": True, "shards_acknowledged": True,
+                     "indices": {name: {"closed": True} for name in names}}
+
+    def _open(self, variables, params, body):
+        for name in self.resolve(variables["index"], include_closed=True):
+            self.indices[name].settings.pop("index.verified_before_close", None)
+        return 200, {"acknowledged": True, "shards_acknowledged": True}
+
+    def _forcemerge(self, variables, params, body):
+        shards = sum(self.indices[name].shards for name in self.resolve(variables["index"]))
+        return 200, {"_shards": {"total": shards, "successful": shards, "failed": 0}}
+
+    def _get_settings(self, variables, params, body):
+        expand = params.get("expand_wildcards", "open")
+        names = self.resolve(variables.get("index"), include_closed="closed" in expand or expand == "all")
+        flat = _bool_param(params.get("flat_settings", "false"))
+        return 200, {
+            name: {"settings": dict(self.indices[name].settings) if flat else _nest(self.indices[name].settings)}
+            for name in names
+        }
+
+    def _put_settings(self, variables, params, body):
+        settings = _normalize_settings(body.get("settings", body))
+        for name in self.resolve(variables["index"]):
+            index_settings = self.indices[name].settings
+            for key, value in settings.items():
+                if value is None:
+                    index_settings.pop(key, None)
+                else:
+                    index_settings[key] = value
+        return 200, {"acknowledged": True}
+
+    def _get_mapping(self, variables, params, body):
+        names = self.resolve(variables["index"], include_closed=True)
+        return 200, {name: {"mappings": self.indices[name].mappings} for name in names}
+
+    def _put_mapping(self, variables, params, body):
+        names = self.resolve(variables["index"])
+        for name in names:
+            existing = self.indices[name].mappings.get("properties", {})
+            for field, mapping in body.get("properties", {}).items():
+                old_type = existing.get(field, {}).get("type", "object")
+                new_type = mapping.get("type", "object")
+                if field in existing and old_type != new_type:
+                    raise _EsError(400, "illegal_argument_exception",
+                                   f"mapper [{field}] cannot be changed from type [{old_type}] to [{new_type}]")
+        for name in names:
+            mappings = self.indices[name].mappings
+            mappings.setdefault("properties", {}).update(json.loads(json.dumps(body.get("properties", {}))))
+            mappings.update({key: value for key, value in body.items() if key != "properties"})
+        return 200, {"acknowledged": True}
+
+    def _shrink(self, variables, params, body):
+        source = self._open_index(variables["index"])
+        target = variables["target"]
+        if target in self.indices:
+            raise _EsError(400, "resource_already_exists_exception", f"index [{target}] already exists")
+        if source.settings.get("index.blocks.write") != "true":
+            raise _EsError(400, "illegal_state_exception",
+                           f"index {source.name} must be read-only to resize index. use \"index.blocks.write=true\"")
+        settings = {key: value for key, value in source.settings.items() if key != "index.number_of_shards"}
+        for key, value in _normalize_settings(body.get("settings")).items():
+            if value is None:
+                settings.pop(key, None)
+            else:
+                settings[key] = value
+        shrunk = _Index(target, json.loads(json.dumps(source.mappings)), settings)
+        if source.shards % shrunk.shards:
+            raise _EsError(400, "illegal_argument_exception",
+                           f"the number of source shards [{source.shards}] must be a multiple of [{shrunk.shards}]")
+        shrunk.docs = {doc_id: dict(doc) for doc_id, doc in source.docs.items()}
+        shrunk.seq_no = source.seq_no
+        self.indices[target] = shrunk
+        return 200, {"acknowledged": True, "shards_acknowledged": True, "index": target}
+
+    def _put_template(self, variables, params, body):
+        self.templates[variables["name"]] = {
+            "index_patterns": _as_list(body.get("index_patterns")),
+            "template": body.get("template", {}),
+            "priority": body.get("priority", 0),
+            "composed_of": body.get("composed_of", []),
+        }
+        return 200, {"acknowledged": True}
+
+    def _template_names(self, name: str) -> List[str]:
+        names = [n for n in sorted(self.templates) if fnmatch.fnmatchcase(n, name)]
+        if not names:
+            raise _EsError(404, "resource_not_found_exception", f"index template matching [{name}] not found")
+        return names
+
+    def _get_template(self, variables, params, body):
+        return 200, {"index_templates": [
+            {"name": name, "index_template": self.templates[name]} for name in self._template_names(variables["name"])
+        ]}
+
+    def _template_exists(self, variables, params, body):
+        return (200 if variables["name"] in self.templates else 404), {}
+
+    def _delete_template(self, variables, params, body):
+        for name in self._template_names(variables["name"]):
+            del self.templates[name]
+        return 200, {"acknowledged": True}
+
+    def _cluster_health(self, variables, params, body):
+        names = self.resolve(variables.get("index"), ignore_unavailable=True, include_closed=True)
+        shards = sum(self.indices[name].shards for name in names)
+        missing = "index" in variables and not names
+        return (408 if missing else 200), {
+            "cluster_name": "fake",
+            "status": "red" if missing else "green",
+            "timed_out": missing,
+            "number_of_nodes": 1,
+            "number_of_data_nodes": 1,
+            "active_primary_shards": shards,
+            "active_shards": shards,
+            "relocating_shards": 0,
+            "initializing_shards": 0,
+            "unassigned_shards": 0,
+            "number_of_pending_tasks": 0,
+        }
+
+    def _cat_shards(self, variables, params, body):
+        rows = []
+        for name in self.resolve(variables.get("index"), include_closed=True):
+            index = self.indices[name]
+            counts = [0] * index.shards
+            for doc_id, doc in index.docs.items():
+                counts[index.shard_of(doc_id, doc["_routing"])] += 1
+            for shard, count in enumerate(counts):
+                rows.append({
+                    "index": name, "shard": str(shard), "prirep": "p", "state": "STARTED",
+                    "docs": str(count), "store": "0b", "ip": "127.0.0.1", "node": self.node_name,
+                })
+        columns = [column for column in params.get("h", "").split(",") if column]
+        if columns:
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return 200, rows
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _validate(query: Dict[str, Any]):
+    """Reject unknown query types up front, as Elasticsearch does when parsing"""
+    for kind, spec in query.items():
+        if kind not in _QUERIES:
+            raise _EsError(400, "parsing_exception", f"unknown query [{kind}]")
+        if kind == "bool":
+            for occur in ("must", "filter", "should", "must_not"):
+                for clause in _as_list(spec.get(occur)):
+                    _validate(clause)
+
+
+def _in_range(value: Any, op: str, bound: Any) -> bool:
+    try:
+        if op == "gt":
+            return value > bound
+        if op == "gte":
+            return value >= bound
+        if op == "lt":
+            return value < bound
+        return value <= bound
+    except TypeError:
+        return False
+
+
+def _text_score(query: Any, fields: Optional[Iterable[str]], source: Dict[str, Any], operator: str = "or",
+                phrase: bool = False) -> Optional[float]:
+    """Token overlap between an analyzed query and the fields, standing in for BM25"""
+    wanted = _tokens(query)
+    if not wanted:
+        return None
+    if fields:
+        values = [v for field in fields for v in _field_values(source, field.split("^")[0])]
+    else:
+        values = [v for v in source.values() if isinstance(v, str)]
+    tokens = [_tokens(value) for value in values]
+    if phrase:
+        size = len(wanted)
+        found = any(field[i:i + size] == wanted for field in tokens for i in range(len(field) - size + 1))
+        return float(size) if found else None
+    present = set(token for field in tokens for token in field)
+    matched = sum(1 for token in wanted if token in present)
+    if matched == 0 or (operator.lower() == "and" and matched < len(wanted)):
+        return None
+    return float(matched)
+
+
+def _sort_spec(item: Any) -> Tuple[str, str]:
+    if isinstance(item, str):
+        field, _, order = item.partition(":")
+        return field, order or ("desc" if field == "_score" else "asc")
+    (field, options), = item.items()
+    order = options.get("order", "asc") if isinstance(options, dict) else options
+    return field, order
+
+
+def _sort_value(source: Dict[str, Any], field: str, now_ms: int) -> Any:
+    values = _field_values(source, field)
+    # Dates sort, and come back in hit["sort"], as epoch millis like Elasticsearch returns them
+    return _comparable(values[0], now_ms) if values else None
+
+
+def _compare(a: List[Any], b: List[Any], sort: List[Tuple[str, str]]) -> int:
+    for left, right, (_, order) in zip(a, b, sort):
+        if left == right:
+            continue
+        # Missing values sort last in either direction
+        if left is None:
+            return 1
+        if right is None:
+            return -1
+        try:
+            result = -1 if left < right else 1
+        except TypeError:
+            result = -1 if str(left) < str(right) else 1
+        return -result if order == "desc" else result
+    return 0
+
+
+def _aggregate(aggs: Dict[str, Any], sources: List[Dict[str, Any]], now_ms: int) -> Dict[str, Any]:
+    results = {}
+    for name, spec in aggs.items():
+        sub_aggs = spec.get("aggs") or spec.get("aggregations")
+        kinds = [kind for kind in spec if kind not in ("aggs", "aggregations", "meta")]
+        if len(kinds) != 1:
+            raise _EsError(400, "parsing_exception", f"Expected one aggregation type for [{name}]")
+        kind = kinds[0]
+        options = spec[kind]
+        field = options.get("field")
+
+        if kind == "terms":
+            groups: Dict[Any, List[Dict[str, Any]]] = {}
+            for source in sources:
+                for key in dict.fromkeys(_field_values(source, field)):
+                    groups.setdefault(key, []).append(source)
+            order = options.get("order", {"_count": "desc"})
+            (order_by, direction), = (order if isinstance(order, dict) else order[0]).items()
+            buckets = sorted(groups.items(), key=lambda group: str(group[0]))
+            if order_by == "_count":
+                buckets.sort(key=lambda group: len(group[1]), reverse=direction == "desc")
+            elif direction == "desc":
+                buckets.reverse()
+            buckets = [bucket for bucket in buckets if len(bucket[1]) >= options.get("min_doc_count", 1)]
+            size = options.get("size", 10)
+            result_buckets = []
+            for key, members in buckets[:size]:
+                bucket = {"key": key, "doc_count": len(members)}
+                if sub_aggs:
+                    bucket.update(_aggregate(sub_aggs, members, now_ms))
+                result_buckets.append(bucket)
+            results[name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(len(members) for _, members in buckets[size:]),
+                "buckets": result_buckets,
+            }
+            continue
+
+        raw = [value for source in sources for value in _field_values(source, field)]
+        values = [_comparable(value, now_ms) for value in raw]
+        is_date = any(isinstance(value, str) and _DATE.match(value) for value in raw)
+        numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if kind in ("min", "max", "avg", "sum"):
+            if kind == "sum":
+                value = float(sum(numbers))
+            elif not numbers:
+                value = None
+            elif kind == "avg":
+                value = sum(numbers) / len(numbers)
+            else:
+                value = float(min(numbers) if kind == "min" else max(numbers))
+            result = {"value": value}
+            if is_date and value is not None and kind in ("min", "max"):
+                result["value_as_string"] = millis_to_iso(int(value)) + "Z"
+            results[name] = result
+        elif kind == "value_count":
+            results[name] = {"value": len(values)}
+        elif kind == "cardinality":
+            results[name] = {"value": len(set(map(str, values)))}
+        else:
+            raise _EsError(400, "parsing_exception", f"Unknown aggregation type [{kind}]")
+    return results
+
+
+class NodeResponse(NamedTuple):
+    """What a node's perform_request returns to the transport: response metadata and the raw body"""
+
+    meta: ApiResponseMeta
+    body: bytes
+
+
+class FakeNode(BaseAsyncNode):
+    """elastic_transport node that answers from a FakeCluster instead of the network"""
+
+    cluster: FakeCluster
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        if request_timeout is None or not isinstance(request_timeout, (int, float)):
+            request_timeout = self.config.request_timeout
+        status, response, latency = await self.cluster.handle(method, target, body, request_timeout)
+        return NodeResponse(
+            ApiResponseMeta(
+                status=status,
+                http_version="1.1",
+                headers=HttpHeaders({
+                    "content-type": "application/vnd.elasticsearch+json;compatible-with=8",
+                    "x-elastic-product": "Elasticsearch",
+                }),
+                duration=latency,
+                node=self.config,
+            ),
+            b"" if method == "HEAD" else json.dumps(response).encode(),
+        )
+
+    async def close(self):
+        pass
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import time
+from typing import Dict, Any, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class HealthMonitor:
+    """Probes Elasticsearch in the background so health endpoints answer from cache"""
+
+    def __init__(
+        self,
+        search_engine,
+        ingest_queue,
+        interval: Optional[float] = None,
+        max_queue_saturation: Optional[float] = None,
+    ):
+        self.search_engine = search_engine
+        self.ingest_queue = ingest_queue
+        self.interval = interval if interval is not None else float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "5"))
+        self.max_queue_saturation = (
+            max_queue_saturation
+            if max_queue_saturation is not None
+            else float(os.getenv("READINESS_MAX_QUEUE_SATURATION", "0.8"))
+        )
+        self.elasticsearch_reachable: Optional[bool] = None
+        self.last_probe: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe(self):
+        """Run one Elasticsearch probe and cache the result"""
+        self.elasticsearch_reachable = await self.search_engine.is_reachable(timeout=self.interval)
+        self.last_probe = time.time()
+
+    async def start(self):
+        """Probe once so readiness is known immediately, then keep probing in the background"""
+        await self.probe()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe()
+            except Exception as e:
+                self.elasticsearch_reachable = False
+                logger.error("Health probe failed", error=str(e))
+
+    @property
+    def elasticsearch_status(self) -> str:
+        if self.elasticsearch_reachable is None:
+            return "unknown"
+        return "connected" if self.elasticsearch_reachable else "unreachable"
+
+    def readiness(self) -> Dict[str, Any]:
+        """Readiness from cached probes: ES must be reachable and the ingest buffer not saturated"""
+        saturation = self.ingest_queue.saturation
+        ready = bool(self.elasticsearch_reachable) and saturation < self.max_queue_saturation
+        return {
+            "ready": ready,
+            "elasticsearch": self.elasticsearch_status,
+            "ingest_queue_saturation": round(saturation, 3),
+            "last_probe": self.last_probe,
+        }
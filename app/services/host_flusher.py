@@ -0,0 +1,150 @@
+import os
+import fcntl
+import asyncio
+from typing import Optional, Set
+
+import structlog
+
+from services.log_batch import LogBatch
+from services.loop_bound import loop_bound
+
+logger = structlog.get_logger()
+
+ACCEPTED = b"\x01"
+FULL = b"\x00"
+
+
+def _workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class HostFlushCoordinator:
+    """One bulk flusher per host when several worker processes serve HTTP.
+
+    The first worker to take an flock on the host lock file becomes the flusher and
+    listens on a Unix socket. The other workers forward their sealed batches to it, so
+    logs from all workers share bulk requests and the adaptive bulk limits. A worker
+    that cannot reach the flusher takes over the lock if it is free, and otherwise
+    flushes the batch itself.
+    """
+
+    def __init__(self, ingest_queue, directory: Optional[str] = None, enabled: Optional[bool] = None,
+                 connect_attempts: int = 3, full_retry_delay: float = 0.05):
+        self.ingest_queue = ingest_queue
+        self.enabled = enabled if enabled is not None else (
+            os.getenv("FLUSH_COORDINATION", "auto") == "on"
+            or (os.getenv("FLUSH_COORDINATION", "auto") == "auto" and _workers() > 1)
+        )
+        self.directory = directory or os.getenv("FLUSH_SOCKET_DIR", "/tmp/pay-log-aggregator")
+        self.lock_path = os.path.join(self.directory, "flusher.lock")
+        self.socket_path = os.path.join(self.directory, "flusher.sock")
+        self.connect_attempts = connect_attempts
+        self.full_retry_delay = full_retry_delay
+        self.is_leader = False
+        self.closed = False
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+
+    @loop_bound
+    def send_lock(self) -> asyncio.Lock:
+        return asyncio.Lock()
+
+    async def start(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        await self._try_lead()
+        logger.info("Host flush coordination started", leader=self.is_leader, pid=os.getpid())
+
+    async def _try_lead(self) -> bool:
+        """Take the host lock if nobody holds it and start accepting batches"""
+        if self.is_leader:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        # Any socket file left behind belongs to a flusher that is gone, since we hold the lock
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.is_leader = True
+        await self._disconnect()
+        return True
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while not self.closed:
+                length = int.from_bytes(await reader.readexactly(4), "little")
+                batch = LogBatch.from_bytes(await reader.readexactly(length))
+                if self.closed:
+                    # Shutting down: dropping the connection makes the sender flush the batch itself
+                    break
+                writer.write(ACCEPTED if self.ingest_queue.submit_batch(batch) else FULL)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def forward(self, batch: LogBatch) -> bool:
+        """Hand a batch to the host flusher; False means flush it locally instead"""
+        if not self.enabled or self.closed or self.is_leader:
+            return False
+        payload = batch.to_bytes()
+        frame = len(payload).to_bytes(4, "little") + payload
+
+        async with self.send_lock:
+            failures = 0
+            while not self.closed and failures < self.connect_attempts:
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                    self._writer.write(frame)
+                    await self._writer.drain()
+                    reply = await self._reader.readexactly(1)
+                except (OSError, asyncio.IncompleteReadError):
+                    failures += 1
+                    await self._disconnect()
+                    if await self._try_lead():
+                        return False
+                    await asyncio.sleep(self.full_retry_delay * failures)
+                    continue
+                if reply == ACCEPTED:
+                    return True
+                # The flusher's buffer is full; wait here so our own buffer fills and ingest pushes back
+                await asyncio.sleep(self.full_retry_delay)
+        return False
+
+    async def stop(self):
+        """Stop taking batches from other workers; anything not yet forwarded is flushed locally"""
+        self.closed = True
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        await self._disconnect()
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
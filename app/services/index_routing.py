@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+GROUP_NAME = re.compile(r"^[a-z0-9_]+$")
+
+
+class IndexGroup:
+    """A set of services/sources that share their own indices and shard sizing"""
+
+    __slots__ = ("name", "services", "sources", "shards", "replicas")
+
+    def __init__(
+        self,
+        name: Optional[str],
+        services: Optional[List[str]] = None,
+        sources: Optional[List[str]] = None,
+        shards: Optional[int] = None,
+        replicas: Optional[int] = None,
+    ):
+        if name is not None and not GROUP_NAME.match(name):
+            raise ValueError(f"Index group name '{name}' must match {GROUP_NAME.pattern}")
+        self.name = name
+        self.services = frozenset(services or ())
+        self.sources = frozenset(sources or ())
+        self.shards = shards
+        self.replicas = replicas
+
+    @property
+    def is_default(self) -> bool:
+        return self.name is None
+
+    def settings(self) -> Dict[str, Any]:
+        settings = {}
+        if self.shards is not None:
+            settings["number_of_shards"] = self.shards
+        if self.replicas is not None:
+            settings["number_of_replicas"] = self.replicas
+        return settings
+
+
+class IndexRouter:
+    """Routes logs to index groups by service, then by source.
+
+    Rules come from INDEX_ROUTING_RULES, a JSON list such as
+    `[{"group": "payments", "services": ["payments"], "shards": 3}]`.
+    Logs matching no rule go to the default group, which keeps the base index name.
+
+    Logs written before a rule existed stay in the default group, so until
+    INDEX_ROUTING_TRANSITION_UNTIL (an ISO date, UTC) filtered searches read it as well.
+    """
+
+    def __init__(
+        self,
+        index_name: str,
+        rules: Optional[List[Dict[str, Any]]] = None,
+        transition_until: Optional[str] = None,
+    ):
+        self.index_name = index_name
+        if rules is None:
+            rules = json.loads(os.getenv("INDEX_ROUTING_RULES", "[]"))
+        if transition_until is None:
+            transition_until = os.getenv("INDEX_ROUTING_TRANSITION_UNTIL", "")
+        self.transition_until = (
+            datetime.fromisoformat(transition_until).replace(tzinfo=timezone.utc).timestamp()
+            if transition_until else 0.0
+        )
+
+        self.default_group = IndexGroup(
+            None,
+            shards=int(os.environ["INDEX_SHARDS"]) if "INDEX_SHARDS" in os.environ else None,
+            replicas=int(os.environ["INDEX_REPLICAS"]) if "INDEX_REPLICAS" in os.environ else None,
+        )
+        self.groups: List[IndexGroup] = []
+        self._by_service: Dict[str, IndexGroup] = {}
+        self._by_source: Dict[str, IndexGroup] = {}
+        for rule in rules:
+            group = IndexGroup(
+                rule["group"],
+                services=rule.get("services"),
+                sources=rule.get("sources"),
+                shards=rule.get("shards"),
+                replicas=rule.get("replicas"),
+            )
+            self.groups.append(group)
+            for service in group.services:
+                self._by_service.setdefault(service, group)
+            for source in group.sources:
+                self._by_source.setdefault(source, group)
+
+    @property
+    def all_groups(self) -> List[IndexGroup]:
+        return [self.default_group] + self.groups
+
+    def base_index(self, group: IndexGroup) -> str:
+        return self.index_name if group.is_default else f"{self.index_name}-{group.name}"
+
+    def group_for(self, source: Optional[str], service: Optional[str]) -> IndexGroup:
+        """Group a log is written to"""
+        if service is not None:
+            group = self._by_service.get(service)
+            if group is not None:
+                return group
+        if source is not None:
+            group = self._by_source.get(source)
+            if group is not None:
+                return group
+        return self.default_group
+
+    def groups_for_query(self, source: Optional[str] = None, service: Optional[str] = None) -> List[IndexGroup]:
+        """Smallest set of groups that can hold logs matching the filters"""
+        groups = self._routed_groups(source, service)
+        if self.default_group not in groups and time.time() < self.transition_until:
+            groups.insert(0, self.default_group)
+        return groups
+
+    def _routed_groups(self, source: Optional[str], service: Optional[str]) -> List[IndexGroup]:
+        if service is not None:
+            if service in self._by_service:
+                return [self._by_service[service]]
+            if source is not None:
+                return [self.group_for(source, service)]
+            # The service isn't claimed, so its logs sit in the default group or wherever their source routes
+            return [self.default_group] + [group for group in self.groups if group.sources]
+
+        if source is not None:
+            # Service rules take precedence, so any group routed by service may also hold this source
+            candidates = [self._by_source.get(source, self.default_group)]
+            candidates += [group for group in self.groups if group.services and group not in candidates]
+            return candidates
+
+        return self.all_groups
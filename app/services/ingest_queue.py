@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, Deque, Optional, Set
+
+import structlog
+
+from observability.metrics import MetricsCollector
+from services.log_batch import LogBatch
+from services.bulk_controller import AdaptiveBulkController
+from services.loop_bound import loop_bound
+
+logger = structlog.get_logger()
+
+
+class IngestQueue:
+    """Bounded buffer between the ingest endpoints and bulk indexing.
+
+    Logs are appended to a columnar LogBatch as they arrive; a batch is sealed when it
+    reaches the controller's bulk size in documents or bytes, or has waited flush_interval.
+    Sealed batches are flushed with as many bulk requests in flight as the controller allows,
+    and items Elasticsearch rejects for overload are retried with backoff. Alert rules are
+    matched as a batch is flushed.
+    """
+
+    def __init__(
+        self,
+        search_engine,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        controller: Optional[AdaptiveBulkController] = None,
+        alert_engine=None,
+        coordinator=None,
+    ):
+        self.search_engine = search_engine
+        self.alert_engine = alert_engine
+        # With several workers per host, sealed batches go to the host's flusher process
+        self.coordinator = coordinator
+        self.max_size = max_size or int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+        # batch_size is only the starting bulk size; the controller adapts it from there
+        self.controller = controller or AdaptiveBulkController(initial_docs=batch_size)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else float(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200")) / 1000
+        )
+        self._current: LogBatch = search_engine.new_batch()
+        self._current_started = 0.0
+        self._sealed: Deque[LogBatch] = deque()
+        self._size = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    @loop_bound
+    def wakeup(self) -> asyncio.Event:
+        return asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def saturation(self) -> float:
+        """Fraction of the buffer in use"""
+        return self._size / self.max_size
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by buffered logs"""
+        return self._current.nbytes + sum(batch.nbytes for batch in self._sealed)
+
+    def free_slots(self) -> int:
+        return self.max_size - self._size
+
+    def submit(self, doc: Dict[str, Any]) -> bool:
+        """Queue a log document; returns False when the buffer is full"""
+        if self._size >= self.max_size:
+            return False
+        first = not len(self._current)
+        self._current.append(doc)
+        self._added(1, first)
+        return True
+
+    def submit_batch(self, batch: LogBatch) -> bool:
+        """Queue a whole batch handed over by another worker; False when it does not fit"""
+        if self.free_slots() < len(batch):
+            return False
+        first = not len(self._current)
+        self._current.extend(batch)
+        self._added(len(batch), first)
+        return True
+
+    def _added(self, count: int, first: bool):
+        """Account for rows added to the open batch; seal it once full, or start its flush-interval clock"""
+        self._size += count
+        MetricsCollector.update_queue_size(count)
+        if (
+            len(self._current) >= self.controller.bulk_docs
+            or self._current.payload_bytes >= self.controller.bulk_bytes
+        ):
+            self._seal()
+        elif first:
+            self._current_started = time.monotonic()
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _seal(self):
+        self._sealed.append(self._current)
+        self._current = self.search_engine.new_batch()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the background flusher"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what is buffered and stop the flusher"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if len(self._current):
+            self._seal()
+        while self._sealed:
+            self._spawn(self._sealed.popleft(), await self.controller.acquire())
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _next_batch(self) -> LogBatch:
+        """Wait for a sealed batch, sealing the open one once it has waited flush_interval"""
+        while not self._sealed:
+            self.wakeup.clear()
+            if len(self._current):
+                remaining = self._current_started + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    self._seal()
+                    break
+                # Not wait_for: before Python 3.12 it can swallow a cancel that races with the wakeup,
+                # and stop() would then wait forever on a flusher with nothing left to flush
+                waiter = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait((waiter,), timeout=remaining)
+                finally:
+                    waiter.cancel()
+            else:
+                await self.wakeup.wait()
+        return self._sealed.popleft()
+
+    async def _run(self):
+        while True:
+            # Take a slot before a batch so cancellation never strands a batch already popped
+            epoch = await self.controller.acquire()
+            try:
+                batch = await self._next_batch()
+            except asyncio.CancelledError:
+                self.controller.release()
+                raise
+            self._spawn(batch, epoch)
+
+    def _spawn(self, batch: LogBatch, epoch: int):
+        task = asyncio.create_task(self._flush(batch, epoch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    def _evaluate_alerts(self, batch: LogBatch):
+        """Match alert rules in the process that indexes the batch, so with several workers the
+        host's flusher counts thresholds over all of their logs rather than each worker's share"""
+        if self.alert_engine is None or not self.alert_engine.rule_set.rules:
+            return
+        for doc in batch.column_docs():
+            self.alert_engine.evaluate(doc)
+
+    async def _flush(self, batch: LogBatch, epoch: int):
+        """Send one batch, retrying only the rejected rows; holds its in-flight slot throughout"""
+        try:
+            if self.coordinator is not None and await self.coordinator.forward(batch):
+                return
+            self._evaluate_alerts(batch)
+            rows = None
+            for attempt in range(self.controller.max_retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.controller.retry_delay(attempt))
+                    epoch = self.controller.epoch
+                started = time.monotonic()
+                if rows is None:
+                    result = await self.search_engine.index_logs_batch(batch)
+                else:
+                    result = await self.search_engine.index_logs_batch(batch, rows=rows)
+                latency = time.monotonic() - started
+                rows = result.get("rejected")
+                MetricsCollector.record_bulk(latency * 1000, len(rows or ()))
+
+                if rows:
+                    self.controller.on_rejected(epoch, len(rows))
+                    continue
+                if not result.get("success"):
+                    logger.error("Bulk flush failed", count=len(batch), error=result.get("error"))
+                else:
+                    self.controller.on_success(epoch, latency)
+                    if result.get("errors"):
+                        logger.warning("Bulk flush had item errors", count=len(batch), errors=result["errors"])
+                return
+
+            logger.error("Bulk items still rejected after retries, dropping", count=len(rows))
+        finally:
+            self.controller.release()
+            self._size -= len(batch)
+            MetricsCollector.update_queue_size(-len(batch))
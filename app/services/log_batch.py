@@ -0,0 +1,302 @@
+import sys
+import json
+import calendar
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from pydantic import TypeAdapter, ValidationError
+
+from models.log_schemas import LogEntry, LogLevel
+from services.metadata_policy import MetadataPolicy, HOT_FIELD
+
+LEVELS = [level.value for level in LogLevel]
+LEVEL_CODES = {name: code for code, name in enumerate(LEVELS)}
+LEVEL_JSON = [json.dumps(name).encode() for name in LEVELS]
+
+EPOCH = datetime(1970, 1, 1)
+
+# Fields stored in dedicated columns; anything else on a log goes to the extras buffer
+COLUMN_FIELDS = ("timestamp", "level", "message", "source", "service", "trace_id", "span_id", "correlation_id")
+
+IndexResolver = Callable[[int, str, Optional[str]], str]
+
+# Columns in the order they are laid out by LogBatch.to_bytes
+ARRAY_COLUMNS = (
+    "levels", "timestamps", "sources", "services", "correlation_ids",
+    "trace_id_ends", "span_id_ends", "message_ends", "extra_ends",
+)
+BUFFER_COLUMNS = ("ids", "messages", "extras")
+
+# Bulk action line plus the fixed fields of a document, used to estimate request size
+ROW_OVERHEAD_BYTES = 160
+
+
+def to_epoch_millis(value: Any) -> int:
+    """Epoch millis for a datetime, ISO string or number; naive datetimes are taken as UTC"""
+    if value is None:
+        value = datetime.utcnow()
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+
+
+def millis_to_iso(millis: int) -> str:
+    return (EPOCH + timedelta(milliseconds=millis)).isoformat(timespec="milliseconds")
+
+
+_log_entries = TypeAdapter(List[LogEntry])
+
+
+class LogEntriesError(ValueError):
+    """A batch-ingest body that is not a valid list of log entries"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def parse_log_entries(body: bytes, correlation_id: str) -> List[Dict[str, Any]]:
+    """Validate a JSON array of log entries into ingest documents; runs in the parse pool for large bodies"""
+    try:
+        entries = _log_entries.validate_json(body)
+    except ValidationError as e:
+        # Plain error dicts, so the error can cross back from a pool process
+        raise LogEntriesError(e.errors(include_url=False)) from None
+    documents = []
+    for entry in entries:
+        document = entry.model_dump()
+        document["correlation_id"] = correlation_id
+        documents.append(document)
+    return documents
+
+
+class LogBatch:
+    """Columnar buffer of logs waiting for a bulk flush.
+
+    Levels are one byte each, timestamps are epoch millis in an array, low-cardinality
+    string fields are dictionary-encoded per batch, and messages, trace/span ids and
+    extra fields are kept as pre-encoded JSON in contiguous buffers so a flush is
+    mostly byte concatenation.
+    """
+
+    __slots__ = (
+        "metadata_policy",
+        "levels",
+        "timestamps",
+        "sources",
+        "services",
+        "correlation_ids",
+        "ids",
+        "trace_id_ends",
+        "span_id_ends",
+        "messages",
+        "message_ends",
+        "extras",
+        "extra_ends",
+        "_strings",
+        "_string_codes",
+        "dropped_metadata_keys",
+    )
+
+    def __init__(self, metadata_policy: Optional[MetadataPolicy] = None):
+        self.metadata_policy = metadata_policy
+        self.levels = array("B")
+        self.timestamps = array("q")
+        self.sources = array("I")
+        self.services = array("I")
+        self.correlation_ids = array("I")
+        # Trace and span ids are near-unique per log, so they share one buffer instead of a dictionary
+        self.ids = bytearray()
+        self.trace_id_ends = array("I")
+        self.span_id_ends = array("I")
+        self.messages = bytearray()
+        self.message_ends = array("I")
+        self.extras = bytearray()
+        self.extra_ends = array("I")
+        # Code 0 is reserved for a missing value
+        self._strings: List[Optional[str]] = [None]
+        self._string_codes: Dict[str, int] = {}
+        self.dropped_metadata_keys = 0
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate buffer memory held by the batch"""
+        columns = (
+            self.levels, self.timestamps, self.sources, self.services, self.correlation_ids,
+            self.trace_id_ends, self.span_id_ends, self.message_ends, self.extra_ends,
+        )
+        strings = sum(sys.getsizeof(s) for s in self._strings if s is not None)
+        return (
+            sum(column.itemsize * len(column) for column in columns)
+            + len(self.messages)
+            + len(self.ids)
+            + len(self.extras)
+            + strings
+            + sys.getsizeof(self._string_codes)
+        )
+
+    @property
+    def payload_bytes(self) -> int:
+        """Estimated size of the bulk body this batch serializes to"""
+        return len(self.messages) + len(self.ids) + len(self.extras) + ROW_OVERHEAD_BYTES * len(self.levels)
+
+    def _encode(self, value: Optional[str], intern: bool = False) -> int:
+        if value is None:
+            return 0
+        code = self._string_codes.get(value)
+        if code is None:
+            code = len(self._strings)
+            # Low-cardinality fields are interned so they are shared across batches too
+            self._strings.append(sys.intern(value) if intern else value)
+            self._string_codes[value] = code
+        return code
+
+    def append(self, log: Union[LogEntry, Dict[str, Any]]):
+        """Add one log, applying the metadata limits"""
+        doc = log.model_dump() if isinstance(log, LogEntry) else log
+        level = doc["level"]
+
+        self.levels.append(LEVEL_CODES[getattr(level, "value", level)])
+        self.timestamps.append(to_epoch_millis(doc.get("timestamp")))
+        self.sources.append(self._encode(doc["source"], intern=True))
+        self.services.append(self._encode(doc.get("service"), intern=True))
+        self.correlation_ids.append(self._encode(doc.get("correlation_id")))
+
+        for field, ends in (("trace_id", self.trace_id_ends), ("span_id", self.span_id_ends)):
+            value = doc.get(field)
+            if value is not None:
+                self.ids += json.dumps(value, ensure_ascii=False).encode()
+            ends.append(len(self.ids))
+
+        self.messages += json.dumps(doc["message"], ensure_ascii=False).encode()
+        self.message_ends.append(len(self.messages))
+
+        extra = {key: value for key, value in doc.items() if key not in COLUMN_FIELDS and value is not None}
+        if self.metadata_policy is not None and "metadata" in extra:
+            metadata, hot, dropped = self.metadata_policy.apply(extra["metadata"])
+            extra["metadata"] = metadata
+            if hot:
+                extra[HOT_FIELD] = hot
+            self.dropped_metadata_keys += dropped
+        if extra:
+            # Stored without the surrounding braces so it splices straight into the document
+            self.extras += json.dumps(extra, default=str, ensure_ascii=False, separators=(",", ":"))[1:-1].encode()
+        self.extra_ends.append(len(self.extras))
+
+    def extend(self, other: "LogBatch"):
+        """Append every row of another batch; its metadata limits were already applied"""
+        codes = array("I", [0] + [self._encode(value, intern=True) for value in other._strings[1:]])
+        self.levels.extend(other.levels)
+        self.timestamps.extend(other.timestamps)
+        for column in ("sources", "services", "correlation_ids"):
+            getattr(self, column).extend(codes[code] for code in getattr(other, column))
+        for buffer, ends in (("ids", ("trace_id_ends", "span_id_ends")), ("messages", ("message_ends",)),
+                             ("extras", ("extra_ends",))):
+            base = len(getattr(self, buffer))
+            getattr(self, buffer).extend(getattr(other, buffer))
+            for column in ends:
+                getattr(self, column).extend(end + base for end in getattr(other, column))
+        self.dropped_metadata_keys += other.dropped_metadata_keys
+
+    def column_docs(self) -> Iterator[Dict[str, Any]]:
+        """Each row's column fields as a document, without metadata, e.g. for matching alert rules"""
+        for row in range(len(self.levels)):
+            id_start = self.span_id_ends[row - 1] if row else 0
+            trace_end = self.trace_id_ends[row]
+            message_start = self.message_ends[row - 1] if row else 0
+            yield {
+                "timestamp": millis_to_iso(self.timestamps[row]),
+                "level": LEVELS[self.levels[row]],
+                "message": json.loads(self.messages[message_start:self.message_ends[row]]),
+                "source": self._strings[self.sources[row]],
+                "service": self._strings[self.services[row]],
+                "trace_id": json.loads(self.ids[id_start:trace_end]) if trace_end > id_start else None,
+            }
+
+    def to_bytes(self) -> bytes:
+        """Compact encoding for handing a batch to another process on the same host"""
+        columns = [getattr(self, name).tobytes() for name in ARRAY_COLUMNS]
+        columns += [bytes(getattr(self, name)) for name in BUFFER_COLUMNS]
+        header = json.dumps({
+            "strings": self._strings[1:],
+            "dropped": self.dropped_metadata_keys,
+            "lengths": [len(column) for column in columns],
+        }).encode()
+        return len(header).to_bytes(4, "little") + header + b"".join(columns)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, metadata_policy: Optional[MetadataPolicy] = None) -> "LogBatch":
+        header_length = int.from_bytes(data[:4], "little")
+        header = json.loads(data[4:4 + header_length])
+        batch = cls(metadata_policy)
+        offset = 4 + header_length
+        for name, length in zip(ARRAY_COLUMNS + BUFFER_COLUMNS, header["lengths"]):
+            chunk = data[offset:offset + length]
+            offset += length
+            column = getattr(batch, name)
+            if isinstance(column, array):
+                column.frombytes(chunk)
+            else:
+                column.extend(chunk)
+        for value in header["strings"]:
+            batch._encode(value, intern=True)
+        batch.dropped_metadata_keys = header["dropped"]
+        return batch
+
+    def to_bulk_body(
+        self, resolve_index: IndexResolver, rows: Optional[Iterable[int]] = None, route_by_trace: bool = False
+    ) -> bytes:
+        """Serialize straight into a bulk NDJSON body, optionally only the given rows.
+
+        With route_by_trace, logs that carry a trace_id are routed by it so all logs of a
+        trace land on one shard.
+        """
+        strings = self._strings
+        encoded = [None] + [json.dumps(value, ensure_ascii=False).encode() for value in strings[1:]]
+        action_prefixes: Dict[str, bytes] = {}
+        body = bytearray()
+
+        for row in range(len(self.levels)) if rows is None else rows:
+            millis = self.timestamps[row]
+            source_code = self.sources[row]
+            service_code = self.services[row]
+
+            index = resolve_index(millis, strings[source_code], strings[service_code])
+            id_start = self.span_id_ends[row - 1] if row else 0
+            trace_end = self.trace_id_ends[row]
+            prefix = action_prefixes.get(index)
+            if prefix is None:
+                prefix = action_prefixes[index] = b'{"index":{"_index":' + json.dumps(index).encode()
+            body += prefix
+            if route_by_trace and trace_end > id_start:
+                body += b',"routing":' + self.ids[id_start:trace_end]
+            body += b"}}\n"
+
+            body += b'{"timestamp":"' + millis_to_iso(millis).encode()
+            body += b'","level":' + LEVEL_JSON[self.levels[row]]
+            message_start = self.message_ends[row - 1] if row else 0
+            body += b',"message":' + self.messages[message_start:self.message_ends[row]]
+            body += b',"source":' + encoded[source_code]
+            if service_code:
+                body += b',"service":' + encoded[service_code]
+            correlation_code = self.correlation_ids[row]
+            if correlation_code:
+                body += b',"correlation_id":' + encoded[correlation_code]
+            if trace_end > id_start:
+                body += b',"trace_id":' + self.ids[id_start:trace_end]
+            span_end = self.span_id_ends[row]
+            if span_end > trace_end:
+                body += b',"span_id":' + self.ids[trace_end:span_end]
+            extra_start = self.extra_ends[row - 1] if row else 0
+            extra_end = self.extra_ends[row]
+            if extra_end > extra_start:
+                body += b"," + self.extras[extra_start:extra_end]
+            body += b"}\n"
+
+        return bytes(body)
@@ -0,0 +1,30 @@
+from typing import Any, Callable, Optional
+
+
+class loop_bound:
+    """Like a property, but the asyncio primitive it returns is created on first access and kept.
+
+    Services are constructed at import time, before uvicorn starts its event loop, and on
+    Python 3.9 an asyncio Event, Lock or Semaphore binds to whichever loop is current when it
+    is created. Creating it on first use, from inside the running loop, binds it to the right one.
+
+    The value is stored as `_<name>` on the instance, so code that must not create it early
+    (e.g. a synchronous submit before the loop starts) can check `self._<name> is not None`.
+    """
+
+    def __init__(self, factory: Callable[[Any], Any]):
+        self.factory = factory
+        self.__doc__ = factory.__doc__
+        self.attr: Optional[str] = None
+
+    def __set_name__(self, owner, name: str):
+        self.attr = f"_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.attr, None)
+        if value is None:
+            value = self.factory(instance)
+            setattr(instance, self.attr, value)
+        return value
@@ -0,0 +1,142 @@
+import os
+import json
+from typing import Dict, Any, Optional, Tuple
+
+HOT_FIELD = "metadata_hot"
+
+# ES field types a hot key can be promoted to, with the Python coercion applied at ingest
+HOT_KEY_TYPES = {
+    "keyword": str,
+    "long": int,
+    "integer": int,
+    "double": float,
+    "float": float,
+    "boolean": bool,
+}
+
+# ES rejects the whole document when a value is out of range for its numeric field
+INTEGER_RANGES = {
+    "long": (-2 ** 63, 2 ** 63 - 1),
+    "integer": (-2 ** 31, 2 ** 31 - 1),
+}
+
+# The flattened type rejects documents nested deeper than its default depth_limit
+FLATTENED_DEPTH_LIMIT = 20
+
+
+def parse_hot_keys(spec: str) -> Dict[str, str]:
+    """Parse a `key:type,key:type` allow-list; keys without a type default to keyword"""
+    hot_keys = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, es_type = item.partition(":")
+        es_type = es_type.strip() or "keyword"
+        if es_type not in HOT_KEY_TYPES:
+            raise ValueError(f"Unsupported type '{es_type}' for hot metadata key '{key}'")
+        hot_keys[key.strip()] = es_type
+    return hot_keys
+
+
+class MetadataPolicy:
+    """Bounds free-form log metadata so it cannot grow the index mapping"""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        hot_keys: Optional[Dict[str, str]] = None,
+        max_keys: Optional[int] = None,
+        max_value_bytes: Optional[int] = None,
+    ):
+        self.mode = mode or os.getenv("METADATA_MODE", "flattened")
+        if self.mode not in ("flattened", "object"):
+            raise ValueError(f"Unsupported METADATA_MODE '{self.mode}'")
+        self.hot_keys = hot_keys if hot_keys is not None else parse_hot_keys(os.getenv("METADATA_HOT_KEYS", ""))
+        self.max_keys = max_keys if max_keys is not None else int(os.getenv("METADATA_MAX_KEYS", "32"))
+        self.max_value_bytes = (
+            max_value_bytes if max_value_bytes is not None else int(os.getenv("METADATA_MAX_VALUE_BYTES", "1024"))
+        )
+
+    def mapping_properties(self) -> Dict[str, Any]:
+        """Mapping fragment for the metadata fields"""
+        if self.mode == "flattened":
+            metadata_mapping = {"type": "flattened", "ignore_above": self.max_value_bytes}
+        else:
+            # The root mapping is not dynamic, so metadata has to opt back in for its keys to be mapped
+            metadata_mapping = {"type": "object", "dynamic": True}
+
+        return {
+            "metadata": metadata_mapping,
+            HOT_FIELD: {
+                "type": "object",
+                "dynamic": False,
+                "properties": {key: {"type": es_type} for key, es_type in self.hot_keys.items()},
+            },
+        }
+
+    def apply(self, metadata: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], int]:
+        """Enforce limits on a metadata dict.
+
+        Returns the bounded metadata, the promoted hot fields and the number of dropped keys.
+        """
+        if not metadata:
+            return metadata, {}, 0
+
+        bounded = {}
+        hot = {}
+        dropped = 0
+        for key, value in metadata.items():
+            if value is None:
+                continue
+            if len(bounded) >= self.max_keys:
+                dropped += 1
+                continue
+            value = self._bound_value(value)
+            bounded[key] = value
+
+            es_type = self.hot_keys.get(key)
+            if es_type is not None:
+                promoted = self._coerce(value, es_type)
+                if promoted is not None:
+                    hot[key] = promoted
+
+        return bounded, hot, dropped
+
+    def _bound_value(self, value: Any, depth: int = 1) -> Any:
+        if isinstance(value, str):
+            return self._truncate(value)
+        if isinstance(value, (bool, int, float)):
+            return value
+        if self.mode == "flattened" and depth < FLATTENED_DEPTH_LIMIT:
+            # A flattened field indexes nested leaves without adding sub-fields, so the structure is kept
+            if isinstance(value, dict):
+                return {key: self._bound_value(item, depth + 1) for key, item in value.items() if item is not None}
+            if isinstance(value, (list, tuple)):
+                return [self._bound_value(item, depth + 1) for item in value if item is not None]
+        # In object mode nested structures are kept as one opaque string so they never add sub-fields
+        return self._truncate(json.dumps(value, default=str, separators=(",", ":")))
+
+    def _truncate(self, value: str) -> str:
+        encoded = value.encode("utf-8")
+        if len(encoded) <= self.max_value_bytes:
+            return value
+        return encoded[:self.max_value_bytes].decode("utf-8", errors="ignore")
+
+    @staticmethod
+    def _coerce(value: Any, es_type: str) -> Any:
+        if es_type == "boolean" and isinstance(value, str):
+            lowered = value.lower()
+            if lowered in ("true", "false"):
+                return lowered == "true"
+            return None
+        if isinstance(value, (dict, list)):
+            return None
+        try:
+            coerced = HOT_KEY_TYPES[es_type](value)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        bounds = INTEGER_RANGES.get(es_type)
+        if bounds is not None and not bounds[0] <= coerced <= bounds[1]:
+            return None
+        return coerced
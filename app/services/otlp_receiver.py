@@ -0,0 +1,148 @@
+import json
+import gzip
+import zlib
+import base64
+import time
+from typing import Dict, Any, List, Tuple
+
+from models.log_schemas import LogLevel
+
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+JSON_CONTENT_TYPE = "application/json"
+
+SERVICE_NAME = "service.name"
+DEFAULT_SOURCE = "otlp"
+
+# OTLP severity numbers come in bands of four: TRACE, DEBUG, INFO, WARN, ERROR, FATAL
+_SEVERITY_BANDS = [
+    LogLevel.DEBUG, LogLevel.DEBUG, LogLevel.INFO, LogLevel.WARNING, LogLevel.ERROR, LogLevel.CRITICAL
+]
+_SEVERITY_TEXT = {
+    "TRACE": LogLevel.DEBUG,
+    "DEBUG": LogLevel.DEBUG,
+    "INFO": LogLevel.INFO,
+    "WARN": LogLevel.WARNING,
+    "WARNING": LogLevel.WARNING,
+    "ERROR": LogLevel.ERROR,
+    "FATAL": LogLevel.CRITICAL,
+    "CRITICAL": LogLevel.CRITICAL,
+}
+
+
+class OTLPDecodeError(ValueError):
+    """Raised when a request body is not a valid ExportLogsServiceRequest"""
+
+
+def _hex_ids_to_base64(node: Any):
+    """OTLP/JSON encodes trace and span ids as hex, protobuf's JSON mapping expects base64"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("traceId", "spanId") and isinstance(value, str) and value:
+                node[key] = base64.b64encode(bytes.fromhex(value)).decode()
+            else:
+                _hex_ids_to_base64(value)
+    elif isinstance(node, list):
+        for item in node:
+            _hex_ids_to_base64(item)
+
+
+def decode_request(body: bytes, content_type: str, content_encoding: str = ""):
+    """Parse an ExportLogsServiceRequest from protobuf or OTLP/JSON"""
+    # Imported on first use so the proto modules stay off the startup path
+    from google.protobuf import json_format
+    from google.protobuf.message import DecodeError
+    from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest
+
+    try:
+        if content_encoding.lower() == "gzip":
+            body = gzip.decompress(body)
+        request = ExportLogsServiceRequest()
+        if content_type.split(";")[0].strip().lower() == JSON_CONTENT_TYPE:
+            payload = json.loads(body)
+            _hex_ids_to_base64(payload)
+            json_format.ParseDict(payload, request, ignore_unknown_fields=True)
+        else:
+            request.ParseFromString(body)
+        return request
+    except (OSError, EOFError, zlib.error, ValueError, DecodeError, json_format.ParseError) as e:
+        raise OTLPDecodeError(str(e)) from e
+
+
+def encode_response(content_type: str) -> Tuple[bytes, str]:
+    """An empty ExportLogsServiceResponse in the encoding the client used"""
+    from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceResponse
+
+    if content_type.split(";")[0].strip().lower() == JSON_CONTENT_TYPE:
+        return b"{}", JSON_CONTENT_TYPE
+    return ExportLogsServiceResponse().SerializeToString(), PROTOBUF_CONTENT_TYPE
+
+
+def any_value(value) -> Any:
+    """Plain Python value of an OTLP AnyValue"""
+    kind = value.WhichOneof("value")
+    if kind is None:
+        return None
+    if kind == "array_value":
+        return [any_value(item) for item in value.array_value.values]
+    if kind == "kvlist_value":
+        return attributes(value.kvlist_value.values)
+    if kind == "bytes_value":
+        return base64.b64encode(value.bytes_value).decode()
+    return getattr(value, kind)
+
+
+def attributes(key_values) -> Dict[str, Any]:
+    return {kv.key: any_value(kv.value) for kv in key_values}
+
+
+def severity_level(severity_number: int, severity_text: str) -> LogLevel:
+    if 1 <= severity_number <= 24:
+        return _SEVERITY_BANDS[(severity_number - 1) // 4]
+    return _SEVERITY_TEXT.get(severity_text.upper(), LogLevel.INFO)
+
+
+def to_documents(request, correlation_id: str) -> List[Dict[str, Any]]:
+    """Flatten an ExportLogsServiceRequest into ingest documents.
+
+    service.name becomes service, the instrumentation scope becomes source, trace and span
+    ids are hex encoded, and all other resource and record attributes go to metadata.
+    """
+    now_millis = int(time.time() * 1000)
+    documents = []
+
+    for resource_logs in request.resource_logs:
+        resource = attributes(resource_logs.resource.attributes)
+        service = resource.pop(SERVICE_NAME, None)
+
+        for scope_logs in resource_logs.scope_logs:
+            source = scope_logs.scope.name or service or DEFAULT_SOURCE
+
+            for record in scope_logs.log_records:
+                body = any_value(record.body)
+                if not isinstance(body, str):
+                    body = "" if body is None else json.dumps(body, default=str)
+                record_attributes = attributes(record.attributes)
+                metadata = dict(resource, **record_attributes) if resource else record_attributes
+                timestamp = record.time_unix_nano or record.observed_time_unix_nano
+
+                document = {
+                    # Epoch millis go straight into the batch's timestamp column
+                    "timestamp": timestamp // 1_000_000 if timestamp else now_millis,
+                    "level": severity_level(record.severity_number, record.severity_text).value,
+                    "message": body,
+                    "source": source,
+                    "service": service,
+                    "trace_id": record.trace_id.hex() or None,
+                    "span_id": record.span_id.hex() or None,
+                    "correlation_id": correlation_id,
+                }
+                if metadata:
+                    document["metadata"] = metadata
+                documents.append(document)
+
+    return documents
+
+
+def decode_documents(body: bytes, content_type: str, content_encoding: str, correlation_id: str) -> List[Dict[str, Any]]:
+    """decode_request and to_documents in one call, so both can run in the parse pool"""
+    return to_documents(decode_request(body, content_type, content_encoding), correlation_id)
@@ -0,0 +1,40 @@
+import os
+import asyncio
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+
+class ParsePool:
+    """Optional process pool for CPU-heavy request parsing.
+
+    Off unless PARSE_POOL_WORKERS is set. Payloads smaller than PARSE_POOL_MIN_BYTES are
+    parsed inline, since shipping them to another process costs more than parsing them.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_bytes: Optional[int] = None):
+        self.workers = workers if workers is not None else int(os.getenv("PARSE_POOL_WORKERS", "0"))
+        self.min_bytes = min_bytes if min_bytes is not None else int(os.getenv("PARSE_POOL_MIN_BYTES", "65536"))
+        self._executor: Optional["ProcessPoolExecutor"] = None
+
+    @property
+    def executor(self) -> "ProcessPoolExecutor":
+        if self._executor is None:
+            # Imported here so a disabled pool never loads multiprocessing
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn, because forking a process that is running an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args, size: int = 0) -> Any:
+        """Call fn(*args) in the pool when enabled and the payload is large enough"""
+        if not self.workers or size < self.min_bytes:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
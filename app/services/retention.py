@@ -0,0 +1,245 @@
+import os
+import re
+import time
+import socket
+import asyncio
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional
+
+import structlog
+from elasticsearch import NotFoundError, ConflictError
+
+logger = structlog.get_logger()
+
+LOCK_INDEX = "pay-log-aggregator-locks"
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class LeaderLock:
+    """Lease kept as a document in Elasticsearch so only one replica holds it at a time"""
+
+    def __init__(self, client, name: str, ttl_seconds: float, holder: Optional[str] = None):
+        self.client = client
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _document(self) -> Dict[str, Any]:
+        return {"holder": self.holder, "expires_at": time.time() + self.ttl_seconds}
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; returns False while another holder's lease is live"""
+        try:
+            current = await self.client.get(index=LOCK_INDEX, id=self.name)
+        except NotFoundError:
+            try:
+                await self.client.index(
+                    index=LOCK_INDEX, id=self.name, document=self._document(), op_type="create", refresh=True
+                )
+                return True
+            except ConflictError:
+                return False
+
+        lease = current["_source"]
+        if lease.get("holder") != self.holder and lease.get("expires_at", 0) > time.time():
+            return False
+
+        try:
+            # Compare-and-set on the version we read, so two replicas can't both take an expired lease
+            await self.client.index(
+                index=LOCK_INDEX,
+                id=self.name,
+                document=self._document(),
+                if_seq_no=current["_seq_no"],
+                if_primary_term=current["_primary_term"],
+                refresh=True,
+            )
+            return True
+        except ConflictError:
+            return False
+
+    async def release(self):
+        """Drop the lease if we hold it"""
+        try:
+            current = await self.client.get(index=LOCK_INDEX, id=self.name)
+            if current["_source"].get("holder") == self.holder:
+                await self.client.delete(
+                    index=LOCK_INDEX,
+                    id=self.name,
+                    if_seq_no=current["_seq_no"],
+                    if_primary_term=current["_primary_term"],
+                )
+        except (NotFoundError, ConflictError):
+            pass
+
+
+class RetentionManager:
+    """Applies retention by dropping whole daily indices, never by deleting documents"""
+
+    def __init__(
+        self,
+        search_engine,
+        retention_days: Optional[int] = None,
+        action: Optional[str] = None,
+        interval_seconds: Optional[float] = None,
+        seal_after_days: Optional[int] = None,
+        force_merge: Optional[bool] = None,
+        shrink_shards: Optional[int] = None,
+        lock: Optional[LeaderLock] = None,
+    ):
+        self.search_engine = search_engine
+        self.client = search_engine.client
+        self.enabled = _env_bool("RETENTION_ENABLED", "true")
+        self.retention_days = retention_days if retention_days is not None else int(os.getenv("RETENTION_DAYS", "90"))
+        self.action = action or os.getenv("RETENTION_ACTION", "delete")
+        if self.action not in ("delete", "close"):
+            raise ValueError(f"Unsupported RETENTION_ACTION '{self.action}'")
+        self.interval_seconds = (
+            interval_seconds if interval_seconds is not None else float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+        )
+        self.seal_after_days = (
+            seal_after_days if seal_after_days is not None else int(os.getenv("RETENTION_SEAL_AFTER_DAYS", "2"))
+        )
+        self.force_merge = force_merge if force_merge is not None else _env_bool("RETENTION_FORCE_MERGE", "false")
+        self.shrink_shards = (
+            shrink_shards if shrink_shards is not None else int(os.getenv("RETENTION_SHRINK_SHARDS", "0"))
+        )
+        # The lease outlives one interval so the leader keeps it between runs
+        self.lock = lock or LeaderLock(self.client, "retention", ttl_seconds=self.interval_seconds * 2)
+        # Matches daily partitions of the default group and of every routed group
+        self._partition_pattern = re.compile(
+            rf"^{re.escape(search_engine.index_name)}-(?:[a-z0-9_]+-)?(\d{{4}}\.\d{{2}}\.\d{{2}})(-shrunk)?$"
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background loop"""
+        if not self.enabled:
+            logger.info("Retention manager disabled")
+            return
+        if not self.search_engine.partitioned:
+            logger.warning(
+                "Retention not enforced: INDEX_PARTITIONING is 'none' and documents are never deleted by query",
+                index=self.search_engine.index_name,
+            )
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background loop and hand the lease back"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.lock.release()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error("Retention run failed", error=str(e))
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self, today: Optional[date] = None) -> Dict[str, List[str]]:
+        """Run one retention pass if we are the leader"""
+        actions = {"expired": [], "merged": [], "shrink_prepared": [], "shrunk": []}
+        if not await self.lock.acquire():
+            return actions
+
+        today = today or datetime.utcnow().date()
+        settings = await self.client.indices.get_settings(
+            index=f"{self.search_engine.index_name}-*",
+            expand_wildcards="open,closed",
+            flat_settings=True,
+        )
+
+        for index, body in sorted(settings.items()):
+            match = self._partition_pattern.match(index)
+            if not match:
+                continue
+            index_settings = body.get("settings", {})
+            age_days = (today - datetime.strptime(match.group(1), "%Y.%m.%d").date()).days
+
+            try:
+                if age_days > self.retention_days:
+                    if await self._expire(index, index_settings):
+                        actions["expired"].append(index)
+                elif self.seal_after_days and age_days >= self.seal_after_days and not self._is_closed(index_settings):
+                    await self._optimize(index, index_settings, bool(match.group(2)), actions)
+            except Exception as e:
+                # One bad index must not hold up every partition after it
+                logger.error("Retention failed for index", index=index, error=str(e))
+
+        if any(actions.values()):
+            logger.info("Retention pass complete", **actions)
+        return actions
+
+    @staticmethod
+    def _is_closed(index_settings: Dict[str, Any]) -> bool:
+        return str(index_settings.get("index.verified_before_close", "false")) == "true"
+
+    async def _expire(self, index: str, index_settings: Dict[str, Any]) -> bool:
+        if self.action == "delete":
+            await self.client.indices.delete(index=index)
+            return True
+        if self._is_closed(index_settings):
+            return False
+        await self.client.indices.close(index=index)
+        return True
+
+    async def _optimize(self, index: str, index_settings: Dict[str, Any], shrunk: bool, actions: Dict[str, List[str]]):
+        """Seal an index that is no longer written to, then optionally merge and shrink it"""
+        write_blocked = str(index_settings.get("index.blocks.write", "false")) == "true"
+        shards = int(index_settings.get("index.number_of_shards", 1))
+
+        if not write_blocked:
+            if self.force_merge:
+                await self.client.indices.forcemerge(index=index, max_num_segments=1)
+                actions["merged"].append(index)
+            await self.client.indices.put_settings(index=index, settings={"index.blocks.write": True})
+            write_blocked = True
+
+        if shrunk or not self.shrink_shards or shards <= self.shrink_shards or shards % self.shrink_shards:
+            return
+
+        target = f"{index}-shrunk"
+        if await self.client.indices.exists(index=target):
+            # The day was already shrunk and this index was recreated by a late write; leave it sealed
+            return
+
+        # Shrinking needs a copy of every shard on one node; pin the index first and shrink on a later pass
+        pinned_node = index_settings.get("index.routing.allocation.require._name")
+        if not pinned_node:
+            shard_rows = await self.client.cat.shards(index=index, format="json", h="node,prirep")
+            node = next((row["node"] for row in shard_rows if row.get("prirep") == "p" and row.get("node")), None)
+            if node:
+                await self.client.indices.put_settings(
+                    index=index, settings={"index.routing.allocation.require._name": node}
+                )
+                actions["shrink_prepared"].append(index)
+            return
+
+        health = await self.client.cluster.health(index=index, wait_for_no_relocating_shards=True, timeout="1s")
+        if health.get("timed_out") or health.get("relocating_shards"):
+            return
+
+        await self.client.indices.shrink(
+            index=index,
+            target=target,
+            settings={
+                "index.number_of_shards": self.shrink_shards,
+                "index.routing.allocation.require._name": None,
+                "index.blocks.write": True,
+            },
+            wait_for_active_shards="all",
+        )
+        await self.client.indices.delete(index=index)
+        actions["shrunk"].append(index)
@@ -1,73 +1,305 @@
-from elasticsearch import AsyncElasticsearch
-from typing import List, Dict, Any
+from elasticsearch import AsyncElasticsearch, BadRequestError, NotFoundError
+from typing import List, Dict, Any, Optional, Sequence, Union
 import os
 import json
-from datetime import datetime
-from models.log_schemas import LogEntry, SearchQuery, LogSearchResponse, ErrorPattern
+import time
+import asyncio
+import hashlib
+import heapq
+import random
+from itertools import islice
+from datetime import datetime, timedelta
+
+import structlog
+
+from models.log_schemas import (
+    LogEntry, SearchQuery, LogSearchResponse, ErrorPattern, ErrorPatternsResponse, QueryProfile,
+    SpanLogs, TraceLogsResponse
+)
+from observability.metrics import MetricsCollector
+from services.metadata_policy import MetadataPolicy, HOT_FIELD
+from services.log_batch import LogBatch, to_epoch_millis
+from services.index_routing import IndexRouter, IndexGroup
+from services.bulk_controller import is_rejection, REJECTED_STATUS
+
+logger = structlog.get_logger()
+
 
 class SearchEngine:
-    def __init__(self):
+    def __init__(self, client: Optional[AsyncElasticsearch] = None):
         self.es_url = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
-        self.client = AsyncElasticsearch([self.es_url])
+        if client is None and self.es_url.startswith("fake://"):
+            # In-process stand-in for load and failure testing; imported only when asked for
+            from services.fake_elasticsearch import FakeCluster
+            client = FakeCluster.from_url(self.es_url).client()
+        self.client = client if client is not None else AsyncElasticsearch([self.es_url])
         self.index_name = "logs"
+        self.index_partitioning = os.getenv("INDEX_PARTITIONING", "none")
+        if self.index_partitioning not in ("none", "daily"):
+            raise ValueError(f"Unsupported INDEX_PARTITIONING '{self.index_partitioning}'")
+        self.metadata_policy = MetadataPolicy()
+        self.router = IndexRouter(self.index_name)
+        # Route logs by trace_id so a trace lookup reads one shard; only indices written with it on benefit
+        self.trace_routing = os.getenv("TRACE_ROUTING", "false").lower() in ("1", "true", "yes")
+        self.trace_max_logs = int(os.getenv("TRACE_MAX_LOGS", "1000"))
+        self.trace_window_padding = timedelta(seconds=float(os.getenv("TRACE_WINDOW_PADDING_SECONDS", "300")))
+        self.trace_lookback = timedelta(hours=float(os.getenv("TRACE_LOOKBACK_HOURS", "72")))
+        # Retention write-blocks partitions this many days old (0 never); late logs for them go to today's
+        retention_enabled = os.getenv("RETENTION_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.seal_after_days = int(os.getenv("RETENTION_SEAL_AFTER_DAYS", "2")) if retention_enabled else 0
     
-    async def initialize(self):
-        """Create index if it doesn't exist"""
-        if not await self.client.indices.exists(index=self.index_name):
-            mapping = {
-                "mappings": {
-                    "properties": {
-                        "timestamp": {"type": "date"},
-                        "level": {"type": "keyword"},
-                        "message": {"type": "text", "analyzer": "standard"},
-                        "source": {"type": "keyword"},
-                        "service": {"type": "keyword"},
-                        "trace_id": {"type": "keyword"},
-                        "span_id": {"type": "keyword"},
-                        "metadata": {"type": "object"}
-                    }
-                }
+    @property
+    def partitioned(self) -> bool:
+        return self.index_partitioning == "daily"
+    
+    @property
+    def search_index(self) -> str:
+        """Index expression covering every group and partition"""
+        if self.partitioned:
+            return f"{self.index_name}-*"
+        return ",".join(self.router.base_index(group) for group in self.router.all_groups)
+    
+    def group_index(self, group: IndexGroup) -> str:
+        """Index expression covering one group"""
+        base = self.router.base_index(group)
+        if not self.partitioned:
+            return base
+        if not group.is_default:
+            return f"{base}-*"
+        # Default partitions share the base prefix with the group indices, so exclude those
+        return ",".join([f"{base}-*"] + [f"-{self.router.base_index(other)}-*" for other in self.router.groups])
+    
+    def indices_for_window(self, start: datetime, end: datetime) -> str:
+        """Index expression limited to the daily partitions a time window touches"""
+        days = (end.date() - start.date()).days + 1
+        if not self.partitioned or days > 31:
+            return self.search_index
+        dates = [start + timedelta(days=offset) for offset in range(days)]
+        sealed_before = self._sealed_before_millis()
+        if sealed_before is not None and to_epoch_millis(start) < sealed_before:
+            # Late logs for sealed days were written to the partition of the day they arrived
+            today = datetime.utcnow()
+            if today.date() > end.date():
+                dates.append(today)
+        names = []
+        for group in self.router.all_groups:
+            base = self.router.base_index(group)
+            # Wildcard so a partition retention shrank to <name>-shrunk still matches
+            names.extend(f"{base}-{day:%Y.%m.%d}*" for day in dates)
+        return ",".join(names)
+    
+    def _sealed_before_millis(self) -> Optional[int]:
+        """Start of the oldest day retention still leaves writable, or None when nothing is sealed"""
+        if not self.partitioned or self.seal_after_days <= 0:
+            return None
+        today = int(time.time() * 1000) // 86_400_000
+        return (today - self.seal_after_days + 1) * 86_400_000
+    
+    def index_for(self, doc: Dict[str, Any]) -> str:
+        """Write index for a document; daily partitions are named <group index>-YYYY.MM.DD"""
+        if not self.partitioned:
+            return self.router.base_index(self.router.group_for(doc.get('source'), doc.get('service')))
+        return self.index_for_millis(to_epoch_millis(doc.get('timestamp')), doc.get('source'), doc.get('service'))
+    
+    def index_for_millis(self, timestamp_ms: int, source: str = None, service: str = None) -> str:
+        """Write index for a buffered log, keyed by its epoch-millis timestamp"""
+        base = self.router.base_index(self.router.group_for(source, service))
+        if not self.partitioned:
+            return base
+        sealed_before = self._sealed_before_millis()
+        if sealed_before is not None and timestamp_ms < sealed_before:
+            # Retention has write-blocked that day, so keep the late log in today's partition instead
+            timestamp_ms = int(time.time() * 1000)
+        day = datetime(1970, 1, 1) + timedelta(days=timestamp_ms // 86_400_000)
+        return f"{base}-{day:%Y.%m.%d}"
+    
+    def new_batch(self) -> LogBatch:
+        return LogBatch(self.metadata_policy)
+    
+    def _mappings(self) -> Dict[str, Any]:
+        """Index mappings; unknown top-level fields are kept in _source but never mapped"""
+        return {
+            "dynamic": False,
+            "properties": {
+                "timestamp": {"type": "date"},
+                "level": {"type": "keyword"},
+                "message": {
+                    "type": "text",
+                    "analyzer": "standard",
+                    "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}
+                },
+                "source": {"type": "keyword"},
+                "service": {"type": "keyword"},
+                "trace_id": {"type": "keyword"},
+                "span_id": {"type": "keyword"},
+                "correlation_id": {"type": "keyword"},
+                **self.metadata_policy.mapping_properties()
             }
-            await self.client.indices.create(index=self.index_name, body=mapping)
+        }
+    
+    def _index_body(self, group: IndexGroup) -> Dict[str, Any]:
+        """Mappings and settings for a group's indices"""
+        body = {"mappings": self._mappings()}
+        settings = group.settings()
+        if settings:
+            body["settings"] = settings
+        # Stored with the mapping so startup can tell whether setup is already done
+        body["mappings"]["_meta"] = {"mapping_hash": hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()}
+        return body
+    
+    async def is_reachable(self, timeout: float = 5.0) -> bool:
+        """Whether the cluster answers with a usable (yellow or green) status"""
+        try:
+            health = await asyncio.wait_for(self.client.cluster.health(), timeout=timeout)
+            return health['status'] in ('yellow', 'green')
+        except Exception:
+            return False
+    
+    async def wait_until_ready(self, timeout: float = 60.0, initial_delay: float = 0.05, max_delay: float = 2.0):
+        """Wait for Elasticsearch with jittered exponential backoff"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = initial_delay
+        while True:
+            remaining = deadline - loop.time()
+            if await self.is_reachable(timeout=max(min(remaining, max_delay), 0.1)):
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise RuntimeError(f"Elasticsearch not ready within {timeout}s")
+            await asyncio.sleep(min(delay * random.uniform(0.5, 1.0), remaining))
+            delay = min(delay * 2, max_delay)
+    
+    async def _template_current(self, name: str, body: Dict[str, Any]) -> bool:
+        try:
+            response = await self.client.indices.get_index_template(name=name)
+            existing = response['index_templates'][0]['index_template']['template']['mappings']
+            return existing.get('_meta', {}).get('mapping_hash') == body['mappings']['_meta']['mapping_hash']
+        except Exception:
+            return False
+    
+    async def initialize(self):
+        """Create each group's index if it doesn't exist, or its partition template when partitioned"""
+        if os.getenv("SKIP_INDEX_SETUP", "false").lower() == "true":
+            return
+        
+        for group in self.router.all_groups:
+            base = self.router.base_index(group)
+            body = self._index_body(group)
+            if self.partitioned:
+                if await self._template_current(base, body):
+                    continue
+                # Group patterns overlap the default one, so they need a higher priority to win
+                await self.client.indices.put_index_template(
+                    name=base,
+                    index_patterns=[f"{base}-*"],
+                    template=body,
+                    priority=0 if group.is_default else 10
+                )
+            else:
+                await self._ensure_index(base, body)
+    
+    async def _ensure_index(self, name: str, body: Dict[str, Any]):
+        """Create an index, or update an existing one whose mapping hash is stale"""
+        try:
+            response = await self.client.indices.get_mapping(index=name)
+        except NotFoundError:
+            try:
+                await self.client.indices.create(index=name, body=body)
+            except BadRequestError as e:
+                # Another worker starting at the same time created it first
+                if e.error != "resource_already_exists_exception":
+                    raise
+            return
+        
+        mappings = body['mappings']
+        existing = next(iter(response.values()), {}).get('mappings', {})
+        if existing.get('_meta', {}).get('mapping_hash') == mappings['_meta']['mapping_hash']:
+            return
+        try:
+            await self.client.indices.put_mapping(
+                index=name, dynamic=mappings['dynamic'], properties=mappings['properties'], meta=mappings['_meta']
+            )
+            logger.info("Index mapping updated", index=name)
+        except BadRequestError as e:
+            # A field changed type, which only a reindex can apply
+            logger.warning("Index mapping is out of date; reindex to apply it", index=name, error=str(e))
+    
+    def _to_document(self, log: Union[LogEntry, Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the ES document for a log, enforcing the metadata limits"""
+        doc = log.model_dump() if isinstance(log, LogEntry) else dict(log)
+        if isinstance(doc.get('timestamp'), datetime):
+            doc['timestamp'] = doc['timestamp'].isoformat()
+        
+        metadata, hot, dropped = self.metadata_policy.apply(doc.get('metadata'))
+        doc['metadata'] = metadata
+        if hot:
+            doc[HOT_FIELD] = hot
+        if dropped:
+            MetricsCollector.record_metadata_keys_dropped(dropped, service=doc.get('service'))
+        return doc
     
-    async def index_log(self, log: LogEntry) -> bool:
+    async def index_log(self, log: Union[LogEntry, Dict[str, Any]]) -> bool:
         """Index a single log entry"""
         try:
-            doc = log.dict()
-            doc['timestamp'] = log.timestamp.isoformat()
+            doc = self._to_document(log)
             
             await self.client.index(
-                index=self.index_name,
-                document=doc
+                index=self.index_for(doc),
+                document=doc,
+                routing=doc.get('trace_id') if self.trace_routing else None
             )
             return True
         except Exception as e:
             print(f"Error indexing log: {e}")
             return False
     
-    async def index_logs_batch(self, logs: List[LogEntry]) -> Dict[str, Any]:
-        """Index multiple logs in batch"""
-        actions = []
-        for log in logs:
-            doc = log.dict()
-            doc['timestamp'] = log.timestamp.isoformat()
-            actions.extend([
-                {"index": {"_index": self.index_name}},
-                doc
-            ])
+    async def index_logs_batch(
+        self,
+        logs: Union[LogBatch, List[Union[LogEntry, Dict[str, Any]]]],
+        rows: Optional[Sequence[int]] = None,
+    ) -> Dict[str, Any]:
+        """Index multiple logs in batch.
+
+        With rows, only those rows of the batch are sent. Rows Elasticsearch rejected for
+        overload come back in "rejected" so the caller can retry just those.
+        """
+        batch = logs
+        if not isinstance(batch, LogBatch):
+            batch = self.new_batch()
+            for log in logs:
+                batch.append(log)
+        if rows is None:
+            rows = range(len(batch))
+            if batch.dropped_metadata_keys:
+                MetricsCollector.record_metadata_keys_dropped(batch.dropped_metadata_keys)
         
         try:
-            response = await self.client.bulk(operations=actions)
-            return {
-                "success": True,
-                "indexed": len(logs),
-                "errors": len([item for item in response['items'] if 'error' in item.get('index', {})])
-            }
+            response = await self.client.bulk(
+                operations=batch.to_bulk_body(self.index_for_millis, rows, route_by_trace=self.trace_routing)
+            )
         except Exception as e:
+            if getattr(e, "status_code", None) == REJECTED_STATUS:
+                return {"success": False, "error": str(e), "rejected": list(rows)}
             return {"success": False, "error": str(e)}
+
+        rejected = []
+        errors = 0
+        if response.get("errors"):
+            for row, item in zip(rows, response["items"]):
+                result = item.get("index", {})
+                if is_rejection(result):
+                    rejected.append(row)
+                elif "error" in result:
+                    errors += 1
+        return {
+            "success": True,
+            "indexed": len(rows) - len(rejected) - errors,
+            "errors": errors,
+            "rejected": rejected,
+        }
     
-    async def search_logs(self, search_query: SearchQuery) -> LogSearchResponse:
-        """Search logs based on query parameters"""
+    def _build_search_query(self, search_query: SearchQuery) -> Dict[str, Any]:
         query = {"bool": {"must": []}}
         
         if search_query.query:
@@ -87,6 +319,9 @@ class SearchEngine:
         if search_query.service:
             query["bool"]["must"].append({"term": {"service": search_query.service}})
         
+        if search_query.trace_id:
+            query["bool"]["must"].append({"term": {"trace_id": search_query.trace_id}})
+        
         if search_query.start_time or search_query.end_time:
             time_range = {}
             if search_query.start_time:
@@ -95,40 +330,185 @@ class SearchEngine:
                 time_range["lte"] = search_query.end_time.isoformat()
             query["bool"]["must"].append({"range": {"timestamp": time_range}})
         
+        return query
+    
+    async def search_logs(self, search_query: SearchQuery, profile: bool = False, es_profile: bool = False,
+                          raise_errors: bool = False) -> LogSearchResponse:
+        """Search logs based on query parameters; failures give an empty response unless raise_errors"""
+        started = time.perf_counter()
+        query = self._build_search_query(search_query)
+        groups = self.router.groups_for_query(search_query.source, search_query.service)
+        extra = {"profile": True} if es_profile else {}
+        built = time.perf_counter()
+        
         try:
-            start_time = datetime.utcnow()
-            response = await self.client.search(
-                index=self.index_name,
-                query=query,
-                size=search_query.limit,
-                from_=search_query.offset,
-                sort=[{"timestamp": {"order": "desc"}}]
-            )
-            
-            took_ms = (datetime.utcnow() - start_time).total_seconds() * 1000
+            if len(groups) == 1:
+                response = await self.client.search(
+                    index=self.group_index(groups[0]),
+                    query=query,
+                    size=search_query.limit,
+                    from_=search_query.offset,
+                    sort=[{"timestamp": {"order": "desc"}}],
+                    **extra
+                )
+                hits = response['hits']['hits']
+                total_count = response['hits']['total']['value']
+                es_took_ms = response.get('took', 0)
+                es_profile_output = response.get('profile')
+            else:
+                hits, total_count, es_took_ms, es_profile_output = await self._fan_out_search(
+                    groups, query, search_query.limit, search_query.offset, extra
+                )
+            searched = time.perf_counter()
             
             logs = []
-            for hit in response['hits']['hits']:
+            for hit in hits:
                 source = hit['_source']
                 logs.append(LogEntry(**source))
+            finished = time.perf_counter()
+            
+            phases = self._phases(started, built, searched, finished, es_took_ms)
+            MetricsCollector.record_search_phases("search", phases)
+            took_ms = (finished - started) * 1000
             
             return LogSearchResponse(
                 logs=logs,
-                total_count=response['hits']['total']['value'],
-                took_ms=took_ms
+                total_count=total_count,
+                took_ms=took_ms,
+                profile=self._profile(phases, took_ms, es_profile_output) if profile else None
             )
         except Exception as e:
+            if raise_errors:
+                raise
             return LogSearchResponse(logs=[], total_count=0, took_ms=0.0)
     
+    @staticmethod
+    def _phases(started: float, built: float, searched: float, finished: float, es_took_ms: float) -> Dict[str, float]:
+        """Phase timings in ms; transport is the client round trip minus ES's own took"""
+        round_trip_ms = (searched - built) * 1000
+        return {
+            "query_build": (built - started) * 1000,
+            "elasticsearch": float(es_took_ms),
+            "transport": max(round_trip_ms - es_took_ms, 0.0),
+            "deserialize": (finished - searched) * 1000,
+        }
+    
+    @staticmethod
+    def _profile(phases: Dict[str, float], took_ms: float, es_profile_output: Any) -> QueryProfile:
+        return QueryProfile(
+            query_build_ms=phases["query_build"],
+            es_took_ms=phases["elasticsearch"],
+            transport_ms=phases["transport"],
+            deserialize_ms=phases["deserialize"],
+            total_ms=took_ms,
+            es_profile=es_profile_output
+        )
+    
+    async def _fan_out_search(self, groups: List[IndexGroup], query: Dict[str, Any], limit: int, offset: int,
+                              extra: Dict[str, Any]):
+        """Query groups concurrently and k-way merge their newest-first hits"""
+        window = offset + limit
+        responses = await asyncio.gather(*[
+            self.client.search(
+                index=self.group_index(group),
+                query=query,
+                size=window,
+                from_=0,
+                sort=[{"timestamp": {"order": "desc"}}],
+                **extra
+            )
+            for group in groups
+        ], return_exceptions=True)
+        
+        per_group = []
+        total_count = 0
+        es_took_ms = 0
+        es_profile_output = None
+        for group, response in zip(groups, responses):
+            if isinstance(response, Exception):
+                logger.warning("Index group search failed", group=group.name or "default", error=str(response))
+                continue
+            total_count += response['hits']['total']['value']
+            # Groups run in parallel, so the slowest one bounds the ES time
+            es_took_ms = max(es_took_ms, response.get('took', 0))
+            if 'profile' in response:
+                # Same shape as a single search: one shards list, each shard id naming its index
+                es_profile_output = es_profile_output or {"shards": []}
+                es_profile_output["shards"].extend(response['profile'].get('shards', []))
+            per_group.append(response['hits']['hits'])
+        
+        if not per_group:
+            raise responses[0]
+        
+        # Each group is already sorted on timestamp, so a heap merge only touches offset + limit hits
+        merged = heapq.merge(*per_group, key=lambda hit: hit['sort'][0], reverse=True)
+        return list(islice(merged, offset, window)), total_count, es_took_ms, es_profile_output
+    
+    def trace_window(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
+        """Search window for a trace: the hint padded on both sides, else the lookback period"""
+        if start_time is None and end_time is None:
+            end = datetime.utcnow()
+            return end - self.trace_lookback, end
+        start = (start_time or end_time) - self.trace_window_padding
+        end = (end_time or start_time) + self.trace_window_padding
+        return start, end
+    
+    async def trace_logs(self, trace_ids: List[str], start_time: Optional[datetime] = None,
+                         end_time: Optional[datetime] = None) -> Dict[str, TraceLogsResponse]:
+        """Logs of each trace grouped by span, fetched in one msearch round trip"""
+        start, end = self.trace_window(start_time, end_time)
+        header = {"index": self.indices_for_window(start, end), "ignore_unavailable": True}
+        searches = []
+        for trace_id in trace_ids:
+            searches.append(dict(header, routing=trace_id) if self.trace_routing else header)
+            searches.append({
+                "query": {"bool": {"filter": [
+                    {"term": {"trace_id": trace_id}},
+                    {"range": {"timestamp": {"gte": start.isoformat(), "lte": end.isoformat()}}},
+                ]}},
+                "sort": [{"timestamp": {"order": "asc"}}],
+                "size": self.trace_max_logs,
+                "track_total_hits": True,
+            })
+        
+        response = await self.client.msearch(searches=searches)
+        results = {}
+        for trace_id, result in zip(trace_ids, response["responses"]):
+            if "error" in result:
+                raise RuntimeError(f"Trace lookup failed for {trace_id}: {result['error']}")
+            hits = result["hits"]["hits"]
+            spans: Dict[Optional[str], List[LogEntry]] = {}
+            for hit in hits:
+                log = LogEntry(**hit["_source"])
+                spans.setdefault(log.span_id, []).append(log)
+            total = result["hits"]["total"]["value"]
+            results[trace_id] = TraceLogsResponse(
+                trace_id=trace_id,
+                total_count=total,
+                truncated=total > len(hits),
+                start_time=start,
+                end_time=end,
+                # Hits are time-ordered, so spans come out in order of their first log
+                spans=[SpanLogs(span_id=span_id, logs=logs) for span_id, logs in spans.items()],
+            )
+        return results
+    
     async def find_error_patterns(self, hours: int = 24) -> List[ErrorPattern]:
         """Find common error patterns"""
-        time_filter = {
-            "range": {
-                "timestamp": {
-                    "gte": f"now-{hours}h"
-                }
-            }
-        }
+        return (await self.analyze_error_patterns(hours)).patterns
+    
+    async def analyze_error_patterns(self, hours: int = 24, profile: bool = False, es_profile: bool = False,
+                                     start_time: datetime = None, end_time: datetime = None,
+                                     raise_errors: bool = False, size: int = 50) -> ErrorPatternsResponse:
+        """Find the `size` most common error patterns, optionally with a timing breakdown.
+        
+        start_time/end_time narrow the window to one slice of the last `hours`.
+        """
+        started = time.perf_counter()
+        time_range = {"gte": start_time.isoformat() if start_time else f"now-{hours}h"}
+        if end_time:
+            time_range["lt"] = end_time.isoformat()
+        time_filter = {"range": {"timestamp": time_range}}
         
         query = {
             "bool": {
@@ -143,7 +523,7 @@ class SearchEngine:
             "error_patterns": {
                 "terms": {
                     "field": "message.keyword",
-                    "size": 50
+                    "size": size
                 },
                 "aggs": {
                     "first_seen": {"min": {"field": "timestamp"}},
@@ -154,14 +534,18 @@ class SearchEngine:
                 }
             }
         }
+        extra = {"profile": True} if es_profile else {}
+        built = time.perf_counter()
         
         try:
             response = await self.client.search(
-                index=self.index_name,
+                index=self.search_index,
                 query=query,
                 aggs=aggs,
-                size=0
+                size=0,
+                **extra
             )
+            searched = time.perf_counter()
             
             patterns = []
             for bucket in response['aggregations']['error_patterns']['buckets']:
@@ -173,8 +557,17 @@ class SearchEngine:
                     last_seen=datetime.fromisoformat(bucket['last_seen']['value_as_string'].replace('Z', '+00:00')),
                     services=services
                 ))
+            finished = time.perf_counter()
             
-            return patterns
+            phases = self._phases(started, built, searched, finished, response.get('took', 0))
+            MetricsCollector.record_search_phases("patterns", phases)
+            
+            return ErrorPatternsResponse(
+                patterns=patterns,
+                profile=self._profile(phases, (finished - started) * 1000, response.get('profile')) if profile else None
+            )
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error finding patterns: {e}")
-            return []
+            return ErrorPatternsResponse(patterns=[])
@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import structlog
+from elasticsearch import BadRequestError, NotFoundError
+from pydantic import BaseModel
+
+from models.log_schemas import SearchQuery, ErrorPattern, SearchJobStatus
+from services.loop_bound import loop_bound
+
+logger = structlog.get_logger()
+
+JOB_INDEX = "pay-log-aggregator-jobs"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (PENDING, RUNNING)
+
+
+class JobLimitError(Exception):
+    """Raised when too many jobs are already queued"""
+
+
+class SearchJob:
+    """One submitted query and its progress"""
+
+    def __init__(self, kind: str, params: Dict[str, Any], key: str, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = PENDING
+        self.progress = 0.0
+        self.partial_result: Any = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.expires_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watcher: Optional[asyncio.Task] = None
+        self.updated = asyncio.Event()
+
+    @classmethod
+    def from_document(cls, job_id: str, source: Dict[str, Any]) -> "SearchJob":
+        """A read-only copy of a job published by another worker or replica"""
+        job = cls(source["kind"], {}, "", job_id=job_id)
+        job.status = source["status"]
+        job.progress = source.get("progress", 0.0)
+        job.partial_result = source.get("partial_result")
+        job.result = source.get("result")
+        job.error = source.get("error")
+        job.created_at = datetime.fromisoformat(source["created_at"])
+        if source.get("finished_at"):
+            job.finished_at = datetime.fromisoformat(source["finished_at"])
+        job.expires_at = source.get("expires_at")
+        return job
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "partial_result": _dump(self.partial_result),
+            "result": _dump(self.result),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def touch(self):
+        """Wake long-pollers waiting for progress"""
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def to_status(self, deduplicated: bool = False) -> SearchJobStatus:
+        return SearchJobStatus(
+            job_id=self.id,
+            kind=self.kind,
+            status=self.status,
+            progress=round(self.progress, 3),
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            error=self.error,
+            deduplicated=deduplicated,
+            partial_result=self.partial_result if self.status in ACTIVE_STATES else None,
+        )
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, list):
+        return [_dump(item) for item in value]
+    return value
+
+
+def merge_patterns(merged: Dict[str, ErrorPattern], patterns: List[ErrorPattern]) -> Dict[str, ErrorPattern]:
+    """Fold one time slice's patterns into the running totals"""
+    for pattern in patterns:
+        current = merged.get(pattern.pattern)
+        if current is None:
+            merged[pattern.pattern] = pattern.model_copy()
+            continue
+        current.count += pattern.count
+        current.first_seen = min(current.first_seen, pattern.first_seen)
+        current.last_seen = max(current.last_seen, pattern.last_seen)
+        current.services = (current.services + [s for s in pattern.services if s not in current.services])[:10]
+    return merged
+
+
+def ranked(merged: Dict[str, ErrorPattern]) -> List[ErrorPattern]:
+    return sorted(merged.values(), key=lambda pattern: pattern.count, reverse=True)[:50]
+
+
+class SearchJobManager:
+    """In-process scheduler for long-running searches, with job state shared through Elasticsearch.
+
+    Runs at most max_concurrent jobs at once, returns the running job when an identical
+    query is submitted again, and forgets finished jobs after result_ttl seconds. A job runs
+    in the worker that accepted it, which publishes its state to JOB_INDEX on every update,
+    so any worker or replica can report, long-poll, return or cancel it. Limits and
+    deduplication apply per worker.
+
+    A running job's document is a lease renewed every heartbeat_seconds; if its worker
+    dies, the job expires instead of showing as running forever.
+    """
+
+    def __init__(
+        self,
+        search_engine,
+        max_concurrent: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        result_ttl: Optional[float] = None,
+        slice_hours: Optional[int] = None,
+        slice_patterns: Optional[int] = None,
+        heartbeat_seconds: Optional[float] = None,
+        poll_seconds: Optional[float] = None,
+    ):
+        self.search_engine = search_engine
+        self.client = search_engine.client
+        self.max_concurrent = max_concurrent or int(os.getenv("JOB_MAX_CONCURRENT", "2"))
+        self.max_pending = max_pending or int(os.getenv("JOB_MAX_PENDING", "100"))
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+        self.slice_hours = slice_hours or int(os.getenv("JOB_PATTERN_SLICE_HOURS", "24"))
+        # Patterns kept per slice; well above the final top 50 so steady patterns add up across slices
+        self.slice_patterns = slice_patterns or int(os.getenv("JOB_PATTERN_SLICE_SIZE", "1000"))
+        self.heartbeat_seconds = heartbeat_seconds or 5.0
+        # How often a long-poll re-reads a job running elsewhere
+        self.poll_seconds = poll_seconds or 0.5
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, SearchJob] = {}
+        self._active_by_key: Dict[str, SearchJob] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._index_ready = False
+        self._next_purge = 0.0
+
+    @loop_bound
+    def semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrent)
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> Tuple[SearchJob, bool]:
+        """Start a job, or return the identical one already running; the flag says which"""
+        self._expire()
+        key = f"{kind}:{json.dumps(params, sort_keys=True, default=str)}"
+        existing = self._active_by_key.get(key)
+        if existing is not None:
+            return existing, True
+
+        pending = sum(1 for job in self._active_by_key.values() if job.status == PENDING)
+        if pending >= self.max_pending:
+            raise JobLimitError(f"{pending} jobs already queued")
+
+        job = SearchJob(kind, params, key)
+        self.jobs[job.id] = job
+        self._active_by_key[key] = job
+        # Published before the ID is returned, so a poll landing on another replica finds it
+        await self._publish(job)
+        job.task = asyncio.create_task(self._run(job))
+        job.watcher = asyncio.create_task(self._watch(job))
+        await self._purge()
+        return job, False
+
+    async def get(self, job_id: str) -> Optional[SearchJob]:
+        """The job from this worker, or its last published state if it runs elsewhere"""
+        self._expire()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        return await self._load(job_id)
+
+    async def wait(self, job: SearchJob, timeout: float) -> SearchJob:
+        """Long-poll: return on the next progress update, completion or timeout"""
+        if job.status not in ACTIVE_STATES or timeout <= 0:
+            return job
+        if self.jobs.get(job.id) is job:
+            try:
+                await asyncio.wait_for(job.updated.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(self.poll_seconds, deadline - time.monotonic()))
+            current = await self._load(job.id)
+            if current is None:
+                break
+            if (current.status, current.progress) != (job.status, job.progress):
+                return current
+            job = current
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[SearchJob]:
+        """Cancel a job here, or flag it for the worker running it, which stops it on its next heartbeat"""
+        job = await self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            await self.client.update(index=JOB_INDEX, id=job_id, doc={"cancel_requested": True})
+        return job
+
+    async def stop(self):
+        for job in list(self._active_by_key.values()):
+            if job.task is not None:
+                job.task.cancel()
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.expires_at and job.expires_at <= now]:
+            del self.jobs[job_id]
+
+    async def _ensure_index(self):
+        if self._index_ready:
+            return
+        try:
+            # Results are kept in _source only; indexing them would map arbitrary log metadata
+            await self.client.indices.create(
+                index=JOB_INDEX,
+                mappings={"dynamic": False, "properties": {"expires_at": {"type": "double"}}},
+            )
+        except BadRequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+        self._index_ready = True
+
+    async def _publish(self, job: SearchJob):
+        """Wake local long-pollers and write the job's state for other workers"""
+        job.touch()
+        document = job.to_document()
+        document["holder"] = self.holder
+        # Running jobs hold a lease; finished ones are kept for result_ttl
+        document["expires_at"] = job.expires_at or self._lease()
+        try:
+            await self._ensure_index()
+            await self.client.update(index=JOB_INDEX, id=job.id, doc=document, doc_as_upsert=True)
+        except Exception as e:
+            logger.warning("Could not publish search job state", job_id=job.id, error=str(e))
+
+    async def _load(self, job_id: str) -> Optional[SearchJob]:
+        try:
+            current = await self.client.get(index=JOB_INDEX, id=job_id)
+        except NotFoundError:
+            return None
+        source = current["_source"]
+        if source.get("expires_at", 0) <= time.time():
+            return None
+        return SearchJob.from_document(job_id, source)
+
+    async def _purge(self):
+        """Delete expired job documents, at most once per minute"""
+        if time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + 60
+        try:
+            await self.client.delete_by_query(
+                index=JOB_INDEX, query={"range": {"expires_at": {"lte": time.time()}}}, conflicts="proceed"
+            )
+        except Exception as e:
+            logger.warning("Could not purge expired search jobs", error=str(e))
+
+    def _lease(self) -> float:
+        return time.time() + self.heartbeat_seconds * 6
+
+    async def _watch(self, job: SearchJob):
+        """Renew the running job's lease and pick up cancellations requested through another worker"""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                current = await self.client.get(index=JOB_INDEX, id=job.id)
+                if current["_source"].get("cancel_requested"):
+                    job.task.cancel()
+                    return
+                await self.client.update(index=JOB_INDEX, id=job.id, doc={"expires_at": self._lease()})
+            except Exception as e:
+                logger.warning("Could not renew search job lease", job_id=job.id, error=str(e))
+
+    async def _finish(self, job: SearchJob, status: str):
+        job.status = status
+        job.finished_at = datetime.utcnow()
+        job.expires_at = time.time() + self.result_ttl
+        if self._active_by_key.get(job.key) is job:
+            del self._active_by_key[job.key]
+        if job.watcher is not None:
+            # Stopped before the final write, so a lease renewal can't land after it
+            job.watcher.cancel()
+            await asyncio.gather(job.watcher, return_exceptions=True)
+        await self._publish(job)
+
+    async def _run(self, job: SearchJob):
+        try:
+            async with self.semaphore:
+                job.status = RUNNING
+                await self._publish(job)
+                if job.kind == "patterns":
+                    job.result = await self._run_patterns(job)
+                else:
+                    job.result = await self.search_engine.search_logs(SearchQuery(**job.params), raise_errors=True)
+                job.progress = 1.0
+            await self._finish(job, DONE)
+        except asyncio.CancelledError:
+            await self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = str(e)
+            await self._finish(job, FAILED)
+            logger.error("Search job failed", job_id=job.id, kind=job.kind, error=str(e))
+
+    async def _run_patterns(self, job: SearchJob) -> List[ErrorPattern]:
+        """Aggregate the window one slice at a time, newest first, publishing partial results.
+
+        Counts are approximate: a pattern only counts in the slices where it is among the
+        top slice_patterns, so one that stays below that in some slices is under-counted.
+        """
+        hours = job.params["hours"]
+        end = datetime.utcnow()
+        start = end - timedelta(hours=hours)
+        slices = max(1, -(-hours // self.slice_hours))
+        merged: Dict[str, ErrorPattern] = {}
+
+        for index in range(slices):
+            slice_end = end - timedelta(hours=index * self.slice_hours)
+            slice_start = max(start, slice_end - timedelta(hours=self.slice_hours))
+            result = await self.search_engine.analyze_error_patterns(
+                hours, start_time=slice_start, end_time=slice_end, raise_errors=True, size=self.slice_patterns
+            )
+            merge_patterns(merged, result.patterns)
+            job.progress = (index + 1) / slices
+            job.partial_result = ranked(merged)
+            await self._publish(job)
+
+        return ranked(merged)
@@ -0,0 +1,345 @@
+import os
+import time
+import socket
+import asyncio
+import calendar
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import structlog
+
+from observability.metrics import MetricsCollector
+from services.log_batch import to_epoch_millis
+
+logger = structlog.get_logger()
+
+DEFAULT_SOURCE = "syslog"
+
+# Syslog severities 0-7: emerg, alert, crit, err, warning, notice, info, debug
+SEVERITY_LEVELS = ("CRITICAL", "CRITICAL", "CRITICAL", "ERROR", "WARNING", "INFO", "INFO", "DEBUG")
+FACILITIES = (
+    "kern", "user", "mail", "daemon", "auth", "syslog", "lpr", "news", "uucp", "cron", "authpriv", "ftp",
+    "ntp", "audit", "alert", "clock", "local0", "local1", "local2", "local3", "local4", "local5", "local6", "local7",
+)
+MONTHS = {name: index for index, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), start=1
+)}
+
+# Every uvicorn worker binds the same ports and the kernel spreads connections and datagrams across them
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+
+Sink = Callable[[Dict[str, Any]], bool]
+
+_rfc3164_cache: Dict[str, Tuple[float, int]] = {}
+
+
+@lru_cache(maxsize=256)
+def _rfc5424_millis(stamp: str) -> Optional[int]:
+    try:
+        return to_epoch_millis(stamp)
+    except ValueError:
+        return None
+
+
+def _rfc3164_millis(stamp: str, now: float) -> Optional[int]:
+    """'Oct 19 10:00:00' has no year or zone; take it as UTC in the current year"""
+    cached = _rfc3164_cache.get(stamp)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    month = MONTHS.get(stamp[:3])
+    try:
+        day = int(stamp[4:6])
+        hour, minute, second = int(stamp[7:9]), int(stamp[10:12]), int(stamp[13:15])
+    except ValueError:
+        return None
+    if month is None:
+        return None
+    year = time.gmtime(now).tm_year
+    seconds = calendar.timegm((year, month, day, hour, minute, second))
+    if seconds > now + 86400:
+        # A December message read in early January belongs to last year
+        seconds = calendar.timegm((year - 1, month, day, hour, minute, second))
+    if len(_rfc3164_cache) >= 256:
+        _rfc3164_cache.clear()
+    # Bursts share a handful of second-resolution stamps; the year guess is only reused for a minute
+    _rfc3164_cache[stamp] = (now + 60, seconds * 1000)
+    return seconds * 1000
+
+
+def _structured_data_end(text: str) -> int:
+    """Index just past the RFC 5424 structured data at the start of text"""
+    in_quotes = False
+    escaped = False
+    for index, char in enumerate(text):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif char == "]" and not in_quotes and not text.startswith("[", index + 1):
+            return index + 1
+    return len(text)
+
+
+def parse_syslog(line: str, default_source: str = DEFAULT_SOURCE, now: Optional[float] = None) -> Dict[str, Any]:
+    """Parse one RFC 5424, RFC 3164 or plain line into an ingest document"""
+    now = time.time() if now is None else now
+    doc: Dict[str, Any] = {"level": "INFO", "source": default_source}
+    metadata: Dict[str, Any] = {}
+    millis = None
+    rest = line
+
+    if line.startswith("<"):
+        close = line.find(">", 1, 5)
+        # PRI is at most 191 (facility 23, severity 7); anything else is plain text
+        if close > 1 and line[1:close].isdigit() and int(line[1:close]) <= 191:
+            priority = int(line[1:close])
+            doc["level"] = SEVERITY_LEVELS[priority & 7]
+            facility = priority >> 3
+            if facility < len(FACILITIES):
+                metadata["facility"] = FACILITIES[facility]
+            rest = line[close + 1:]
+
+            if rest.startswith("1 "):
+                # RFC 5424: VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID SD MSG
+                fields = rest.split(" ", 6)
+                if len(fields) == 7:
+                    _, stamp, host, app, procid, msgid, rest = fields
+                    if stamp != "-":
+                        millis = _rfc5424_millis(stamp)
+                    if host != "-":
+                        doc["source"] = host
+                    if app != "-":
+                        doc["service"] = app
+                    if procid != "-":
+                        metadata["procid"] = procid
+                    if msgid != "-":
+                        metadata["msgid"] = msgid
+                    if rest.startswith("["):
+                        end = _structured_data_end(rest)
+                        metadata["structured_data"] = rest[:end]
+                        rest = rest[end + 1:]
+                    elif rest.startswith("-"):
+                        rest = rest[2:]
+                    if rest.startswith("\ufeff"):
+                        rest = rest[1:]
+
+            elif len(rest) > 15 and rest[3] == " " and rest[:3] in MONTHS:
+                # RFC 3164: Mmm dd hh:mm:ss HOSTNAME TAG[PID]: MSG
+                millis = _rfc3164_millis(rest[:15], now)
+                host, _, rest = rest[16:].partition(" ")
+                if host:
+                    doc["source"] = host
+                colon = rest.find(": ", 0, 64)
+                if colon > 0 and " " not in rest[:colon]:
+                    tag = rest[:colon]
+                    bracket = tag.find("[")
+                    if bracket > 0 and tag.endswith("]"):
+                        metadata["procid"] = tag[bracket + 1:-1]
+                        tag = tag[:bracket]
+                    doc["service"] = tag
+                    rest = rest[colon + 2:]
+
+    doc["timestamp"] = millis if millis is not None else int(now * 1000)
+    doc["message"] = rest
+    if metadata:
+        doc["metadata"] = metadata
+    return doc
+
+
+class SyslogUDPProtocol(asyncio.DatagramProtocol):
+    """One or more newline-separated messages per datagram; dropped when the buffer is full"""
+
+    def __init__(self, sink: Sink, default_source: str = DEFAULT_SOURCE):
+        self.sink = sink
+        self.default_source = default_source
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        dropped = 0
+        for line in data.decode("utf-8", "replace").splitlines():
+            if line and not self.sink(parse_syslog(line, self.default_source)):
+                dropped += 1
+        if dropped:
+            MetricsCollector.record_syslog_dropped(dropped, "udp")
+
+
+class SyslogTCPProtocol(asyncio.Protocol):
+    """Newline or octet-counted (RFC 6587) framing.
+
+    When the buffer is full the connection stops reading, so backpressure reaches the
+    sender through TCP flow control instead of messages being dropped.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        has_room: Callable[[], bool],
+        default_source: str = DEFAULT_SOURCE,
+        max_message_bytes: int = 65536,
+        resume_delay: float = 0.05,
+    ):
+        self.sink = sink
+        self.has_room = has_room
+        self.default_source = default_source
+        self.max_message_bytes = max_message_bytes
+        self.resume_delay = resume_delay
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = bytearray()
+        # Rest of an oversized frame still to be dropped: a byte count, or up to the next newline
+        self.discard = 0
+        self.discard_line = False
+        self.paused = False
+        self.eof = False
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.transport = None
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        if not self.paused:
+            self._drain()
+
+    def eof_received(self):
+        self.eof = True
+        if self.buffer and not self.buffer.endswith(b"\n"):
+            # A final message without a trailing newline
+            self.buffer += b"\n"
+        if not self.paused:
+            self._drain()
+        # Stay open while paused so buffered messages are still delivered once there is room
+        return self.paused
+
+    def _next_frame(self) -> Tuple[Optional[bytes], int]:
+        """The next complete message and how many buffered bytes it spans"""
+        buffer = self.buffer
+        if buffer[:1].isdigit():
+            space = buffer.find(b" ", 0, 12)
+            # RFC 6587 octet counting: the length is followed by the message's <PRI>, so a
+            # plain line such as "404 not found" still splits on newlines
+            if space > 0 and buffer[:space].isdigit() and buffer[space + 1:space + 2] == b"<":
+                length = int(buffer[:space])
+                end = space + 1 + length
+                if length > self.max_message_bytes:
+                    self.discard = end
+                    return None, -1
+                return (bytes(buffer[space + 1:end]), end) if len(buffer) >= end else (None, 0)
+        newline = buffer.find(b"\n")
+        if newline < 0:
+            if len(buffer) > self.max_message_bytes:
+                self.discard_line = True
+                return None, -1
+            return None, 0
+        return bytes(buffer[:newline]).rstrip(b"\r"), newline + 1
+
+    def _skip_discarded(self) -> bool:
+        """Drop what has arrived of an oversized frame; False while more of it is still to come"""
+        if self.discard:
+            dropped = min(self.discard, len(self.buffer))
+            del self.buffer[:dropped]
+            self.discard -= dropped
+            return not self.discard
+        if self.discard_line:
+            newline = self.buffer.find(b"\n")
+            if newline < 0:
+                self.buffer.clear()
+                return False
+            del self.buffer[:newline + 1]
+            self.discard_line = False
+        return True
+
+    def _drain(self):
+        while self._skip_discarded():
+            frame, size = self._next_frame()
+            if size < 0:
+                # Only this frame is dropped; the messages after it on the connection are kept
+                logger.warning("Oversized syslog message discarded", max_bytes=self.max_message_bytes)
+                MetricsCollector.record_syslog_dropped(1, "tcp")
+                continue
+            if frame is None:
+                break
+            if frame:
+                doc = parse_syslog(frame.decode("utf-8", "replace"), self.default_source)
+                if not self.sink(doc):
+                    # Keep the frame and stop reading until the buffer has room
+                    self._pause()
+                    return
+            del self.buffer[:size]
+        if self.eof and self.transport is not None:
+            self.transport.close()
+
+    def _pause(self):
+        if self.transport is None:
+            return
+        if not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+        asyncio.get_running_loop().call_later(self.resume_delay, self._try_resume)
+
+    def _try_resume(self):
+        if self.transport is None:
+            return
+        if not self.has_room():
+            asyncio.get_running_loop().call_later(self.resume_delay, self._try_resume)
+            return
+        self.paused = False
+        self.transport.resume_reading()
+        self._drain()
+
+
+class SyslogServer:
+    """Syslog and raw line listeners feeding the ingest queue, started from the app lifespan"""
+
+    def __init__(
+        self,
+        ingest_queue,
+        host: Optional[str] = None,
+        tcp_port: Optional[int] = None,
+        udp_port: Optional[int] = None,
+    ):
+        self.ingest_queue = ingest_queue
+        self.host = host or os.getenv("SYSLOG_HOST", "0.0.0.0")
+        self.tcp_port = tcp_port if tcp_port is not None else int(os.getenv("SYSLOG_TCP_PORT", "0"))
+        self.udp_port = udp_port if udp_port is not None else int(os.getenv("SYSLOG_UDP_PORT", "0"))
+        self.max_message_bytes = int(os.getenv("SYSLOG_MAX_MESSAGE_BYTES", "65536"))
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+
+    def _has_room(self) -> bool:
+        return self.ingest_queue.free_slots() > 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.tcp_port:
+            self._tcp_server = await loop.create_server(
+                lambda: SyslogTCPProtocol(
+                    self.ingest_queue.submit, self._has_room, max_message_bytes=self.max_message_bytes
+                ),
+                self.host,
+                self.tcp_port,
+                reuse_port=REUSE_PORT,
+            )
+            logger.info("Syslog TCP listener started", host=self.host, port=self.tcp_port)
+        if self.udp_port:
+            self._udp_transport, _ = await loop.create_datagram_endpoint(
+                lambda: SyslogUDPProtocol(self.ingest_queue.submit),
+                local_addr=(self.host, self.udp_port),
+                reuse_port=REUSE_PORT,
+            )
+            logger.info("Syslog UDP listener started", host=self.host, port=self.udp_port)
+
+    @property
+    def tcp_sockets(self) -> List:
+        return list(self._tcp_server.sockets) if self._tcp_server is not None else []
+
+    async def stop(self):
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
@@ -0,0 +1,79 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from models.log_schemas import TraceLogsResponse
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic() if now is None else now
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any, now: Optional[float] = None):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class TraceLookup:
+    """Trace log lookups with a short-lived cache in front of Elasticsearch.
+
+    The TTL is kept short because a recent trace may still be receiving logs; it only
+    needs to cover a tracing UI opening the same trace several times in a row.
+    """
+
+    def __init__(self, search_engine, cache_size: Optional[int] = None, cache_ttl: Optional[float] = None):
+        self.search_engine = search_engine
+        self.cache = TTLCache(
+            cache_size if cache_size is not None else int(os.getenv("TRACE_CACHE_SIZE", "1000")),
+            cache_ttl if cache_ttl is not None else float(os.getenv("TRACE_CACHE_TTL_SECONDS", "30")),
+        )
+
+    async def get_many(self, trace_ids: List[str], start_time: Optional[datetime] = None,
+                       end_time: Optional[datetime] = None) -> List[TraceLogsResponse]:
+        """Logs for each trace, in the order asked; misses are fetched together"""
+        trace_ids = list(dict.fromkeys(trace_ids))
+        results: Dict[str, TraceLogsResponse] = {}
+        missing = []
+        for trace_id in trace_ids:
+            cached = self.cache.get((trace_id, start_time, end_time))
+            if cached is not None:
+                results[trace_id] = cached.model_copy(update={"cached": True})
+            else:
+                missing.append(trace_id)
+
+        if missing:
+            fetched = await self.search_engine.trace_logs(missing, start_time, end_time)
+            for trace_id, response in fetched.items():
+                self.cache.put((trace_id, start_time, end_time), response)
+                results[trace_id] = response
+
+        return [results[trace_id] for trace_id in trace_ids]
+
+    async def get(self, trace_id: str, start_time: Optional[datetime] = None,
+                  end_time: Optional[datetime] = None) -> TraceLogsResponse:
+        return (await self.get_many([trace_id], start_time, end_time))[0]
@@ -0,0 +1,142 @@
+"""
+Unit tests for the multi-pattern matcher and ingest-time alert rules
+"""
+import json
+import os
+import timeit
+import pytest
+from models.log_schemas import AlertRule
+from services.aho_corasick import AhoCorasick
+from services.alerting import RuleSet, AlertEngine
+
+
+def _log(message, level="ERROR", service="payments", source="api"):
+    return {"level": level, "message": message, "service": service, "source": source}
+
+
+class TestAhoCorasick:
+    """Tests for the Aho-Corasick automaton"""
+
+    def test_finds_overlapping_patterns(self):
+        """Test patterns that overlap or nest are all found in one pass"""
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        assert automaton.find("ushers") == {0, 1, 3}
+        assert automaton.find("this") == {2}
+        assert automaton.find("nothing") == set()
+
+    def test_matches_plain_substring_search(self):
+        """Test results agree with naive substring checks"""
+        patterns = ["card declined", "declined", "timeout", "time", "gateway timeout", "out of"]
+        automaton = AhoCorasick(patterns)
+        for text in ["gateway timeout after 30s", "card declined: insufficient funds", "out of memory", "ok"]:
+            assert automaton.find(text) == {i for i, p in enumerate(patterns) if p in text}
+
+    def test_prefilter_keeps_non_matching_text_fast(self):
+        """Test text without any pattern skips the automaton walk and is several times faster"""
+        patterns = ["card declined", "do not honor", "timeout", "fraud", "insufficient funds",
+                    "gateway error", "sqlstate", "deadlock", "oom (killed)", "connection reset"]
+        automaton = AhoCorasick(patterns)
+        message = ("payment processed for merchant 12345 order abcdef amount 1099 currency usd " * 4)[:267]
+
+        assert automaton.find(message) == set()
+        assert automaton.find(message + " oom (killed) after timeout") == {2, 8}
+        scan = min(timeit.repeat(lambda: automaton._scan(message), number=2000, repeat=3))
+        find = min(timeit.repeat(lambda: automaton.find(message), number=2000, repeat=3))
+        assert find < scan / 2
+
+    def test_empty_pattern_rejected(self):
+        """Test an empty pattern is refused instead of matching everything"""
+        with pytest.raises(ValueError):
+            AhoCorasick(["ok", ""])
+
+
+class TestRuleSet:
+    """Tests for compiled rule matching"""
+
+    @pytest.fixture
+    def rule_set(self):
+        return RuleSet([
+            AlertRule(name="declines", contains=["card declined", "do not honor"], services=["payments"]),
+            AlertRule(name="fraud", regex=r"fraud score \d{2,}", levels=["ERROR", "CRITICAL"]),
+            AlertRule(name="exact", contains=["SQLSTATE"], case_sensitive=True),
+            AlertRule(name="critical", levels=["CRITICAL"]),
+        ])
+
+    def test_substring_rules_with_filters(self, rule_set):
+        """Test substring rules match case-insensitively within their filters"""
+        assert [r.name for r in rule_set.match(_log("Card Declined by issuer"))] == ["declines"]
+        assert rule_set.match(_log("card declined", service="checkout")) == []
+
+    def test_regex_and_level_only_rules(self, rule_set):
+        """Test regex rules and filter-only rules"""
+        assert [r.name for r in rule_set.match(_log("fraud score 97", level="CRITICAL"))] == ["fraud", "critical"]
+        assert rule_set.match(_log("fraud score 97", level="INFO")) == []
+
+    def test_case_sensitive_substring(self, rule_set):
+        """Test case-sensitive substrings are confirmed against the original message"""
+        assert [r.name for r in rule_set.match(_log("SQLSTATE 40001"))] == ["exact"]
+        assert rule_set.match(_log("sqlstate 40001")) == []
+
+
+class TestAlertEngine:
+    """Tests for rate-windowed alerting and hot reload"""
+
+    @pytest.fixture
+    def rules_file(self, tmp_path):
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps([
+            {"name": "declines", "contains": ["card declined"], "threshold": 3, "window_seconds": 60},
+        ]))
+        return path
+
+    def test_fires_at_threshold_within_window(self, rules_file):
+        """Test a rule fires once threshold matches fall in the window, then stays quiet"""
+        engine = AlertEngine(rules_path=str(rules_file))
+        engine.reload()
+
+        assert engine.evaluate(_log("card declined"), now=0) == []
+        assert engine.evaluate(_log("card declined"), now=10) == []
+        events = engine.evaluate(_log("card declined"), now=20)
+        assert [(e.rule, e.count) for e in events] == [("declines", 3)]
+
+        for now in (21, 22, 23):
+            assert engine.evaluate(_log("card declined"), now=now) == []
+        engine.evaluate(_log("card declined"), now=85)
+        engine.evaluate(_log("card declined"), now=86)
+        assert len(engine.evaluate(_log("card declined"), now=87)) == 1
+
+    def test_matches_outside_window_expire(self, rules_file):
+        """Test matches older than the window do not count towards the threshold"""
+        engine = AlertEngine(rules_path=str(rules_file))
+        engine.reload()
+
+        engine.evaluate(_log("card declined"), now=0)
+        engine.evaluate(_log("card declined"), now=50)
+        assert engine.evaluate(_log("card declined"), now=70) == []
+
+    def test_hot_reload(self, rules_file):
+        """Test a changed rules file replaces the rules and a broken one is ignored"""
+        engine = AlertEngine(rules_path=str(rules_file))
+        assert engine.reload() is True
+        assert engine.reload() is False
+
+        rules_file.write_text(json.dumps([{"name": "timeouts", "contains": ["timeout"]}]))
+        os.utime(rules_file, (1, 1))
+        assert engine.reload() is True
+        assert [r.name for r in engine.rule_set.rules] == ["timeouts"]
+
+        rules_file.write_text("not json")
+        os.utime(rules_file, (2, 2))
+        assert engine.reload() is False
+        assert [r.name for r in engine.rule_set.rules] == ["timeouts"]
+
+    @pytest.mark.asyncio
+    async def test_events_logged_without_webhook(self, rules_file):
+        """Test pending events are delivered to the log sink on shutdown"""
+        engine = AlertEngine(rules_path=str(rules_file), webhook_url="")
+        engine.reload()
+        for now in (0, 1, 2):
+            engine.evaluate(_log("card declined"), now=now)
+
+        await engine.stop()
+        assert not engine._pending
@@ -4,8 +4,9 @@ Perfect for interview demonstration - focused and clean
 """
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock
-from models.log_schemas import LogEntry, LogLevel
+from unittest.mock import patch, AsyncMock, MagicMock
+from datetime import datetime
+from models.log_schemas import LogEntry, LogLevel, LogSearchResponse, QueryProfile, TraceLogsResponse
 
 
 def test_health_endpoint(test_client):
@@ -17,6 +18,24 @@ def test_health_endpoint(test_client):
     assert "timestamp" in data
 
 
+def test_liveness_endpoint(test_client):
+    """Test the liveness endpoint doesn't depend on Elasticsearch"""
+    response = test_client.get("/health/live")
+    assert response.status_code == 200
+
+
+@patch('main.health_monitor')
+def test_readiness_endpoint(mock_health_monitor, test_client):
+    """Test readiness returns 503 when the cached probe says not ready"""
+    mock_health_monitor.readiness.return_value = {"ready": False, "elasticsearch": "unreachable"}
+    response = test_client.get("/health/ready")
+    assert response.status_code == 503
+    
+    mock_health_monitor.readiness.return_value = {"ready": True, "elasticsearch": "connected"}
+    response = test_client.get("/health/ready")
+    assert response.status_code == 200
+
+
 @patch('main.search_engine')
 def test_log_ingestion_success(mock_search_engine, test_client):
     """Test successful log ingestion"""
@@ -72,4 +91,79 @@ def test_log_search(mock_search_engine, test_client):
     assert response.status_code == 200
     data = response.json()
     assert len(data["logs"]) == 1
-    assert data["total_count"] == 1
\ No newline at end of file
+    assert data["total_count"] == 1
+
+
+@patch('main.search_engine')
+def test_search_profile_header(mock_search_engine, test_client):
+    """Test profiled searches return the breakdown and a Server-Timing header"""
+    mock_search_engine.search_logs = AsyncMock(return_value=LogSearchResponse(
+        logs=[],
+        total_count=0,
+        took_ms=4.0,
+        profile=QueryProfile(query_build_ms=0.1, es_took_ms=2.0, transport_ms=1.5, deserialize_ms=0.2, total_ms=4.0)
+    ))
+    
+    response = test_client.get("/logs/search", params={"query": "test", "profile": "true"})
+    assert response.status_code == 200
+    assert response.json()["profile"]["es_took_ms"] == 2.0
+    assert "es;dur=2.000" in response.headers["server-timing"]
+    assert "serialize;dur=" in response.headers["server-timing"]
+
+
+@patch('main.ingest_queue')
+def test_batch_ingest(mock_ingest_queue, test_client):
+    """Test a batch is validated and queued, and an invalid one is rejected like any request body"""
+    mock_ingest_queue.free_slots.return_value = 100
+    response = test_client.post("/logs/batch-ingest", json=[
+        {"level": "INFO", "message": "one", "source": "web"},
+        {"level": "ERROR", "message": "two", "source": "web"},
+    ])
+    assert response.status_code == 200
+    queued = [call.args[0] for call in mock_ingest_queue.submit.call_args_list]
+    assert [doc["message"] for doc in queued] == ["one", "two"]
+    assert queued[0]["correlation_id"] == response.json()["correlation_id"]
+
+    response = test_client.post("/logs/batch-ingest", json=[{"level": "NOPE", "message": "x", "source": "web"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 0, "level"]
+
+
+def test_unknown_job_not_found(test_client):
+    """Test polling an unknown or expired job returns 404"""
+    from services.fake_elasticsearch import FakeCluster
+    from services.search_jobs import SearchJobManager
+    with patch('main.job_manager', SearchJobManager(MagicMock(client=FakeCluster().client()))):
+        response = test_client.get("/jobs/does-not-exist")
+    assert response.status_code == 404
+
+
+@patch('main.ingest_queue')
+def test_otlp_logs_endpoint(mock_ingest_queue, test_client):
+    """Test the OTLP receiver queues every record and answers in protobuf"""
+    from tests.test_otlp_receiver_unit import _request
+    mock_ingest_queue.free_slots.return_value = 100
+
+    response = test_client.post(
+        "/v1/logs", content=_request().SerializeToString(), headers={"Content-Type": "application/x-protobuf"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-protobuf"
+    assert mock_ingest_queue.submit.call_count == 1
+
+    mock_ingest_queue.free_slots.return_value = 0
+    response = test_client.post(
+        "/v1/logs", content=_request().SerializeToString(), headers={"Content-Type": "application/x-protobuf"}
+    )
+    assert response.status_code == 503
+
+
+@patch('main.trace_lookup')
+def test_trace_logs_endpoint(mock_trace_lookup, test_client):
+    """Test the trace lookup endpoint passes the time hint through"""
+    mock_trace_lookup.get = AsyncMock(return_value=TraceLogsResponse(trace_id="t1", total_count=0, spans=[]))
+
+    response = test_client.get("/traces/t1/logs", params={"start_time": "2026-10-19T10:00:00"})
+    assert response.status_code == 200
+    assert response.json()["trace_id"] == "t1"
+    assert mock_trace_lookup.get.call_args.args[1] == datetime(2026, 10, 19, 10, 0)
@@ -0,0 +1,179 @@
+"""
+Unit tests for adaptive bulk sizing and rejected-item retries
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.bulk_controller import AdaptiveBulkController, is_rejection
+from services.ingest_queue import IngestQueue
+from services.log_batch import LogBatch
+from services.search_engine import SearchEngine
+
+
+def _log(message):
+    return {"level": "INFO", "message": message, "source": "test-app"}
+
+
+def _controller(**kwargs):
+    options = dict(
+        initial_docs=100, min_docs=10, max_docs=1000, min_bytes=1024, max_bytes=1024 * 1024,
+        max_concurrency=4, target_latency=1.0, retry_base_delay=0.001, retry_max_delay=0.001,
+    )
+    options.update(kwargs)
+    return AdaptiveBulkController(**options)
+
+
+class TestAdaptiveBulkController:
+    """Tests for the AIMD limits"""
+
+    def test_fast_bulks_grow_additively(self):
+        """Test size and concurrency grow while bulks stay under the target latency"""
+        controller = _controller()
+        for _ in range(4):
+            controller.on_success(controller.epoch, latency=0.1)
+
+        assert controller.bulk_docs == 140
+        assert controller.concurrency == 3
+
+    def test_rejection_halves_size_and_concurrency(self):
+        """Test a rejection cuts both limits multiplicatively"""
+        controller = _controller(initial_docs=400)
+        controller.concurrency_limit = 4.0
+        controller.on_rejected(controller.epoch, rejected=5)
+
+        assert controller.bulk_docs == 200
+        assert controller.concurrency == 2
+
+    def test_slow_bulk_shrinks_size_only(self):
+        """Test a bulk over the target latency shrinks the size but keeps concurrency"""
+        controller = _controller(initial_docs=400)
+        controller.concurrency_limit = 4.0
+        controller.on_success(controller.epoch, latency=2.5)
+
+        assert controller.bulk_docs == 200
+        assert controller.concurrency == 4
+
+    def test_one_decrease_per_round(self):
+        """Test results from requests sent before a decrease do not cut the limits again"""
+        controller = _controller(initial_docs=400)
+        epoch = controller.epoch
+        controller.on_rejected(epoch, rejected=1)
+        controller.on_rejected(epoch, rejected=1)
+
+        assert controller.bulk_docs == 200
+
+    def test_limits_are_bounded(self):
+        """Test the limits never leave their configured range"""
+        controller = _controller()
+        for _ in range(20):
+            controller.on_rejected(controller.epoch, rejected=1)
+        assert controller.bulk_docs == 10
+        assert controller.bulk_bytes == 1024
+        assert controller.concurrency == 1
+
+        for _ in range(500):
+            controller.on_success(controller.epoch, latency=0.1)
+        assert controller.bulk_docs == 1000
+        assert controller.concurrency == 4
+
+    @pytest.mark.asyncio
+    async def test_in_flight_limit(self):
+        """Test acquire waits while all slots are taken"""
+        controller = _controller()
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        controller.release()
+        await asyncio.wait_for(waiter, timeout=1)
+        assert controller.in_flight == 1
+
+    def test_is_rejection(self):
+        """Test both the 429 status and the rejected-execution error type count"""
+        assert is_rejection({"status": 429})
+        assert is_rejection({"status": 503, "error": {"type": "es_rejected_execution_exception"}})
+        assert not is_rejection({"status": 400, "error": {"type": "mapper_parsing_exception"}})
+
+
+class TestRejectedItemRetry:
+    """Tests for retrying only rejected bulk items"""
+
+    @pytest.mark.asyncio
+    async def test_only_rejected_rows_retried(self):
+        """Test rejected rows are resent alone and the controller backs off"""
+        engine = MagicMock()
+        engine.new_batch = LogBatch
+        engine.index_logs_batch = AsyncMock(side_effect=[
+            {"success": True, "indexed": 3, "errors": 0, "rejected": [1, 4]},
+            {"success": True, "indexed": 1, "errors": 0, "rejected": [4]},
+            {"success": True, "indexed": 1, "errors": 0, "rejected": []},
+        ])
+        controller = _controller(initial_docs=5)
+        queue = IngestQueue(engine, max_size=100, flush_interval=10, controller=controller)
+        for i in range(5):
+            queue.submit(_log(str(i)))
+
+        await queue.stop()
+
+        calls = engine.index_logs_batch.call_args_list
+        assert [call.kwargs.get("rows") for call in calls] == [None, [1, 4], [4]]
+        assert controller.epoch == 2
+        assert controller.in_flight == 0
+        assert queue.size == 0
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self):
+        """Test rows that keep being rejected are dropped after max_retries"""
+        engine = MagicMock()
+        engine.new_batch = LogBatch
+        engine.index_logs_batch = AsyncMock(return_value={"success": True, "indexed": 0, "errors": 0, "rejected": [0]})
+        queue = IngestQueue(engine, max_size=100, flush_interval=10, controller=_controller(max_retries=2))
+        queue.submit(_log("stuck"))
+
+        await queue.stop()
+
+        assert engine.index_logs_batch.call_count == 3
+        assert queue.size == 0
+
+
+class TestBulkResponseParsing:
+    """Tests for per-item results from index_logs_batch"""
+
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_rejected_items_reported_by_row(self, mock_es_class):
+        """Test rejected items are mapped back to batch rows and other errors counted"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        mock_client.bulk.return_value = {"errors": True, "items": [
+            {"index": {"status": 201}},
+            {"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}},
+            {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}},
+        ]}
+
+        search_engine = SearchEngine()
+        batch = search_engine.new_batch()
+        for i in range(4):
+            batch.append(_log(str(i)))
+        result = await search_engine.index_logs_batch(batch, rows=[0, 2, 3])
+
+        assert result == {"success": True, "indexed": 1, "errors": 1, "rejected": [2]}
+        body = mock_client.bulk.call_args[1]["operations"]
+        assert body.count(b"\n") == 6
+
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_whole_request_rejected(self, mock_es_class):
+        """Test a 429 on the whole request marks every row as rejected"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        error = Exception("too many requests")
+        error.status_code = 429
+        mock_client.bulk.side_effect = error
+
+        search_engine = SearchEngine()
+        result = await search_engine.index_logs_batch([_log("a"), _log("b")])
+
+        assert result["success"] is False
+        assert result["rejected"] == [0, 1]
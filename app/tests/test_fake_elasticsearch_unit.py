@@ -0,0 +1,359 @@
+"""
+Unit tests for the in-process fake Elasticsearch, driven through the real client
+"""
+import time
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from datetime import datetime, timedelta
+from elasticsearch import ConflictError, NotFoundError, ApiError
+from services.fake_elasticsearch import FakeCluster, constant, lognormal, per_doc
+from services.search_engine import SearchEngine
+from services.retention import LeaderLock, RetentionManager
+from services.bulk_controller import AdaptiveBulkController
+from services.ingest_queue import IngestQueue
+from models.log_schemas import SearchQuery
+
+
+def _logs(count, start=None, **fields):
+    # Whole seconds, since stored timestamps keep millisecond precision
+    start = start or datetime.utcnow().replace(microsecond=0) - timedelta(minutes=10)
+    return [dict({
+        "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        "level": "ERROR" if i % 3 == 0 else "INFO",
+        "message": f"payment declined code {i % 2}",
+        "source": "api",
+        "service": f"svc{i % 2}",
+    }, **fields) for i in range(count)]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setenv("INDEX_PARTITIONING", "none")
+    return SearchEngine(client=FakeCluster().client())
+
+
+class TestFakeDocuments:
+    """Tests for document writes and reads"""
+
+    @pytest.mark.asyncio
+    async def test_get_create_and_compare_and_set(self):
+        """Test op_type=create and if_seq_no conflicts surface as ConflictError"""
+        client = FakeCluster().client()
+        with pytest.raises(NotFoundError):
+            await client.get(index="locks", id="a")
+
+        await client.index(index="locks", id="a", document={"holder": "x"}, op_type="create")
+        with pytest.raises(ConflictError):
+            await client.index(index="locks", id="a", document={"holder": "y"}, op_type="create")
+
+        current = await client.get(index="locks", id="a")
+        await client.index(index="locks", id="a", document={"holder": "y"},
+                           if_seq_no=current["_seq_no"], if_primary_term=current["_primary_term"])
+        with pytest.raises(ConflictError):
+            await client.index(index="locks", id="a", document={"holder": "z"},
+                               if_seq_no=current["_seq_no"], if_primary_term=current["_primary_term"])
+        assert (await client.get(index="locks", id="a"))["_source"] == {"holder": "y"}
+
+    @pytest.mark.asyncio
+    async def test_leader_lock(self):
+        """Test the retention lease works against the fake"""
+        client = FakeCluster().client()
+        first = LeaderLock(client, "retention", ttl_seconds=60, holder="pod-a")
+        second = LeaderLock(client, "retention", ttl_seconds=60, holder="pod-b")
+
+        assert await first.acquire() is True
+        assert await second.acquire() is False
+        await first.release()
+        assert await second.acquire() is True
+
+
+class TestFakeSearch:
+    """Tests for queries, sorting, paging and aggregations"""
+
+    @pytest.mark.asyncio
+    async def test_search_filters_sorts_and_pages(self, engine):
+        """Test term, multi_match and range queries with newest-first paging"""
+        await engine.initialize()
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=10)
+        result = await engine.index_logs_batch(_logs(12, start))
+        assert result["indexed"] == 12
+
+        response = await engine.search_logs(SearchQuery(query="declined", level="ERROR", limit=2, offset=1))
+        assert response.total_count == 4
+        assert [log.timestamp for log in response.logs] == [start + timedelta(seconds=6), start + timedelta(seconds=3)]
+
+        response = await engine.search_logs(SearchQuery(
+            query="", service="svc1", start_time=start + timedelta(seconds=5), end_time=start + timedelta(seconds=9)
+        ))
+        assert response.total_count == 3
+        assert {log.service for log in response.logs} == {"svc1"}
+
+        response = await engine.search_logs(SearchQuery(query="refund"))
+        assert response.total_count == 0
+
+    @pytest.mark.asyncio
+    async def test_error_pattern_aggregations(self, engine):
+        """Test terms buckets with min/max date and nested terms sub-aggregations"""
+        await engine.initialize()
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+        await engine.index_logs_batch(_logs(9, start))
+
+        patterns = await engine.find_error_patterns(hours=2)
+        assert [(p.pattern, p.count, p.services) for p in patterns] == [
+            ("payment declined code 0", 2, ["svc0"]),
+            ("payment declined code 1", 1, ["svc1"]),
+        ]
+        assert patterns[0].first_seen.replace(tzinfo=None) == start
+        assert patterns[0].last_seen.replace(tzinfo=None) == start + timedelta(seconds=6)
+
+        assert await engine.find_error_patterns(hours=0) == []
+
+    @pytest.mark.asyncio
+    async def test_trace_lookup_uses_msearch(self, engine):
+        """Test msearch returns one response per trace in time order"""
+        await engine.initialize()
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+        await engine.index_logs_batch(_logs(3, start, trace_id="t1") + _logs(2, start, trace_id="t2"))
+
+        results = await engine.trace_logs(["t1", "t2", "t3"], start, start + timedelta(minutes=1))
+        assert [results[t].total_count for t in ("t1", "t2", "t3")] == [3, 2, 0]
+        timestamps = [log.timestamp for log in results["t1"].spans[0].logs]
+        assert timestamps == sorted(timestamps)
+
+
+class TestFakeIndexAdmin:
+    """Tests for templates, settings and the retention calls"""
+
+    @pytest.mark.asyncio
+    async def test_partitioned_setup_and_retention(self, monkeypatch):
+        """Test templates apply to auto-created partitions and retention expires and seals them"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "daily")
+        cluster = FakeCluster()
+        engine = SearchEngine(client=cluster.client())
+        await engine.initialize()
+        assert "logs" in cluster.templates
+
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        names = {days_ago: f"logs-{today - timedelta(days=days_ago):%Y.%m.%d}" for days_ago in (0, 1, 5, 40)}
+        # Write the old days before they count as sealed, as if the logs had arrived on time
+        monkeypatch.setenv("RETENTION_SEAL_AFTER_DAYS", "0")
+        backfill = SearchEngine(client=engine.client)
+        for days_ago in (1, 5, 40):
+            await backfill.index_logs_batch(_logs(2, today - timedelta(days=days_ago)))
+        assert sorted(cluster.indices) == sorted(names[days_ago] for days_ago in (1, 5, 40))
+        assert cluster.indices[names[1]].mappings["_meta"]["mapping_hash"]
+
+        manager = RetentionManager(engine, retention_days=30, action="delete", seal_after_days=2,
+                                   force_merge=True, lock=LeaderLock(engine.client, "retention", 60, holder="a"))
+        actions = await manager.run_once(today=today.date())
+        assert actions["expired"] == [names[40]]
+        assert actions["merged"] == [names[5]]
+        assert cluster.indices[names[5]].write_blocked
+        assert names[40] not in cluster.indices
+
+        # A late log for a sealed day is kept in today's partition
+        result = await engine.index_logs_batch(_logs(1, today - timedelta(days=5)))
+        assert result["indexed"] == 1
+        assert len(cluster.indices[names[0]].docs) == 1
+
+    @pytest.mark.asyncio
+    async def test_trace_lookup_finds_shrunk_partition(self, monkeypatch):
+        """Test a window lookup still finds logs after retention shrank their day to <name>-shrunk"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "daily")
+        monkeypatch.setenv("RETENTION_SEAL_AFTER_DAYS", "0")
+        cluster = FakeCluster()
+        engine = SearchEngine(client=cluster.client())
+        await engine.initialize()
+        start = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=5)
+        await engine.index_logs_batch(_logs(3, start, trace_id="t1"))
+
+        day = f"logs-{start:%Y.%m.%d}"
+        await engine.client.indices.put_settings(index=day, settings={"index.blocks.write": True})
+        await engine.client.indices.shrink(index=day, target=f"{day}-shrunk")
+        await engine.client.indices.delete(index=day)
+
+        results = await engine.trace_logs(["t1"], start, start + timedelta(minutes=1))
+        assert results["t1"].total_count == 3
+
+    @pytest.mark.asyncio
+    async def test_initialize_updates_stale_index_mapping(self, engine, monkeypatch):
+        """Test an existing index gets new fields added, and a type change is left for a reindex"""
+        await engine.client.indices.create(index=engine.index_name, mappings={"properties": {"level": {"type": "keyword"}}})
+        await engine.initialize()
+        mappings = (await engine.client.indices.get_mapping(index=engine.index_name))[engine.index_name]["mappings"]
+        assert mappings["properties"]["metadata"]["type"] == "flattened"
+        assert mappings["_meta"]["mapping_hash"]
+
+        monkeypatch.setenv("METADATA_MODE", "object")
+        updated = SearchEngine(client=engine.client)
+        warning = MagicMock()
+        monkeypatch.setattr("services.search_engine.logger.warning", warning)
+        await updated.initialize()
+        assert warning.call_args[1]["index"] == engine.index_name
+        mappings = (await engine.client.indices.get_mapping(index=engine.index_name))[engine.index_name]["mappings"]
+        assert mappings["properties"]["metadata"]["type"] == "flattened"
+
+    @pytest.mark.asyncio
+    async def test_initialize_tolerates_concurrent_create(self, engine, monkeypatch):
+        """Test an index another worker created between the mapping check and create counts as set up"""
+        await engine.client.indices.create(index=engine.index_name)
+        missing = NotFoundError("index_not_found_exception", MagicMock(status=404), {})
+        monkeypatch.setattr(engine.client.indices, "get_mapping", AsyncMock(side_effect=missing))
+
+        await engine.initialize()
+        with pytest.raises(ApiError) as error:
+            await engine.client.indices.create(index=engine.index_name)
+        assert error.value.error == "resource_already_exists_exception"
+
+    @pytest.mark.asyncio
+    async def test_missing_index_and_unknown_query(self):
+        """Test errors come back as the client's usual exceptions"""
+        client = FakeCluster().client()
+        with pytest.raises(NotFoundError):
+            await client.search(index="missing", query={"match_all": {}})
+        assert (await client.search(index="missing", ignore_unavailable=True))["hits"]["total"]["value"] == 0
+        with pytest.raises(ApiError) as error:
+            await client.search(index="*", query={"fuzzy_thing": {}})
+        assert error.value.status_code == 400
+
+
+class TestFaultInjection:
+    """Tests for latency, rejections and outages"""
+
+    @pytest.mark.asyncio
+    async def test_item_rejections_are_reproducible(self, monkeypatch):
+        """Test the same seed rejects the same bulk items"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "none")
+        rejected = []
+        for _ in range(2):
+            engine = SearchEngine(client=FakeCluster(seed=7, bulk_reject_rate=0.3).client())
+            result = await engine.index_logs_batch(_logs(50))
+            rejected.append(result["rejected"])
+            assert result["indexed"] == 50 - len(result["rejected"])
+
+        assert rejected[0] == rejected[1]
+        assert 0 < len(rejected[0]) < 50
+
+        # Only the rejected rows are sent again
+        engine = SearchEngine(client=FakeCluster(seed=7, bulk_reject_rate=0.3).client())
+        batch = engine.new_batch()
+        for log in _logs(50):
+            batch.append(log)
+        first = await engine.index_logs_batch(batch)
+        second = await engine.index_logs_batch(batch, rows=first["rejected"])
+        assert second["indexed"] + first["indexed"] + len(second["rejected"]) == 50
+
+    @pytest.mark.asyncio
+    async def test_full_write_queue_rejects_overflow(self, monkeypatch):
+        """Test documents beyond bulk_queue_docs in flight are rejected"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "none")
+        cluster = FakeCluster(bulk_queue_docs=30, latency=constant(20))
+        engine = SearchEngine(client=cluster.client())
+
+        results = await asyncio.gather(*[engine.index_logs_batch(_logs(20)) for _ in range(3)])
+        assert sorted(len(result["rejected"]) for result in results) == [0, 10, 20]
+        assert cluster.stats["items_rejected"] == 30
+        assert cluster.bulk_in_flight_docs == 0
+
+    @pytest.mark.asyncio
+    async def test_whole_request_rejection(self, monkeypatch):
+        """Test a 429 for the whole bulk marks every row rejected after the client's own retries"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "none")
+        cluster = FakeCluster(request_reject_rate=1.0)
+        engine = SearchEngine(client=cluster.client())
+
+        result = await engine.index_logs_batch(_logs(5))
+        assert result["success"] is False
+        assert result["rejected"] == [0, 1, 2, 3, 4]
+        assert cluster.stats["requests_rejected"] == 4
+        assert cluster.stats["docs_indexed"] == 0
+
+    @pytest.mark.asyncio
+    async def test_outages(self):
+        """Test connection and status outages, and recovery once they end"""
+        cluster = FakeCluster()
+        engine = SearchEngine(client=cluster.client(max_retries=0))
+
+        cluster.start_outage()
+        assert await engine.is_reachable(timeout=1) is False
+        cluster.end_outage()
+        assert await engine.is_reachable(timeout=1) is True
+
+        cluster.start_outage(duration=0.05, status=503)
+        with pytest.raises(ApiError) as error:
+            await engine.client.cluster.health()
+        assert error.value.status_code == 503
+        await asyncio.sleep(0.06)
+        assert await engine.is_reachable(timeout=1) is True
+
+    @pytest.mark.asyncio
+    async def test_latency_models(self):
+        """Test requests take the sampled latency, which is reported as took"""
+        cluster = FakeCluster(latency=constant(30), bulk_latency=per_doc(1.0, constant(5)))
+        client = cluster.client()
+
+        started = time.monotonic()
+        response = await client.search(index="*")
+        assert time.monotonic() - started >= 0.03
+        assert response["took"] == 30
+
+        response = await client.bulk(operations=[{"index": {"_index": "a"}}, {"n": 1}] * 20)
+        assert response["took"] == 25
+
+        samples = [lognormal(10, 0.5)(cluster.rng, 1) for _ in range(1000)]
+        assert 8 < sorted(samples)[500] < 12
+
+    @pytest.mark.asyncio
+    async def test_from_url(self, monkeypatch):
+        """Test ELASTICSEARCH_URL=fake://... builds a configured fake cluster"""
+        monkeypatch.setenv("ELASTICSEARCH_URL", "fake://?seed=3&latency_ms=2&bulk_reject_rate=0.5&bulk_queue_docs=100")
+        engine = SearchEngine()
+        cluster = engine.client.transport.node_pool.get().cluster
+        assert cluster.bulk_reject_rate == 0.5
+        assert cluster.bulk_queue_docs == 100
+        assert await engine.is_reachable(timeout=1) is True
+
+        with pytest.raises(ValueError):
+            FakeCluster.from_url("fake://?reject=1")
+
+
+class TestIngestUnderLoad:
+    """End-to-end ingest through the adaptive flusher against a struggling cluster"""
+
+    @pytest.mark.asyncio
+    async def test_every_log_lands_despite_rejections(self, monkeypatch):
+        """Test rejected items are retried until all logs are indexed once"""
+        monkeypatch.setenv("INDEX_PARTITIONING", "none")
+        cluster = FakeCluster(seed=1, bulk_reject_rate=0.2, bulk_queue_docs=60, latency=per_doc(0.05, constant(2)))
+        engine = SearchEngine(client=cluster.client())
+        controller = AdaptiveBulkController(initial_docs=40, min_docs=5, max_docs=200, max_concurrency=4,
+                                            retry_base_delay=0.001, retry_max_delay=0.01, max_retries=20)
+        queue = IngestQueue(engine, max_size=1000, flush_interval=0.01, controller=controller)
+
+        queue.start()
+        for log in _logs(500):
+            assert queue.submit(log)
+        for _ in range(200):
+            if queue.size == 0:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+        assert cluster.stats["items_rejected"] > 0
+        assert cluster.stats["docs_indexed"] == 500
+        assert len(cluster.indices["logs"].docs) == 500
+
+    @pytest.mark.asyncio
+    async def test_ingest_benchmark_reports_rejections(self, monkeypatch):
+        """Test the ingest benchmark indexes every log and reports throughput and pushback"""
+        from benchmarks.ingest import run
+        monkeypatch.setenv("INDEX_PARTITIONING", "none")
+        controller = AdaptiveBulkController(initial_docs=40, retry_base_delay=0.001, retry_max_delay=0.01)
+        result = await run("fake://?latency_ms=1&bulk_queue_docs=50&seed=1", logs=300, queue_size=100,
+                           controller=controller)
+
+        assert result["docs"] == 300
+        assert result["docs_per_second"] > 0
+        assert result["items_rejected"] > 0
+        assert result["buffer_full"] > 0
@@ -0,0 +1,41 @@
+"""
+Unit tests for the cached health monitor
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from services.health import HealthMonitor
+
+
+class TestHealthMonitor:
+    """Tests for cached readiness"""
+
+    @pytest.mark.asyncio
+    async def test_ready_when_reachable_and_not_saturated(self):
+        """Test readiness reflects the cached ES probe"""
+        engine = MagicMock()
+        engine.is_reachable = AsyncMock(return_value=True)
+        ingest_queue = MagicMock(saturation=0.1)
+
+        monitor = HealthMonitor(engine, ingest_queue, interval=60, max_queue_saturation=0.8)
+        await monitor.probe()
+
+        assert monitor.readiness()["ready"] is True
+        assert monitor.elasticsearch_status == "connected"
+
+    @pytest.mark.asyncio
+    async def test_not_ready_when_saturated(self):
+        """Test a saturated ingest buffer takes the pod out of rotation"""
+        engine = MagicMock()
+        engine.is_reachable = AsyncMock(return_value=True)
+        ingest_queue = MagicMock(saturation=0.9)
+
+        monitor = HealthMonitor(engine, ingest_queue, interval=60, max_queue_saturation=0.8)
+        await monitor.probe()
+
+        assert monitor.readiness()["ready"] is False
+
+    def test_unknown_before_first_probe(self):
+        """Test nothing is reported as connected before a probe ran"""
+        monitor = HealthMonitor(MagicMock(), MagicMock(saturation=0.0), interval=60)
+        assert monitor.elasticsearch_status == "unknown"
+        assert monitor.readiness()["ready"] is False
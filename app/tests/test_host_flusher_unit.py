@@ -0,0 +1,165 @@
+"""
+Unit tests for per-host flush coordination and the parse pool
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from services.host_flusher import HostFlushCoordinator
+from services.ingest_queue import IngestQueue
+from services.log_batch import LogBatch, LogEntriesError, parse_log_entries
+from services.otlp_receiver import decode_documents
+from services.parse_pool import ParsePool
+
+
+def _batch(*messages):
+    batch = LogBatch()
+    for message in messages:
+        batch.append({"level": "INFO", "message": message, "source": "web"})
+    return batch
+
+
+class TestHostFlushCoordinator:
+    """Tests for flusher election and batch forwarding over the Unix socket"""
+
+    @pytest.mark.asyncio
+    async def test_follower_forwards_to_leader(self, tmp_path):
+        """Test the first worker leads and the others hand it their batches"""
+        leader_queue = MagicMock()
+        leader_queue.submit_batch.return_value = True
+        leader = HostFlushCoordinator(leader_queue, directory=str(tmp_path), enabled=True)
+        follower = HostFlushCoordinator(MagicMock(), directory=str(tmp_path), enabled=True)
+        await leader.start()
+        await follower.start()
+
+        assert (leader.is_leader, follower.is_leader) == (True, False)
+        assert await follower.forward(_batch("a", "b")) is True
+        assert await follower.forward(_batch("c")) is True
+        forwarded = [call.args[0] for call in leader_queue.submit_batch.call_args_list]
+        assert [len(batch) for batch in forwarded] == [2, 1]
+
+        await follower.stop()
+        await leader.stop()
+
+    @pytest.mark.asyncio
+    async def test_follower_takes_over_when_leader_stops(self, tmp_path):
+        """Test a follower takes the lock once the flusher is gone and flushes itself"""
+        leader = HostFlushCoordinator(MagicMock(), directory=str(tmp_path), enabled=True)
+        follower = HostFlushCoordinator(MagicMock(), directory=str(tmp_path), enabled=True)
+        await leader.start()
+        await follower.start()
+        await leader.stop()
+
+        assert await follower.forward(_batch("a")) is False
+        assert follower.is_leader is True
+        await follower.stop()
+
+    @pytest.mark.asyncio
+    async def test_full_leader_pushes_back(self, tmp_path):
+        """Test a full flusher makes the follower wait instead of dropping the batch"""
+        leader_queue = MagicMock()
+        leader_queue.submit_batch.side_effect = [False, False, True]
+        leader = HostFlushCoordinator(leader_queue, directory=str(tmp_path), enabled=True)
+        follower = HostFlushCoordinator(MagicMock(), directory=str(tmp_path), enabled=True, full_retry_delay=0.01)
+        await leader.start()
+        await follower.start()
+
+        assert await follower.forward(_batch("a")) is True
+        assert leader_queue.submit_batch.call_count == 3
+        await follower.stop()
+        await leader.stop()
+
+    @pytest.mark.asyncio
+    async def test_ingest_queue_forwards_instead_of_indexing(self, tmp_path):
+        """Test a follower's sealed batches go to the flusher, which indexes them in larger bulks"""
+        engine = MagicMock()
+        engine.new_batch = LogBatch
+        engine.index_logs_batch = AsyncMock(return_value={"success": True, "indexed": 0, "errors": 0, "rejected": []})
+        leader_queue = IngestQueue(engine, max_size=100, batch_size=50, flush_interval=10)
+        follower_queue = IngestQueue(MagicMock(new_batch=LogBatch), max_size=100, batch_size=2, flush_interval=10)
+        leader_queue.coordinator = HostFlushCoordinator(leader_queue, directory=str(tmp_path), enabled=True)
+        follower_queue.coordinator = HostFlushCoordinator(follower_queue, directory=str(tmp_path), enabled=True)
+        await leader_queue.coordinator.start()
+        await follower_queue.coordinator.start()
+
+        for i in range(4):
+            follower_queue.submit({"level": "INFO", "message": str(i), "source": "web"})
+        await follower_queue.stop()
+        await leader_queue.coordinator.stop()
+        await leader_queue.stop()
+        await follower_queue.coordinator.stop()
+
+        sizes = [len(call.args[0]) for call in engine.index_logs_batch.call_args_list]
+        assert sizes == [4]
+
+    @pytest.mark.asyncio
+    async def test_flusher_evaluates_alerts_for_forwarded_batches(self, tmp_path):
+        """Test alert rules are matched once, by the flusher, for logs received by any worker"""
+        engine = MagicMock()
+        engine.new_batch = LogBatch
+        engine.index_logs_batch = AsyncMock(return_value={"success": True, "indexed": 0, "errors": 0, "rejected": []})
+        leader_alerts = MagicMock()
+        follower_alerts = MagicMock()
+        leader_queue = IngestQueue(engine, max_size=100, batch_size=50, flush_interval=10, alert_engine=leader_alerts)
+        follower_queue = IngestQueue(MagicMock(new_batch=LogBatch), max_size=100, batch_size=2, flush_interval=10,
+                                     alert_engine=follower_alerts)
+        leader_queue.coordinator = HostFlushCoordinator(leader_queue, directory=str(tmp_path), enabled=True)
+        follower_queue.coordinator = HostFlushCoordinator(follower_queue, directory=str(tmp_path), enabled=True)
+        await leader_queue.coordinator.start()
+        await follower_queue.coordinator.start()
+
+        leader_queue.submit({"level": "ERROR", "message": "own", "source": "web"})
+        follower_queue.submit({"level": "ERROR", "message": "forwarded", "source": "web", "trace_id": "t1"})
+        await follower_queue.stop()
+        await leader_queue.coordinator.stop()
+        await leader_queue.stop()
+        await follower_queue.coordinator.stop()
+
+        follower_alerts.evaluate.assert_not_called()
+        evaluated = [call.args[0] for call in leader_alerts.evaluate.call_args_list]
+        assert [(doc["message"], doc["level"], doc["trace_id"]) for doc in evaluated] == [
+            ("own", "ERROR", None), ("forwarded", "ERROR", "t1"),
+        ]
+
+
+class TestParsePool:
+    """Tests for the optional parse process pool"""
+
+    @pytest.mark.asyncio
+    async def test_inline_when_disabled_or_small(self):
+        """Test small payloads and a disabled pool parse in-process"""
+        pool = ParsePool(workers=0)
+        assert await pool.run(len, b"abc", size=3) == 3
+        assert pool._executor is None
+
+        pool = ParsePool(workers=1, min_bytes=1024)
+        assert await pool.run(len, b"abc", size=3) == 3
+        assert pool._executor is None
+
+    @pytest.mark.asyncio
+    async def test_runs_in_worker_process(self):
+        """Test large payloads are decoded in the pool"""
+        from tests.test_otlp_receiver_unit import _request
+        body = _request().SerializeToString()
+        pool = ParsePool(workers=1, min_bytes=0)
+        try:
+            documents = await pool.run(decode_documents, body, "application/x-protobuf", "", "corr", size=len(body))
+        finally:
+            pool.shutdown()
+
+        assert documents[0]["service"] == "payments"
+        assert documents[0]["correlation_id"] == "corr"
+
+    @pytest.mark.asyncio
+    async def test_batch_ingest_validated_in_worker_process(self):
+        """Test a batch-ingest body is validated in the pool and errors come back intact"""
+        pool = ParsePool(workers=1, min_bytes=0)
+        try:
+            body = b'[{"level": "ERROR", "message": "declined", "source": "web"}]'
+            documents = await pool.run(parse_log_entries, body, "corr", size=len(body))
+            with pytest.raises(LogEntriesError) as error:
+                await pool.run(parse_log_entries, b'[{"level": "NOPE"}]', "corr", size=1)
+        finally:
+            pool.shutdown()
+
+        assert documents[0]["message"] == "declined"
+        assert documents[0]["correlation_id"] == "corr"
+        assert error.value.errors[0]["loc"] == (0, "level")
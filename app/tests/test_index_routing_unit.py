@@ -0,0 +1,163 @@
+"""
+Unit tests for service-based index routing and fan-out search
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from models.log_schemas import SearchQuery
+from services.index_routing import IndexRouter
+from services.search_engine import SearchEngine
+
+RULES = [
+    {"group": "payments", "services": ["payments"], "shards": 3},
+    {"group": "gateways", "sources": ["legacy-gw"], "shards": 1},
+]
+
+
+def _hit(millis, message):
+    return {"_source": {"level": "INFO", "message": message, "source": "app"}, "sort": [millis]}
+
+
+class TestIndexRouter:
+    """Tests for IndexRouter"""
+
+    @pytest.fixture
+    def router(self):
+        return IndexRouter("logs", RULES)
+
+    def test_service_rules_take_precedence(self, router):
+        """Test service rules win over source rules"""
+        assert router.group_for("legacy-gw", "payments").name == "payments"
+        assert router.group_for("legacy-gw", None).name == "gateways"
+        assert router.group_for("web", "checkout").is_default
+
+    def test_base_index(self, router):
+        """Test group indices are named after the base index"""
+        assert router.base_index(router.default_group) == "logs"
+        assert router.base_index(router.groups[0]) == "logs-payments"
+
+    def test_query_targets_claimed_group_only(self, router):
+        """Test a service filter on a routed service targets one group"""
+        assert [group.name for group in router.groups_for_query(service="payments")] == ["payments"]
+
+    def test_query_unclaimed_service(self, router):
+        """Test an unclaimed service may still sit in source-routed groups"""
+        assert [group.name for group in router.groups_for_query(service="checkout")] == [None, "gateways"]
+        assert [group.name for group in router.groups_for_query(source="web", service="checkout")] == [None]
+
+    def test_query_without_filters(self, router):
+        """Test unfiltered queries fan out to every group"""
+        assert len(router.groups_for_query()) == 3
+
+    def test_transition_window_keeps_default_group(self):
+        """Test filtered searches also read the default group until the transition date"""
+        router = IndexRouter("logs", RULES, transition_until="2999-01-01")
+        assert [group.name for group in router.groups_for_query(service="payments")] == [None, "payments"]
+        assert [group.name for group in router.groups_for_query(service="checkout")] == [None, "gateways"]
+
+        ended = IndexRouter("logs", RULES, transition_until="2000-01-01")
+        assert [group.name for group in ended.groups_for_query(service="payments")] == ["payments"]
+
+    def test_invalid_group_name(self):
+        """Test group names must be safe in index names"""
+        with pytest.raises(ValueError):
+            IndexRouter("logs", [{"group": "Payments-EU"}])
+
+
+class TestFanOutSearch:
+    """Tests for concurrent group search with k-way merge"""
+
+    @patch('services.search_engine.IndexRouter', lambda index_name: IndexRouter(index_name, RULES))
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_merges_groups_newest_first(self, mock_es_class):
+        """Test hits from every group are merged on timestamp and paged with offset/limit"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        by_index = {
+            "logs": [_hit(900, "d9"), _hit(500, "d5")],
+            "logs-payments": [_hit(1000, "p10"), _hit(700, "p7"), _hit(100, "p1")],
+            "logs-gateways": [_hit(800, "g8")],
+        }
+
+        async def search(index, size, from_, **kwargs):
+            hits = by_index[index][from_:from_ + size]
+            return {"hits": {"total": {"value": len(by_index[index])}, "hits": hits}}
+
+        mock_client.search.side_effect = search
+
+        search_engine = SearchEngine()
+        result = await search_engine.search_logs(SearchQuery(query="", limit=3, offset=1))
+
+        assert [log.message for log in result.logs] == ["d9", "g8", "p7"]
+        assert result.total_count == 6
+        assert mock_client.search.call_count == 3
+
+    @patch('services.search_engine.IndexRouter', lambda index_name: IndexRouter(index_name, RULES))
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_profile_shape_matches_single_search(self, mock_es_class):
+        """Test ES profiles from several groups merge into one shards list"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+
+        async def search(index, **kwargs):
+            return {"hits": {"total": {"value": 0}, "hits": []}, "profile": {"shards": [{"id": f"[n][{index}][0]"}]}}
+
+        mock_client.search.side_effect = search
+
+        search_engine = SearchEngine()
+        result = await search_engine.search_logs(SearchQuery(query=""), profile=True, es_profile=True)
+
+        assert list(result.profile.es_profile) == ["shards"]
+        assert [shard["id"] for shard in result.profile.es_profile["shards"]] == \
+            ["[n][logs][0]", "[n][logs-payments][0]", "[n][logs-gateways][0]"]
+
+    @patch('services.search_engine.logger')
+    @patch('services.search_engine.IndexRouter', lambda index_name: IndexRouter(index_name, RULES))
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_failed_group_is_logged(self, mock_es_class, mock_logger):
+        """Test a failing group is logged with its name and the other groups still answer"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+
+        async def search(index, **kwargs):
+            if index == "logs-gateways":
+                raise RuntimeError("shard failure")
+            return {"hits": {"total": {"value": 1}, "hits": [_hit(1, index)]}}
+
+        mock_client.search.side_effect = search
+
+        search_engine = SearchEngine()
+        result = await search_engine.search_logs(SearchQuery(query=""))
+
+        assert result.total_count == 2
+        mock_logger.warning.assert_called_once()
+        assert mock_logger.warning.call_args[1]["group"] == "gateways"
+
+    @patch('services.search_engine.IndexRouter', lambda index_name: IndexRouter(index_name, RULES))
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_service_filter_hits_one_group(self, mock_es_class):
+        """Test a routed service filter queries only its group"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        mock_client.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}}
+
+        search_engine = SearchEngine()
+        await search_engine.search_logs(SearchQuery(query="", service="payments"))
+
+        mock_client.search.assert_called_once()
+        assert mock_client.search.call_args[1]["index"] == "logs-payments"
+
+    @patch.dict('os.environ', {'INDEX_PARTITIONING': 'daily', 'RETENTION_SEAL_AFTER_DAYS': '0'})
+    @patch('services.search_engine.IndexRouter', lambda index_name: IndexRouter(index_name, RULES))
+    @patch('services.search_engine.AsyncElasticsearch')
+    def test_partitioned_group_indices(self, mock_es_class):
+        """Test routed partitions and the default pattern that excludes them"""
+        search_engine = SearchEngine()
+
+        assert search_engine.index_for({"timestamp": "2026-10-19T10:00:00", "service": "payments"}) == \
+            "logs-payments-2026.10.19"
+        assert search_engine.group_index(search_engine.router.default_group) == \
+            "logs-*,-logs-payments-*,-logs-gateways-*"
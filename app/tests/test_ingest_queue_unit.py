@@ -0,0 +1,73 @@
+"""
+Unit tests for the ingest buffer
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from services.ingest_queue import IngestQueue
+from services.log_batch import LogBatch
+
+
+def _log(message):
+    return {"level": "INFO", "message": message, "source": "test-app"}
+
+
+class TestIngestQueue:
+    """Tests for IngestQueue batching and backpressure"""
+
+    @pytest.fixture
+    def search_engine(self):
+        engine = MagicMock()
+        engine.new_batch = LogBatch
+        engine.index_logs_batch = AsyncMock(return_value={"success": True, "indexed": 0, "errors": 0})
+        return engine
+
+    @pytest.mark.asyncio
+    async def test_submit_rejects_when_full(self, search_engine):
+        """Test the buffer refuses logs instead of growing without bound"""
+        queue = IngestQueue(search_engine, max_size=2, batch_size=10, flush_interval=0.01)
+        assert queue.submit(_log("a")) is True
+        assert queue.submit(_log("b")) is True
+        assert queue.submit(_log("c")) is False
+        assert queue.saturation == 1.0
+
+    @pytest.mark.asyncio
+    async def test_flushes_in_batches(self, search_engine):
+        """Test buffered logs are flushed as bulk batches"""
+        queue = IngestQueue(search_engine, max_size=100, batch_size=3, flush_interval=0.01)
+        for i in range(7):
+            queue.submit(_log(str(i)))
+
+        queue.start()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+
+        sizes = [len(call.args[0]) for call in search_engine.index_logs_batch.call_args_list]
+        assert sizes == [3, 3, 1]
+        assert queue.size == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_drains_buffer(self, search_engine):
+        """Test shutdown flushes what is still buffered"""
+        queue = IngestQueue(search_engine, max_size=100, batch_size=50, flush_interval=10)
+        for i in range(5):
+            queue.submit(_log(str(i)))
+
+        await queue.stop()
+        queue.start()
+        await queue.stop()
+
+        assert sum(len(call.args[0]) for call in search_engine.index_logs_batch.call_args_list) == 5
+
+    @pytest.mark.asyncio
+    async def test_partial_batch_flushed_after_interval(self, search_engine):
+        """Test a batch below batch_size is flushed once the flush interval passes"""
+        queue = IngestQueue(search_engine, max_size=100, batch_size=50, flush_interval=0.01)
+        queue.start()
+        await asyncio.sleep(0.01)
+
+        queue.submit(_log("late"))
+        await asyncio.sleep(0.05)
+
+        assert search_engine.index_logs_batch.call_count == 1
+        await queue.stop()
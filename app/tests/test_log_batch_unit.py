@@ -0,0 +1,109 @@
+"""
+Unit tests for the columnar ingest batch
+"""
+import json
+from datetime import datetime
+from models.log_schemas import LogEntry, LogLevel
+from services.log_batch import LogBatch, to_epoch_millis, millis_to_iso
+from services.metadata_policy import MetadataPolicy
+
+
+def _parse(body: bytes):
+    lines = body.decode().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+class TestLogBatch:
+    """Tests for LogBatch encoding and bulk serialization"""
+
+    def test_epoch_millis_round_trip(self):
+        """Test timestamps survive the millis encoding"""
+        millis = to_epoch_millis(datetime(2026, 10, 19, 10, 0, 0, 123000))
+        assert millis_to_iso(millis) == "2026-10-19T10:00:00.123"
+        assert to_epoch_millis("2026-10-19T12:00:00+02:00") == to_epoch_millis(datetime(2026, 10, 19, 10))
+
+    def test_bulk_body_matches_documents(self):
+        """Test the NDJSON body carries every field of the original logs"""
+        batch = LogBatch()
+        batch.append(LogEntry(
+            timestamp=datetime(2026, 10, 19, 10),
+            level=LogLevel.ERROR,
+            message='Card "declined"\nretrying',
+            source="payments-api",
+            service="payments",
+            trace_id="abc",
+            span_id="def",
+        ))
+        batch.append({"level": "INFO", "message": "ok", "source": "ledger", "timestamp": "2026-10-19T11:00:00"})
+
+        lines = _parse(batch.to_bulk_body(lambda millis, source, service: f"logs-{source}"))
+
+        assert lines[0] == {"index": {"_index": "logs-payments-api"}}
+        assert lines[1] == {
+            "timestamp": "2026-10-19T10:00:00.000",
+            "level": "ERROR",
+            "message": 'Card "declined"\nretrying',
+            "source": "payments-api",
+            "service": "payments",
+            "trace_id": "abc",
+            "span_id": "def",
+        }
+        assert lines[2] == {"index": {"_index": "logs-ledger"}}
+        assert lines[3] == {"timestamp": "2026-10-19T11:00:00.000", "level": "INFO", "message": "ok", "source": "ledger"}
+
+    def test_strings_dictionary_encoded(self):
+        """Test repeated source/service values are stored once per batch"""
+        batch = LogBatch()
+        for i in range(100):
+            batch.append({"level": "INFO", "message": str(i), "source": "payments-api", "service": "payments"})
+
+        assert len(batch) == 100
+        assert batch._strings == [None, "payments-api", "payments"]
+        assert set(batch.sources) == {1}
+
+    def test_metadata_policy_applied(self):
+        """Test metadata limits and hot-key promotion happen on append"""
+        policy = MetadataPolicy(mode="flattened", hot_keys={"merchant_id": "keyword"}, max_keys=1, max_value_bytes=64)
+        batch = LogBatch(policy)
+        batch.append({
+            "level": "INFO",
+            "message": "m",
+            "source": "s",
+            "correlation_id": "c-1",
+            "metadata": {"merchant_id": 7, "extra": "x"},
+        })
+
+        doc = _parse(batch.to_bulk_body(lambda *args: "logs"))[1]
+        assert doc["correlation_id"] == "c-1"
+        assert doc["metadata"] == {"merchant_id": 7}
+        assert doc["metadata_hot"] == {"merchant_id": "7"}
+        assert batch.dropped_metadata_keys == 1
+
+    def test_compact_per_log_memory(self):
+        """Test buffered logs cost far less than the pydantic + dict representation"""
+        batch = LogBatch()
+        for i in range(1000):
+            batch.append({"level": "INFO", "message": f"payment {i}", "source": "payments-api", "span_id": f"{i:016x}"})
+
+        assert batch.nbytes / len(batch) < 100
+
+
+class TestLogBatchTransfer:
+    """Tests for handing batches between worker processes"""
+
+    def test_bytes_round_trip_and_extend(self):
+        """Test a batch survives to_bytes/from_bytes and merges into another batch"""
+        first, second = LogBatch(), LogBatch()
+        first.append({"level": "INFO", "message": "a", "source": "web", "trace_id": "t1", "metadata": {"k": 1}})
+        second.append({"level": "ERROR", "message": "b", "source": "api", "service": "svc", "correlation_id": "c"})
+        second.append({"level": "DEBUG", "message": "c", "source": "web", "span_id": "s1"})
+        second.dropped_metadata_keys = 2
+        resolve = lambda millis, source, service: f"logs-{source}"
+        expected = first.to_bulk_body(resolve) + second.to_bulk_body(resolve)
+
+        merged = LogBatch.from_bytes(first.to_bytes())
+        merged.extend(LogBatch.from_bytes(second.to_bytes()))
+
+        assert len(merged) == 3
+        assert merged.to_bulk_body(resolve) == expected
+        assert merged.dropped_metadata_keys == 2
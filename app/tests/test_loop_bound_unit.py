@@ -0,0 +1,31 @@
+"""
+Unit tests for lazily created asyncio primitives
+"""
+import asyncio
+import pytest
+from services.loop_bound import loop_bound
+
+
+class Holder:
+    def __init__(self):
+        self._ready = None
+
+    @loop_bound
+    def ready(self) -> asyncio.Event:
+        return asyncio.Event()
+
+
+class TestLoopBound:
+    """Tests for loop_bound"""
+
+    def test_not_created_until_accessed(self):
+        """Test constructing the owner creates no primitive"""
+        assert Holder()._ready is None
+
+    @pytest.mark.asyncio
+    async def test_created_once_per_instance(self):
+        """Test the first access creates the primitive and later ones reuse it"""
+        holder, other = Holder(), Holder()
+        assert holder.ready is holder.ready
+        assert holder._ready is holder.ready
+        assert other.ready is not holder.ready
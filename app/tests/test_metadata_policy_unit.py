@@ -0,0 +1,82 @@
+"""
+Unit tests for the metadata ingest limits
+"""
+import pytest
+from services.metadata_policy import MetadataPolicy, parse_hot_keys, HOT_FIELD
+
+
+class TestMetadataPolicy:
+    """Tests for MetadataPolicy"""
+
+    @pytest.fixture
+    def policy(self):
+        return MetadataPolicy(
+            mode="flattened",
+            hot_keys={"merchant_id": "keyword", "amount_cents": "long"},
+            max_keys=3,
+            max_value_bytes=8,
+        )
+
+    def test_parse_hot_keys(self):
+        """Test allow-list parsing with default keyword type"""
+        assert parse_hot_keys("merchant_id, amount_cents:long,") == {
+            "merchant_id": "keyword",
+            "amount_cents": "long",
+        }
+        with pytest.raises(ValueError):
+            parse_hot_keys("amount:money")
+
+    def test_flattened_mapping(self, policy):
+        """Test metadata is mapped as one flattened field plus typed hot keys"""
+        mapping = policy.mapping_properties()
+        assert mapping["metadata"]["type"] == "flattened"
+        assert mapping[HOT_FIELD]["dynamic"] is False
+        assert mapping[HOT_FIELD]["properties"]["amount_cents"] == {"type": "long"}
+
+    def test_object_mapping_is_dynamic(self):
+        """Test object mode maps metadata keys despite the non-dynamic root mapping"""
+        mapping = MetadataPolicy(mode="object", hot_keys={}).mapping_properties()
+        assert mapping["metadata"] == {"type": "object", "dynamic": True}
+
+    def test_key_limit(self, policy):
+        """Test keys beyond the limit are dropped and counted"""
+        metadata = {"a": 1, "b": 2, "c": 3, "d": 4, "e": 5}
+        bounded, _, dropped = policy.apply(metadata)
+        assert list(bounded) == ["a", "b", "c"]
+        assert dropped == 2
+
+    def test_value_truncation(self, policy):
+        """Test long values are truncated and nested values keep their shape in flattened mode"""
+        bounded, _, _ = policy.apply({"note": "x" * 100, "nested": {"deep": {"er": 1, "s": "y" * 20}, "l": [None, 2]}})
+        assert bounded["note"] == "x" * 8
+        assert bounded["nested"] == {"deep": {"er": 1, "s": "y" * 8}, "l": [2]}
+
+    def test_nested_values_stringified_in_object_mode(self):
+        """Test object mode stores nested values as one string so they add no sub-fields"""
+        policy = MetadataPolicy(mode="object", hot_keys={}, max_keys=3, max_value_bytes=8)
+        bounded, _, _ = policy.apply({"nested": {"deep": {"er": 1}}})
+        assert isinstance(bounded["nested"], str)
+        assert len(bounded["nested"].encode()) <= 8
+
+    def test_hot_key_promotion(self, policy):
+        """Test allow-listed keys are promoted with type coercion"""
+        _, hot, _ = policy.apply({"merchant_id": 42, "amount_cents": "1999", "other": "x"})
+        assert hot == {"merchant_id": "42", "amount_cents": 1999}
+
+    def test_uncoercible_hot_key_not_promoted(self, policy):
+        """Test values that don't fit the hot key type stay in metadata only"""
+        bounded, hot, _ = policy.apply({"amount_cents": "n/a"})
+        assert bounded == {"amount_cents": "n/a"}
+        assert hot == {}
+
+    def test_out_of_range_hot_key_not_promoted(self, policy):
+        """Test numbers a long field cannot hold are not promoted"""
+        for value in (float("inf"), 2 ** 63, {"cents": 1}):
+            bounded, hot, _ = policy.apply({"amount_cents": value})
+            assert "amount_cents" in bounded
+            assert hot == {}
+
+    def test_invalid_mode(self):
+        """Test unknown modes are rejected"""
+        with pytest.raises(ValueError):
+            MetadataPolicy(mode="dynamic")
@@ -0,0 +1,33 @@
+"""
+Unit tests for the deferred OpenTelemetry setup
+"""
+import os
+import sys
+import subprocess
+import pytest
+from unittest.mock import MagicMock
+from config.otel_config import start_telemetry
+
+
+class TestDeferredTelemetry:
+    """Tests that tracing stays off the startup path"""
+
+    def test_import_skips_sdk_and_optional_features(self):
+        """Test importing the app loads neither the OTel SDK nor unconfigured feature modules"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        deferred = ["opentelemetry.sdk", "grpc", "opentelemetry.instrumentation.fastapi",
+                    "services.syslog_listener", "services.search_jobs", "services.otlp_receiver"]
+        script = f"import sys, main; print([m for m in {deferred!r} if m in sys.modules])"
+        env = dict(os.environ, TRACING_ENABLED="true", ELASTICSEARCH_URL="fake://")
+        result = subprocess.run([sys.executable, "-c", script], cwd=app_dir, env=env,
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    @pytest.mark.asyncio
+    async def test_disabled_tracing_leaves_app_alone(self, monkeypatch):
+        """Test nothing is loaded or rebuilt when tracing is off"""
+        monkeypatch.setenv("TRACING_ENABLED", "false")
+        app = MagicMock(middleware_stack="built")
+        await start_telemetry(app)
+        assert app.middleware_stack == "built"
@@ -0,0 +1,112 @@
+"""
+Unit tests for the OTLP/HTTP logs receiver
+"""
+import gzip
+import json
+import pytest
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+from opentelemetry.proto.logs.v1.logs_pb2 import ResourceLogs, ScopeLogs, LogRecord
+from services.log_batch import LogBatch
+from services.otlp_receiver import decode_request, to_documents, severity_level, OTLPDecodeError
+
+TRACE_ID = "5b8efff798038103d269b633813fc60c"
+SPAN_ID = "eee19b7ec3c1b174"
+
+
+def _request():
+    record = LogRecord(
+        time_unix_nano=1_760_868_000_123_000_000,
+        severity_number=17,
+        severity_text="ERROR",
+        body=AnyValue(string_value="card declined"),
+        attributes=[
+            KeyValue(key="merchant_id", value=AnyValue(string_value="m-42")),
+            KeyValue(key="amount_cents", value=AnyValue(int_value=1250)),
+        ],
+        trace_id=bytes.fromhex(TRACE_ID),
+        span_id=bytes.fromhex(SPAN_ID),
+    )
+    resource_logs = ResourceLogs(scope_logs=[ScopeLogs(log_records=[record])])
+    resource_logs.resource.attributes.extend([
+        KeyValue(key="service.name", value=AnyValue(string_value="payments")),
+        KeyValue(key="deployment.environment", value=AnyValue(string_value="prod")),
+    ])
+    resource_logs.scope_logs[0].scope.name = "payments.checkout"
+    return ExportLogsServiceRequest(resource_logs=[resource_logs])
+
+
+class TestOTLPReceiver:
+    """Tests for OTLP decoding and mapping onto log documents"""
+
+    def test_protobuf_mapped_to_documents(self):
+        """Test resource and record attributes land on the LogEntry fields"""
+        request = decode_request(_request().SerializeToString(), "application/x-protobuf")
+        [doc] = to_documents(request, "corr-1")
+
+        assert doc["timestamp"] == 1_760_868_000_123
+        assert doc["level"] == "ERROR"
+        assert doc["message"] == "card declined"
+        assert doc["service"] == "payments"
+        assert doc["source"] == "payments.checkout"
+        assert (doc["trace_id"], doc["span_id"]) == (TRACE_ID, SPAN_ID)
+        assert doc["metadata"] == {"deployment.environment": "prod", "merchant_id": "m-42", "amount_cents": 1250}
+        assert doc["correlation_id"] == "corr-1"
+
+    def test_json_with_hex_ids(self):
+        """Test the OTLP/JSON form with hex trace and span ids"""
+        payload = {"resourceLogs": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "ledger"}}]},
+            "scopeLogs": [{"logRecords": [{
+                "severityText": "WARN",
+                "body": {"kvlistValue": {"values": [{"key": "retry", "value": {"intValue": "3"}}]}},
+                "traceId": TRACE_ID,
+                "spanId": SPAN_ID,
+            }]}],
+        }]}
+        request = decode_request(json.dumps(payload).encode(), "application/json; charset=utf-8")
+        [doc] = to_documents(request, "corr-2")
+
+        assert doc["level"] == "WARNING"
+        assert doc["source"] == "ledger"
+        assert json.loads(doc["message"]) == {"retry": 3}
+        assert doc["trace_id"] == TRACE_ID
+        assert "metadata" not in doc
+
+    def test_gzip_body(self):
+        """Test gzip content encoding is accepted"""
+        body = gzip.compress(_request().SerializeToString())
+        request = decode_request(body, "application/x-protobuf", "gzip")
+        assert len(to_documents(request, "corr-3")) == 1
+
+    def test_invalid_body(self):
+        """Test garbage is reported as a decode error"""
+        with pytest.raises(OTLPDecodeError):
+            decode_request(b"\xff\xff\xff", "application/x-protobuf")
+        with pytest.raises(OTLPDecodeError):
+            decode_request(b"{not json", "application/json")
+
+    def test_broken_gzip_body(self):
+        """Test truncated or corrupt gzip is reported as a decode error"""
+        body = gzip.compress(_request().SerializeToString())
+        with pytest.raises(OTLPDecodeError):
+            decode_request(body[:len(body) // 2], "application/x-protobuf", "gzip")
+        corrupt = body[:10] + bytes(byte ^ 0xff for byte in body[10:-8]) + body[-8:]
+        with pytest.raises(OTLPDecodeError):
+            decode_request(corrupt, "application/x-protobuf", "gzip")
+
+    def test_severity_mapping(self):
+        """Test severity numbers map by band and text is the fallback"""
+        assert [severity_level(n, "").value for n in (1, 5, 9, 13, 17, 21)] == \
+            ["DEBUG", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+        assert severity_level(0, "fatal").value == "CRITICAL"
+        assert severity_level(0, "").value == "INFO"
+
+    def test_documents_fit_log_batch(self):
+        """Test mapped documents go straight into a bulk batch"""
+        batch = LogBatch()
+        for doc in to_documents(_request(), "corr-4"):
+            batch.append(doc)
+        body = batch.to_bulk_body(lambda *args: "logs").decode()
+        assert '"timestamp":"2025-10-19T10:00:00.123"' in body
+        assert f'"trace_id":"{TRACE_ID}"' in body
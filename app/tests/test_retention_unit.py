@@ -0,0 +1,167 @@
+"""
+Mock-based unit tests for the retention manager and its leader lock
+"""
+import time
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+from elasticsearch import NotFoundError, ConflictError
+from services.retention import RetentionManager, LeaderLock
+
+
+def _not_found():
+    return NotFoundError("not found", MagicMock(status=404), {})
+
+
+def _conflict():
+    return ConflictError("conflict", MagicMock(status=409), {})
+
+
+class TestLeaderLock:
+    """Tests for the ES-backed leader lease"""
+
+    @pytest.mark.asyncio
+    async def test_acquire_when_free(self):
+        """Test the lease is created when nobody holds it"""
+        client = AsyncMock()
+        client.get.side_effect = _not_found()
+
+        lock = LeaderLock(client, "retention", ttl_seconds=60, holder="pod-a")
+        assert await lock.acquire() is True
+        assert client.index.call_args[1]["op_type"] == "create"
+
+    @pytest.mark.asyncio
+    async def test_live_lease_held_by_other(self):
+        """Test a live lease held by another replica is respected"""
+        client = AsyncMock()
+        client.get.return_value = {
+            "_source": {"holder": "pod-b", "expires_at": time.time() + 60},
+            "_seq_no": 1,
+            "_primary_term": 1,
+        }
+
+        lock = LeaderLock(client, "retention", ttl_seconds=60, holder="pod-a")
+        assert await lock.acquire() is False
+        client.index.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_taken_with_cas(self):
+        """Test an expired lease is taken over with a compare-and-set write"""
+        client = AsyncMock()
+        client.get.return_value = {
+            "_source": {"holder": "pod-b", "expires_at": time.time() - 1},
+            "_seq_no": 7,
+            "_primary_term": 2,
+        }
+        client.index.side_effect = _conflict()
+
+        lock = LeaderLock(client, "retention", ttl_seconds=60, holder="pod-a")
+        assert await lock.acquire() is False
+        assert client.index.call_args[1]["if_seq_no"] == 7
+
+
+class TestRetentionManager:
+    """Tests for index-level retention"""
+
+    @pytest.fixture
+    def search_engine(self):
+        engine = MagicMock()
+        engine.index_name = "logs"
+        engine.partitioned = True
+        engine.client = AsyncMock()
+        return engine
+
+    @pytest.fixture
+    def lock(self):
+        lock = MagicMock()
+        lock.acquire = AsyncMock(return_value=True)
+        return lock
+
+    @pytest.mark.asyncio
+    async def test_expired_indices_deleted(self, search_engine, lock):
+        """Test whole indices past retention are deleted and nothing is deleted by query"""
+        search_engine.client.indices.get_settings.return_value = {
+            "logs-2026.01.01": {"settings": {"index.blocks.write": "true"}},
+            "logs-payments-2026.01.01": {"settings": {}},
+            "logs-2026.10.18": {"settings": {}},
+            "logs-2026.10.19": {"settings": {}},
+            "unrelated": {"settings": {}},
+        }
+        manager = RetentionManager(search_engine, retention_days=30, seal_after_days=2, lock=lock)
+
+        actions = await manager.run_once(today=date(2026, 10, 19))
+
+        assert actions["expired"] == ["logs-2026.01.01", "logs-payments-2026.01.01"]
+        assert search_engine.client.indices.delete.call_count == 2
+        search_engine.client.delete_by_query.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_close_action(self, search_engine, lock):
+        """Test the close action skips indices that are already closed"""
+        search_engine.client.indices.get_settings.return_value = {
+            "logs-2026.01.01": {"settings": {}},
+            "logs-2026.01.02": {"settings": {"index.verified_before_close": "true"}},
+        }
+        manager = RetentionManager(search_engine, retention_days=30, action="close", lock=lock)
+
+        actions = await manager.run_once(today=date(2026, 10, 19))
+
+        assert actions["expired"] == ["logs-2026.01.01"]
+        search_engine.client.indices.close.assert_called_once_with(index="logs-2026.01.01")
+
+    @pytest.mark.asyncio
+    async def test_sealed_index_force_merged(self, search_engine, lock):
+        """Test indices no longer written to are force-merged and write-blocked"""
+        search_engine.client.indices.get_settings.return_value = {
+            "logs-2026.10.15": {"settings": {"index.number_of_shards": "1"}},
+        }
+        manager = RetentionManager(search_engine, retention_days=30, seal_after_days=2, force_merge=True, lock=lock)
+
+        actions = await manager.run_once(today=date(2026, 10, 19))
+
+        assert actions["merged"] == ["logs-2026.10.15"]
+        search_engine.client.indices.forcemerge.assert_called_once_with(index="logs-2026.10.15", max_num_segments=1)
+        search_engine.client.indices.put_settings.assert_called_once_with(
+            index="logs-2026.10.15", settings={"index.blocks.write": True}
+        )
+
+    @pytest.mark.asyncio
+    async def test_failing_index_does_not_stop_pass(self, search_engine, lock):
+        """Test an error on one index is logged and later indices are still processed"""
+        search_engine.client.indices.get_settings.return_value = {
+            "logs-2026.01.01": {"settings": {}},
+            "logs-payments-2026.01.01": {"settings": {}},
+        }
+        search_engine.client.indices.delete.side_effect = [RuntimeError("boom"), None]
+        manager = RetentionManager(search_engine, retention_days=30, lock=lock)
+
+        actions = await manager.run_once(today=date(2026, 10, 19))
+
+        assert actions["expired"] == ["logs-payments-2026.01.01"]
+        assert search_engine.client.indices.delete.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_shrink_skipped_when_target_exists(self, search_engine, lock):
+        """Test a partition recreated after its day was shrunk is not shrunk again"""
+        search_engine.client.indices.get_settings.return_value = {
+            "logs-2026.10.10": {"settings": {"index.blocks.write": "true", "index.number_of_shards": "4"}},
+        }
+        search_engine.client.indices.exists.return_value = True
+        manager = RetentionManager(search_engine, retention_days=30, seal_after_days=2, shrink_shards=1, lock=lock)
+
+        actions = await manager.run_once(today=date(2026, 10, 19))
+
+        search_engine.client.indices.exists.assert_called_once_with(index="logs-2026.10.10-shrunk")
+        search_engine.client.indices.shrink.assert_not_called()
+        search_engine.client.cat.shards.assert_not_called()
+        assert not any(actions.values())
+
+    @pytest.mark.asyncio
+    async def test_not_leader(self, search_engine, lock):
+        """Test followers do nothing"""
+        lock.acquire.return_value = False
+        manager = RetentionManager(search_engine, retention_days=30, lock=lock)
+
+        await manager.run_once(today=date(2026, 10, 19))
+
+        search_engine.client.indices.get_settings.assert_not_called()
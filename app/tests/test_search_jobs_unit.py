@@ -0,0 +1,185 @@
+"""
+Unit tests for the background search job scheduler
+"""
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from models.log_schemas import ErrorPattern, ErrorPatternsResponse, LogSearchResponse
+from services.fake_elasticsearch import FakeCluster
+from services.search_jobs import SearchJobManager, JobLimitError, DONE, FAILED, CANCELLED, JOB_INDEX
+
+
+def _pattern(text, count, day):
+    return ErrorPattern(
+        pattern=text,
+        count=count,
+        first_seen=datetime(2026, 10, day, 1),
+        last_seen=datetime(2026, 10, day, 2),
+        services=["payments"],
+    )
+
+
+@pytest.fixture
+def search_engine():
+    engine = MagicMock()
+    engine.client = FakeCluster().client()
+    engine.search_logs = AsyncMock(return_value=LogSearchResponse(logs=[], total_count=0, took_ms=1.0))
+    engine.analyze_error_patterns = AsyncMock(side_effect=[
+        ErrorPatternsResponse(patterns=[_pattern("timeout", 2, 19)]),
+        ErrorPatternsResponse(patterns=[_pattern("timeout", 3, 18), _pattern("declined", 1, 18)]),
+    ])
+    return engine
+
+
+class TestSearchJobManager:
+    """Tests for SearchJobManager"""
+
+    @pytest.mark.asyncio
+    async def test_patterns_job_merges_slices(self, search_engine):
+        """Test a long window runs slice by slice and merges the patterns"""
+        manager = SearchJobManager(search_engine, slice_hours=24)
+        job, deduplicated = await manager.submit("patterns", {"hours": 48})
+        await job.task
+
+        assert deduplicated is False
+        assert job.status == DONE
+        assert job.progress == 1.0
+        assert search_engine.analyze_error_patterns.call_count == 2
+        # Each slice fetches far more than the final top 50 before merging
+        assert search_engine.analyze_error_patterns.call_args[1]["size"] == manager.slice_patterns > 50
+        timeout = job.result[0]
+        assert (timeout.pattern, timeout.count) == ("timeout", 5)
+        assert timeout.first_seen == datetime(2026, 10, 18, 1)
+        assert timeout.last_seen == datetime(2026, 10, 19, 2)
+
+    @pytest.mark.asyncio
+    async def test_identical_running_jobs_deduplicated(self, search_engine):
+        """Test resubmitting a running query returns the same job"""
+        manager = SearchJobManager(search_engine)
+        first, _ = await manager.submit("search", {"query": "error"})
+        second, deduplicated = await manager.submit("search", {"query": "error"})
+        await first.task
+
+        assert deduplicated is True
+        assert first is second
+        search_engine.search_logs.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, search_engine):
+        """Test no more than max_concurrent jobs run at once"""
+        running = 0
+        peak = 0
+
+        async def slow_search(query, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return LogSearchResponse(logs=[], total_count=0, took_ms=1.0)
+
+        search_engine.search_logs = AsyncMock(side_effect=slow_search)
+        manager = SearchJobManager(search_engine, max_concurrent=2)
+        jobs = [(await manager.submit("search", {"query": str(i)}))[0] for i in range(5)]
+        await asyncio.gather(*[job.task for job in jobs])
+
+        assert peak == 2
+        assert all(job.status == DONE for job in jobs)
+
+    @pytest.mark.asyncio
+    async def test_pending_limit(self, search_engine):
+        """Test the queue of waiting jobs is bounded"""
+        manager = SearchJobManager(search_engine, max_concurrent=1, max_pending=2)
+        await manager.submit("search", {"query": "a"})
+        await manager.submit("search", {"query": "b"})
+        with pytest.raises(JobLimitError):
+            await manager.submit("search", {"query": "c"})
+        await manager.stop()
+
+    @pytest.mark.asyncio
+    async def test_results_expire(self, search_engine):
+        """Test finished jobs are forgotten after the result TTL"""
+        manager = SearchJobManager(search_engine, result_ttl=0)
+        job, _ = await manager.submit("search", {"query": "error"})
+        await job.task
+
+        assert await manager.get(job.id) is None
+        assert await SearchJobManager(search_engine).get(job.id) is None
+
+    @pytest.mark.asyncio
+    async def test_failed_and_cancelled_jobs(self, search_engine):
+        """Test failures are reported and cancellation stops a job"""
+        search_engine.analyze_error_patterns = AsyncMock(side_effect=RuntimeError("boom"))
+        manager = SearchJobManager(search_engine)
+        failed, _ = await manager.submit("patterns", {"hours": 24})
+        await failed.task
+        assert failed.status == FAILED
+        assert failed.error == "boom"
+
+        search_engine.search_logs = AsyncMock(side_effect=ConnectionError("es down"))
+        failed_search, _ = await manager.submit("search", {"query": "error"})
+        await failed_search.task
+        assert failed_search.status == FAILED
+        assert search_engine.search_logs.call_args[1]["raise_errors"] is True
+
+        async def hanging_search(query, **kwargs):
+            await asyncio.sleep(10)
+
+        search_engine.search_logs = AsyncMock(side_effect=hanging_search)
+        cancelled, _ = await manager.submit("search", {"query": "slow"})
+        await asyncio.sleep(0)
+        await manager.cancel(cancelled.id)
+        await asyncio.gather(cancelled.task, return_exceptions=True)
+        assert cancelled.status == CANCELLED
+
+    @pytest.mark.asyncio
+    async def test_long_poll_returns_on_update(self, search_engine):
+        """Test waiting returns as soon as the job finishes"""
+        manager = SearchJobManager(search_engine)
+        job, _ = await manager.submit("search", {"query": "error"})
+
+        await asyncio.wait_for(manager.wait(job, timeout=5), timeout=1)
+        await job.task
+        assert job.status == DONE
+
+    @pytest.mark.asyncio
+    async def test_job_visible_from_another_worker(self, search_engine):
+        """Test a worker that didn't run the job can poll it, fetch its result and cancel it"""
+        owner = SearchJobManager(search_engine, slice_hours=24)
+        other = SearchJobManager(search_engine, poll_seconds=0.01)
+        job, _ = await owner.submit("patterns", {"hours": 48})
+
+        remote = await other.get(job.id)
+        assert remote is not job
+        assert remote.kind == "patterns"
+        remote = await other.wait(remote, timeout=1)
+        await job.task
+        remote = await other.wait(remote, timeout=1)
+        remote = await other.get(job.id)
+        assert remote.status == DONE
+        assert remote.to_status().partial_result is None
+        assert remote.result[0]["pattern"] == "timeout"
+        assert remote.result[0]["count"] == 5
+
+        async def hanging_search(query, **kwargs):
+            await asyncio.sleep(10)
+
+        search_engine.search_logs = AsyncMock(side_effect=hanging_search)
+        owner.heartbeat_seconds = 0.01
+        slow, _ = await owner.submit("search", {"query": "slow"})
+        await other.cancel(slow.id)
+        await asyncio.wait_for(asyncio.gather(slow.task, return_exceptions=True), timeout=1)
+        assert slow.status == CANCELLED
+        assert (await other.get(slow.id)).status == CANCELLED
+
+    @pytest.mark.asyncio
+    async def test_job_of_dead_worker_expires(self, search_engine):
+        """Test a running job whose worker stopped renewing its lease is no longer reported"""
+        owner = SearchJobManager(search_engine)
+        job, _ = await owner.submit("search", {"query": "error"})
+        job.task.cancel()
+        job.watcher.cancel()
+        await search_engine.client.update(index=JOB_INDEX, id=job.id, doc={"status": "running", "expires_at": 0})
+
+        assert await SearchJobManager(search_engine).get(job.id) is None
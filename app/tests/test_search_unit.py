@@ -3,8 +3,11 @@ Mock-based unit tests for SearchEngine
 Shows isolation and dependency injection testing
 """
 import pytest
+from datetime import datetime, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
+from elasticsearch import NotFoundError
 from services.search_engine import SearchEngine
+from models.log_schemas import SearchQuery
 
 
 class TestSearchEngine:
@@ -14,7 +17,7 @@ class TestSearchEngine:
     def mock_es_client(self):
         """Mock Elasticsearch client"""
         mock_client = AsyncMock()
-        mock_client.indices.exists.return_value = False
+        mock_client.indices.get_mapping.side_effect = NotFoundError("index_not_found_exception", MagicMock(status=404), {})
         mock_client.indices.create = AsyncMock()
         mock_client.index = AsyncMock()
         mock_client.search = AsyncMock()
@@ -29,12 +32,43 @@ class TestSearchEngine:
         assert search_engine.es_url == "http://localhost:9200"
         assert search_engine.index_name == "logs"
     
+    @patch.dict('os.environ', {'INDEX_PARTITIONING': 'daily', 'RETENTION_SEAL_AFTER_DAYS': '0'})
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_daily_partitioning(self, mock_es_class, mock_es_client):
+        """Test daily partitions use an index template and date-suffixed write indices"""
+        mock_es_class.return_value = mock_es_client
+        
+        search_engine = SearchEngine()
+        await search_engine.initialize()
+        
+        mock_es_client.indices.create.assert_not_called()
+        assert mock_es_client.indices.put_index_template.call_args[1]['index_patterns'] == ['logs-*']
+        assert search_engine.index_for({"timestamp": "2026-10-19T10:00:00"}) == "logs-2026.10.19"
+        assert search_engine.search_index == "logs-*"
+    
+    @patch.dict('os.environ', {'INDEX_PARTITIONING': 'daily', 'RETENTION_SEAL_AFTER_DAYS': '2'})
+    @patch('services.search_engine.AsyncElasticsearch')
+    def test_late_logs_for_sealed_days_go_to_today(self, mock_es_class):
+        """Test logs for write-blocked days are written to today's partition and still found by day"""
+        search_engine = SearchEngine()
+        now = datetime.utcnow()
+        today = f"logs-{now:%Y.%m.%d}"
+
+        assert search_engine.index_for({"timestamp": (now - timedelta(days=1)).isoformat()}) == \
+            f"logs-{now - timedelta(days=1):%Y.%m.%d}"
+        assert search_engine.index_for({"timestamp": (now - timedelta(days=3)).isoformat()}) == today
+
+        week_ago = now - timedelta(days=7)
+        assert search_engine.indices_for_window(week_ago, week_ago).split(",") == \
+            [f"logs-{week_ago:%Y.%m.%d}*", f"{today}*"]
+        assert search_engine.indices_for_window(now, now) == f"{today}*"
+    
     @patch('services.search_engine.AsyncElasticsearch')
     @pytest.mark.asyncio
     async def test_index_creation(self, mock_es_class, mock_es_client):
         """Test index creation during initialization"""
         mock_es_class.return_value = mock_es_client
-        mock_es_client.indices.exists.return_value = False
         
         search_engine = SearchEngine()
         await search_engine.initialize()
@@ -43,6 +77,33 @@ class TestSearchEngine:
         call_args = mock_es_client.indices.create.call_args
         assert call_args[1]['index'] == 'logs'
     
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_wait_until_ready_backs_off(self, mock_es_class, mock_es_client):
+        """Test startup retries until the cluster reports a usable status"""
+        mock_es_class.return_value = mock_es_client
+        mock_es_client.cluster.health = AsyncMock(side_effect=[
+            ConnectionError("refused"),
+            {"status": "red"},
+            {"status": "yellow"},
+        ])
+        
+        search_engine = SearchEngine()
+        await search_engine.wait_until_ready(timeout=5, initial_delay=0.001)
+        
+        assert mock_es_client.cluster.health.call_count == 3
+    
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_wait_until_ready_times_out(self, mock_es_class, mock_es_client):
+        """Test startup gives up once the timeout passes"""
+        mock_es_class.return_value = mock_es_client
+        mock_es_client.cluster.health = AsyncMock(side_effect=ConnectionError("refused"))
+        
+        search_engine = SearchEngine()
+        with pytest.raises(RuntimeError):
+            await search_engine.wait_until_ready(timeout=0.05, initial_delay=0.001)
+    
     @patch('services.search_engine.AsyncElasticsearch')
     @pytest.mark.asyncio
     async def test_log_indexing(self, mock_es_class, mock_es_client):
@@ -65,6 +126,41 @@ class TestSearchEngine:
         assert call_args[1]['index'] == 'logs'
         assert call_args[1]['body'] == log_data
     
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_search_profile_breakdown(self, mock_es_class, mock_es_client):
+        """Test profiling separates ES took from transport and returns ES's profile"""
+        mock_es_class.return_value = mock_es_client
+        mock_es_client.search.return_value = {
+            'took': 0,
+            'hits': {'total': {'value': 1}, 'hits': [
+                {'_source': {'level': 'ERROR', 'message': 'Test error', 'source': 'test-app'}}
+            ]},
+            'profile': {'shards': []}
+        }
+        
+        search_engine = SearchEngine()
+        result = await search_engine.search_logs(SearchQuery(query="error"), profile=True, es_profile=True)
+        
+        assert mock_es_client.search.call_args[1]['profile'] is True
+        assert result.profile.es_took_ms == 0
+        assert result.profile.es_profile == {'shards': []}
+        assert result.profile.transport_ms >= 0
+        assert result.profile.total_ms >= result.profile.deserialize_ms
+    
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_search_without_profile(self, mock_es_class, mock_es_client):
+        """Test the breakdown is only returned on request"""
+        mock_es_class.return_value = mock_es_client
+        mock_es_client.search.return_value = {'took': 3, 'hits': {'total': {'value': 0}, 'hits': []}}
+        
+        search_engine = SearchEngine()
+        result = await search_engine.search_logs(SearchQuery(query="error"))
+        
+        assert 'profile' not in mock_es_client.search.call_args[1]
+        assert result.profile is None
+    
     @patch('services.search_engine.AsyncElasticsearch')
     @pytest.mark.asyncio
     async def test_search_logs(self, mock_es_class, mock_es_client):
@@ -0,0 +1,180 @@
+"""
+Unit tests for the syslog parser and the TCP/UDP listeners
+"""
+import asyncio
+import calendar
+import pytest
+from unittest.mock import MagicMock
+from services.syslog_listener import parse_syslog, SyslogServer, SyslogTCPProtocol, SyslogUDPProtocol
+
+NOW = calendar.timegm((2026, 10, 19, 12, 0, 0))
+
+
+class TestParseSyslog:
+    """Tests for parse_syslog"""
+
+    def test_rfc5424(self):
+        """Test an RFC 5424 message with structured data"""
+        doc = parse_syslog(
+            '<131>1 2026-10-19T10:00:00.123Z gw-01 gateway 4711 TXN [meta x="a]b" y="2"][ext k="v"] ﻿declined',
+            now=NOW,
+        )
+        assert doc["level"] == "ERROR"
+        assert doc["timestamp"] == calendar.timegm((2026, 10, 19, 10, 0, 0)) * 1000 + 123
+        assert (doc["source"], doc["service"], doc["message"]) == ("gw-01", "gateway", "declined")
+        assert doc["metadata"] == {
+            "facility": "local0", "procid": "4711", "msgid": "TXN",
+            "structured_data": '[meta x="a]b" y="2"][ext k="v"]',
+        }
+
+    def test_rfc5424_nil_values(self):
+        """Test nil fields are skipped"""
+        doc = parse_syslog("<14>1 - - - - - - just text", now=NOW)
+        assert doc["level"] == "INFO"
+        assert doc["source"] == "syslog"
+        assert "service" not in doc
+        assert doc["message"] == "just text"
+        assert doc["timestamp"] == NOW * 1000
+
+    def test_rfc3164(self):
+        """Test a BSD syslog line with tag and pid"""
+        doc = parse_syslog("<28>Oct 19 10:00:00 fw-2 kernel[12]: link down", now=NOW)
+        assert doc["level"] == "WARNING"
+        assert doc["timestamp"] == calendar.timegm((2026, 10, 19, 10, 0, 0)) * 1000
+        assert (doc["source"], doc["service"], doc["message"]) == ("fw-2", "kernel", "link down")
+        assert doc["metadata"] == {"facility": "daemon", "procid": "12"}
+
+    def test_rfc3164_year_rollover(self):
+        """Test a late-December timestamp read in January is last year's"""
+        new_year = calendar.timegm((2027, 1, 1, 0, 5, 0))
+        doc = parse_syslog("<13>Dec 31 23:59:00 host app: bye", now=new_year)
+        assert doc["timestamp"] == calendar.timegm((2026, 12, 31, 23, 59, 0)) * 1000
+
+    def test_plain_line(self):
+        """Test a line without a priority is kept as the message"""
+        doc = parse_syslog("payment 42 settled", default_source="raw", now=NOW)
+        assert doc == {"level": "INFO", "source": "raw", "timestamp": NOW * 1000, "message": "payment 42 settled"}
+
+    def test_out_of_range_priority_is_plain_text(self):
+        """Test a PRI above 191 is not read as a facility and severity"""
+        doc = parse_syslog("<999>hello", default_source="raw", now=NOW)
+        assert doc == {"level": "INFO", "source": "raw", "timestamp": NOW * 1000, "message": "<999>hello"}
+
+
+class TestSyslogListeners:
+    """Tests for the listeners over localhost sockets"""
+
+    @pytest.fixture
+    def ingest_queue(self):
+        queue = MagicMock()
+        queue.accepted = []
+        queue.submit = lambda doc: queue.accepted.append(doc) or True
+        queue.free_slots.return_value = 100
+        return queue
+
+    @pytest.mark.asyncio
+    async def test_tcp_newline_and_octet_counting(self, ingest_queue):
+        """Test both TCP framings, split across reads"""
+        loop = asyncio.get_running_loop()
+        tcp = await loop.create_server(
+            lambda: SyslogTCPProtocol(ingest_queue.submit, lambda: True), "127.0.0.1", 0
+        )
+        port = tcp.sockets[0].getsockname()[1]
+
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        message = b"<11>1 - host app - - - octet framed"
+        writer.write(b"<13>first line\n" + str(len(message)).encode() + b" " + message[:10])
+        await writer.drain()
+        writer.write(message[10:] + b"last without newline")
+        writer.write_eof()
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.close()
+        tcp.close()
+        await tcp.wait_closed()
+
+        assert [doc["message"] for doc in ingest_queue.accepted] == ["first line", "octet framed", "last without newline"]
+
+    @pytest.mark.asyncio
+    async def test_tcp_plain_line_starting_with_digits(self, ingest_queue):
+        """Test a plain line that starts with a number is newline framed, not octet counted"""
+        loop = asyncio.get_running_loop()
+        tcp = await loop.create_server(
+            lambda: SyslogTCPProtocol(ingest_queue.submit, lambda: True), "127.0.0.1", 0
+        )
+        port = tcp.sockets[0].getsockname()[1]
+
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"404 not found for /pay\nnext line\n")
+        writer.write_eof()
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.close()
+        tcp.close()
+        await tcp.wait_closed()
+
+        assert [doc["message"] for doc in ingest_queue.accepted] == ["404 not found for /pay", "next line"]
+
+    @pytest.mark.asyncio
+    async def test_udp_datagrams(self, ingest_queue):
+        """Test UDP messages are parsed and queued"""
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: SyslogUDPProtocol(ingest_queue.submit), local_addr=("127.0.0.1", 0)
+        )
+        port = transport.get_extra_info("sockname")[1]
+
+        sender, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=("127.0.0.1", port))
+        sender.sendto(b"<11>Oct 19 10:00:00 gw app: one\n<11>Oct 19 10:00:01 gw app: two")
+        await asyncio.sleep(0.05)
+        sender.close()
+        transport.close()
+
+        assert [doc["message"] for doc in ingest_queue.accepted] == ["one", "two"]
+
+    @pytest.mark.asyncio
+    async def test_tcp_pauses_when_buffer_full(self):
+        """Test a full buffer pauses reading and keeps the message until there is room"""
+        accepted = []
+        room = {"free": False}
+
+        def submit(doc):
+            if not room["free"]:
+                return False
+            accepted.append(doc)
+            return True
+
+        protocol = SyslogTCPProtocol(submit, lambda: room["free"], resume_delay=0.01)
+        transport = MagicMock()
+        protocol.connection_made(transport)
+
+        protocol.data_received(b"a\nb\n")
+        transport.pause_reading.assert_called_once()
+        assert accepted == []
+
+        room["free"] = True
+        await asyncio.sleep(0.05)
+        transport.resume_reading.assert_called_once()
+        assert [doc["message"] for doc in accepted] == ["a", "b"]
+
+    def test_tcp_skips_only_oversized_frames(self, ingest_queue):
+        """Test an oversized frame is dropped without losing the messages around it"""
+        protocol = SyslogTCPProtocol(ingest_queue.submit, lambda: True, max_message_bytes=16)
+        protocol.connection_made(MagicMock())
+
+        oversized = b"<13>" + b"x" * 40
+        protocol.data_received(b"<13>before\n" + str(len(oversized)).encode() + b" " + oversized[:20])
+        protocol.data_received(oversized[20:] + b"9 <13>after")
+        protocol.data_received(b"y" * 20)
+        protocol.data_received(b"y" * 20 + b"\n<13>last\n")
+
+        assert [doc["message"] for doc in ingest_queue.accepted] == ["before", "after", "last"]
+        assert protocol.buffer == bytearray()
+
+    @pytest.mark.asyncio
+    async def test_server_disabled_by_default(self, ingest_queue):
+        """Test no sockets are opened unless a port is configured"""
+        server = SyslogServer(ingest_queue, tcp_port=0, udp_port=0)
+        await server.start()
+        assert server.tcp_sockets == []
+        await server.stop()
@@ -0,0 +1,118 @@
+"""
+Unit tests for trace-centric log lookups
+"""
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from models.log_schemas import TraceLogsResponse
+from services.log_batch import LogBatch
+from services.search_engine import SearchEngine
+from services.trace_lookup import TTLCache, TraceLookup
+
+
+def _hit(timestamp, span_id, message):
+    return {"_source": {
+        "timestamp": timestamp, "level": "INFO", "message": message, "source": "api",
+        "trace_id": "t1", "span_id": span_id,
+    }}
+
+
+class TestTTLCache:
+    """Tests for TTLCache"""
+
+    def test_entries_expire(self):
+        """Test entries are dropped once their TTL passes"""
+        cache = TTLCache(max_entries=10, ttl=30)
+        cache.put("a", 1, now=0)
+        assert cache.get("a", now=29) == 1
+        assert cache.get("a", now=30) is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_evicted(self):
+        """Test the oldest unused entry goes first when full"""
+        cache = TTLCache(max_entries=2, ttl=30)
+        cache.put("a", 1, now=0)
+        cache.put("b", 2, now=0)
+        cache.get("a", now=1)
+        cache.put("c", 3, now=2)
+        assert cache.get("b", now=3) is None
+        assert cache.get("a", now=3) == 1
+
+
+class TestTraceLookup:
+    """Tests for the cached lookup service"""
+
+    @pytest.mark.asyncio
+    async def test_repeat_lookups_served_from_cache(self):
+        """Test only misses reach Elasticsearch and answers keep the requested order"""
+        engine = MagicMock()
+        engine.trace_logs = AsyncMock(side_effect=lambda ids, start, end: {
+            trace_id: TraceLogsResponse(trace_id=trace_id, total_count=0, spans=[]) for trace_id in ids
+        })
+        lookup = TraceLookup(engine, cache_size=10, cache_ttl=30)
+
+        first = await lookup.get("t1")
+        results = await lookup.get_many(["t2", "t1", "t2"])
+
+        assert first.cached is False
+        assert [(r.trace_id, r.cached) for r in results] == [("t2", False), ("t1", True)]
+        assert engine.trace_logs.call_args_list[1].args[0] == ["t2"]
+
+
+class TestTraceSearch:
+    """Tests for SearchEngine.trace_logs"""
+
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_grouped_by_span_in_time_order(self, mock_es_class):
+        """Test logs come back grouped by span, spans ordered by their first log"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        mock_client.msearch.return_value = {"responses": [{"hits": {"total": {"value": 4}, "hits": [
+            _hit("2026-10-19T10:00:00", "root", "start"),
+            _hit("2026-10-19T10:00:01", "db", "query"),
+            _hit("2026-10-19T10:00:02", "root", "done"),
+        ]}}]}
+
+        search_engine = SearchEngine()
+        result = (await search_engine.trace_logs(["t1"]))["t1"]
+
+        assert [(s.span_id, [log.message for log in s.logs]) for s in result.spans] == \
+            [("root", ["start", "done"]), ("db", ["query"])]
+        assert result.truncated is True
+        body = mock_client.msearch.call_args[1]["searches"][1]
+        assert body["query"]["bool"]["filter"][0] == {"term": {"trace_id": "t1"}}
+        assert body["sort"] == [{"timestamp": {"order": "asc"}}]
+
+    @patch.dict('os.environ', {'INDEX_PARTITIONING': 'daily', 'RETENTION_SEAL_AFTER_DAYS': '0', 'TRACE_ROUTING': 'true'})
+    @patch('services.search_engine.AsyncElasticsearch')
+    @pytest.mark.asyncio
+    async def test_window_hint_narrows_indices_and_routes(self, mock_es_class):
+        """Test a time hint limits the search to the partitions it touches, routed by trace"""
+        mock_client = AsyncMock()
+        mock_es_class.return_value = mock_client
+        empty = {"hits": {"total": {"value": 0}, "hits": []}}
+        mock_client.msearch.return_value = {"responses": [empty, empty]}
+
+        search_engine = SearchEngine()
+        await search_engine.trace_logs(["t1", "t2"], start_time=datetime(2026, 10, 19, 0, 2))
+
+        searches = mock_client.msearch.call_args[1]["searches"]
+        assert searches[0]["index"] == "logs-2026.10.18*,logs-2026.10.19*"
+        assert [searches[0]["routing"], searches[2]["routing"]] == ["t1", "t2"]
+        window = searches[1]["query"]["bool"]["filter"][1]["range"]["timestamp"]
+        assert window == {"gte": "2026-10-18T23:57:00", "lte": "2026-10-19T00:07:00"}
+
+    def test_bulk_routed_by_trace(self):
+        """Test bulk actions carry the trace id as routing only when asked"""
+        batch = LogBatch()
+        batch.append({"level": "INFO", "message": "a", "source": "api", "trace_id": "abc"})
+        batch.append({"level": "INFO", "message": "b", "source": "api"})
+
+        routed = [json.loads(line) for line in batch.to_bulk_body(lambda *args: "logs", route_by_trace=True).splitlines()]
+        plain = [json.loads(line) for line in batch.to_bulk_body(lambda *args: "logs").splitlines()]
+
+        assert routed[0] == {"index": {"_index": "logs", "routing": "abc"}}
+        assert routed[2] == {"index": {"_index": "logs"}}
+        assert plain[0] == {"index": {"_index": "logs"}}
@@ -89,6 +89,16 @@ Container environment variables helper
 {{- end }}
 {{- end }}
 
+{{/*
+Value of one deployment.containerEnv entry by name: include "pay-log-aggregator.containerEnvValue" (list . "NAME")
+*/}}
+{{- define "pay-log-aggregator.containerEnvValue" -}}
+{{- $name := index . 1 }}
+{{- range (index . 0).Values.deployment.containerEnv }}
+{{- if eq .name $name }}{{ .value }}{{ end }}
+{{- end }}
+{{- end }}
+
 {{/*
 Container environment variables from secrets helper
 */}}